@@ -0,0 +1,166 @@
+import threading
+
+from seatmap import LAYOUT, SeatBitmap
+
+
+class FreeRunIndex:
+    # Free seats of one show as maximal runs per row: runs[row] is a list of
+    # (start_col, length). Changes only rebuild the rows they touch, and rows
+    # whose longest run is too short are skipped without looking inside.
+    # Runs also end at an aisle, so a block never straddles one.
+    def __init__(self, bitmap=None, rows=LAYOUT.rows, cols=LAYOUT.cols, aisles=LAYOUT.aisles):
+        self.rows = rows
+        self.cols = cols
+        self.aisles = aisles
+        if bitmap is None:
+            bitmap = SeatBitmap(rows * cols)
+        self.snapshot = bitmap.to_bytes()
+        self.runs = [self._row_runs(bitmap, row) for row in range(rows)]
+        self.longest = [max((length for _, length in runs), default=0) for runs in self.runs]
+
+    def _row_runs(self, bitmap, row):
+        runs = []
+        start = None
+        base = row * self.cols
+        for col in range(self.cols):
+            if bitmap.test(base + col):
+                if start is not None:
+                    runs.append((start, col - start))
+                    start = None
+            elif start is None:
+                start = col
+            if col + 1 in self.aisles and start is not None:
+                runs.append((start, col + 1 - start))
+                start = None
+        if start is not None:
+            runs.append((start, self.cols - start))
+        return runs
+
+    def _rebuild_rows(self, bitmap, rows):
+        for row in rows:
+            self.runs[row] = self._row_runs(bitmap, row)
+            self.longest[row] = max((length for _, length in self.runs[row]), default=0)
+
+    def update(self, bitmap, indices):
+        # Incremental update after seats were booked or released
+        self._rebuild_rows(bitmap, {index // self.cols for index in indices})
+        self.snapshot = bitmap.to_bytes()
+
+    def sync(self, bitmap):
+        # Catch up with a newer seat map by diffing it against the last one seen
+        data = bitmap.to_bytes()
+        if data == self.snapshot:
+            return
+        changed = set()
+        for byte_index, (old, new) in enumerate(zip(self.snapshot, data)):
+            diff = old ^ new
+            while diff:
+                low = diff & -diff
+                index = (byte_index << 3) + low.bit_length() - 1
+                if index < self.rows * self.cols:
+                    changed.add(index // self.cols)
+                diff ^= low
+        self._rebuild_rows(bitmap, changed)
+        self.snapshot = data
+
+    def free_count(self):
+        return sum(length for runs in self.runs for _, length in runs)
+
+    def _candidate_runs(self, blocked_by_row, minimum, rows=None):
+        # rows: (first, last) to search, e.g. the zone a seat class sells
+        first, last = rows or (0, self.rows - 1)
+        for row in range(first, last + 1):
+            if self.longest[row] < minimum:
+                continue
+            blocked = blocked_by_row.get(row)
+            for start, length in self.runs[row]:
+                if not blocked:
+                    yield row, start, length
+                    continue
+                # Split the run around seats held by other customers
+                for col in sorted(col for col in blocked if start <= col < start + length):
+                    if col > start:
+                        yield row, start, col - start
+                    length -= col + 1 - start
+                    start = col + 1
+                if length > 0:
+                    yield row, start, length
+
+    def _place(self, row, start, length, count):
+        # Most central `count` seats inside a run, and how good that spot is
+        centre_col = (self.cols - 1) / 2
+        centre_row = (self.rows - 1) / 2
+        ideal = round(centre_col - (count - 1) / 2)
+        begin = min(max(ideal, start), start + length - count)
+        score = 2 * abs(row - centre_row) + abs(begin + (count - 1) / 2 - centre_col)
+        return score, begin
+
+    def best_block(self, count, blocked=(), rows=None):
+        blocked_by_row = group_by_row(blocked, self.cols)
+        best = None
+        for row, start, length in self._candidate_runs(blocked_by_row, count, rows):
+            if length < count:
+                continue
+            score, begin = self._place(row, start, length, count)
+            if best is None or score < best[0]:
+                best = (score, row, begin)
+        if best is None:
+            return None
+        _, row, begin = best
+        return [row * self.cols + col for col in range(begin, begin + count)]
+
+    def best_split(self, count, blocked=(), rows=None):
+        # Fewest pieces: take the longest runs first, most central first on ties
+        pieces = []
+        for row, start, length in self._candidate_runs(group_by_row(blocked, self.cols), 1, rows):
+            score, _ = self._place(row, start, length, min(count, length))
+            pieces.append((-length, score, row, start))
+        pieces.sort()
+        seats = []
+        for negative_length, _, row, start in pieces:
+            take = min(-negative_length, count - len(seats))
+            _, begin = self._place(row, start, -negative_length, take)
+            seats.extend(row * self.cols + col for col in range(begin, begin + take))
+            if len(seats) == count:
+                return seats
+        return None
+
+    def allocate(self, count, blocked=(), rows=None):
+        if count <= 0:
+            return None
+        return self.best_block(count, blocked, rows) or self.best_split(count, blocked, rows)
+
+
+def group_by_row(indices, cols):
+    rows = {}
+    for index in indices:
+        rows.setdefault(index // cols, set()).add(index % cols)
+    return rows
+
+
+class SeatAllocator:
+    # One FreeRunIndex per show, kept in step with the seat maps it is given
+    def __init__(self, max_shows=1024):
+        self.max_shows = max_shows
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, show, bitmap):
+        index = self._indexes.get(show)
+        if index is None:
+            if len(self._indexes) >= self.max_shows:
+                self._indexes.pop(next(iter(self._indexes)))
+            index = self._indexes[show] = FreeRunIndex(bitmap)
+        else:
+            index.sync(bitmap)
+        return index
+
+    def allocate(self, show, bitmap, count, blocked=(), rows=None):
+        with self._lock:
+            return self._index(show, bitmap).allocate(count, blocked, rows)
+
+    def update(self, show, bitmap, indices):
+        with self._lock:
+            index = self._indexes.get(show)
+            if index is not None:
+                index.update(bitmap, indices)
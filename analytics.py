@@ -0,0 +1,203 @@
+import datetime
+
+import numpy as np
+
+from seatmap import ROWS, COLS, CAPACITY, LAYOUT
+from service import SEAT_CLASSES, SEAT_CLASS_NAMES, PRICES
+
+CLASSES = list(SEAT_CLASSES.values())
+MAP_BYTES = (CAPACITY + 7) // 8
+# Seats each class can sell, given the rows its zone covers in the hall
+CLASS_CAPACITY = np.array([(last - first + 1) * COLS for first, last in map(LAYOUT.zone_rows, CLASSES)],
+                          dtype=np.int64)
+
+
+def unpack_seat_maps(blobs):
+    # Seat bitmaps -> (shows x seats) bool matrix; bit i of byte j is seat 8j+i
+    if not blobs:
+        return np.zeros((0, CAPACITY), dtype=bool)
+    packed = np.frombuffer(b''.join(bytes(blob or b'')[:MAP_BYTES].ljust(MAP_BYTES, b'\0') for blob in blobs),
+                           dtype=np.uint8).reshape(len(blobs), MAP_BYTES)
+    return np.unpackbits(packed, axis=1, bitorder='little')[:, :CAPACITY].astype(bool)
+
+
+def show_catalog(db):
+    # mname -> (movie title, prices by seat class) from the show schedule
+    rows = db.fetch_all("SELECT mname, movie, price_non_ac, price_ac, price_firstclass FROM shows") or []
+    return {row[0]: (row[1], dict(zip(CLASSES, row[2:5]))) for row in rows}
+
+
+def show_rows(db, tables, where, params):
+    rows = []
+    for table in tables:
+        for mname, date, seat_map in db.fetch_all(f"SELECT mname, Date, seat_map FROM {table} WHERE {where}", params) or []:
+            rows.append((date, table, mname, seat_map))
+    return rows
+
+
+def summarise(rows, catalog):
+    # (date, seat_class, mname, seat_map) -> daily_show_stats rows
+    seats = unpack_seat_maps([row[3] for row in rows])
+    booked = seats.sum(axis=1)
+    stats = []
+    for (date, seat_class, mname, seat_map), count in zip(rows, booked.tolist()):
+        movie, prices = catalog.get(mname, (mname, {}))
+        price = prices.get(seat_class) or PRICES[seat_class]
+        stats.append((date, seat_class, mname, movie, count, count * price, seat_map))
+    return stats
+
+
+def aggregate_days(db, today=None):
+    # Rolls every finished day not yet in daily_show_stats into it. Past
+    # shows no longer change, so each day is summarised exactly once.
+    today = today or datetime.date.today()
+    row = db.fetch_one("SELECT MAX(Date) FROM daily_show_stats", primary=True)
+    if row is None:
+        raise RuntimeError("daily_show_stats is missing, run migrate.py")
+    last = row[0] or datetime.date.min
+    rows = show_rows(db, CLASSES, "Date > %s AND Date < %s", (last, today))
+    if not rows:
+        return 0
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO daily_show_stats (Date, seat_class, mname, movie, booked, revenue, seat_map) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            summarise(rows, show_catalog(db)))
+    return len(rows)
+
+
+class ShowTable:
+    # Column arrays, one entry per show per day
+    def __init__(self, stats=(), movies=None):
+        self.movies = movies if movies is not None else []
+        codes = {movie: code for code, movie in enumerate(self.movies)}
+        for stat in stats:
+            if stat[3] not in codes:
+                codes[stat[3]] = len(self.movies)
+                self.movies.append(stat[3])
+        self.dates = np.array([stat[0] for stat in stats], dtype='datetime64[D]')
+        self.classes = np.array([CLASSES.index(stat[1]) for stat in stats], dtype=np.int8)
+        self.movie_codes = np.array([codes[stat[3]] for stat in stats], dtype=np.int32)
+        self.booked = np.array([stat[4] for stat in stats], dtype=np.int64)
+        self.revenue = np.array([stat[5] for stat in stats], dtype=np.int64)
+        self.seats = unpack_seat_maps([stat[6] for stat in stats])
+
+    def extend(self, other):
+        self.dates = np.concatenate([self.dates, other.dates])
+        self.classes = np.concatenate([self.classes, other.classes])
+        self.movie_codes = np.concatenate([self.movie_codes, other.movie_codes])
+        self.booked = np.concatenate([self.booked, other.booked])
+        self.revenue = np.concatenate([self.revenue, other.revenue])
+        self.seats = np.concatenate([self.seats, other.seats])
+
+    def select(self, mask):
+        selected = ShowTable(movies=self.movies)
+        selected.dates = self.dates[mask]
+        selected.classes = self.classes[mask]
+        selected.movie_codes = self.movie_codes[mask]
+        selected.booked = self.booked[mask]
+        selected.revenue = self.revenue[mask]
+        selected.seats = self.seats[mask]
+        return selected
+
+
+class Analytics:
+    # Finished days come from daily_show_stats and are loaded once, then
+    # kept in memory; only newer days and the live shows (today onwards)
+    # are read again on refresh.
+    def __init__(self, db):
+        self.db = db
+        self.history = ShowTable()
+        self.live = ShowTable(movies=self.history.movies)
+        self.loaded_until = datetime.date.min
+
+    def refresh(self):
+        today = datetime.date.today()
+        aggregate_days(self.db, today)
+        stats = self.db.fetch_all(
+            "SELECT Date, seat_class, mname, movie, booked, revenue, seat_map FROM daily_show_stats WHERE Date > %s ORDER BY Date",
+            (self.loaded_until,)) or []
+        if stats:
+            self.history.extend(ShowTable(stats, self.history.movies))
+            self.loaded_until = stats[-1][0]
+        live = show_rows(self.db, CLASSES, "Date >= %s", (today,))
+        self.live = ShowTable(summarise(live, show_catalog(self.db)), self.history.movies)
+
+    def shows(self, start, end):
+        table = ShowTable(movies=self.history.movies)
+        table.extend(self.history)
+        table.extend(self.live)
+        return table.select((table.dates >= np.datetime64(start)) & (table.dates <= np.datetime64(end)))
+
+    # Reports over [start, end]. Only shows with at least one seat sold have
+    # an inventory row, so occupancy is measured over those shows, each
+    # against the seats its class may sell.
+
+    def occupancy_by_day(self, start, end):
+        table = self.shows(start, end)
+        days, index = np.unique(table.dates, return_inverse=True)
+        booked = np.bincount(index, weights=table.booked, minlength=len(days))
+        capacity = np.bincount(index, weights=CLASS_CAPACITY[table.classes], minlength=len(days))
+        return days, booked / capacity
+
+    def revenue_by_class(self, start, end):
+        table = self.shows(start, end)
+        revenue = np.bincount(table.classes, weights=table.revenue, minlength=len(CLASSES))
+        return dict(zip(CLASSES, revenue.astype(np.int64).tolist()))
+
+    def heatmap(self, start, end, seat_class=None):
+        # How often each seat was sold, laid out like the hall
+        table = self.shows(start, end)
+        if seat_class is not None:
+            table = table.select(table.classes == CLASSES.index(seat_class))
+        return table.seats.sum(axis=0).reshape(ROWS, COLS)
+
+    def movie_trends(self, start, end):
+        # Seats sold per movie per day: (movies, days, movies x days matrix)
+        table = self.shows(start, end)
+        days, day_index = np.unique(table.dates, return_inverse=True)
+        movie_codes, movie_index = np.unique(table.movie_codes, return_inverse=True)
+        trends = np.zeros((len(movie_codes), len(days)), dtype=np.int64)
+        np.add.at(trends, (movie_index, day_index), table.booked)
+        return [self.history.movies[code] for code in movie_codes], days, trends
+
+
+def print_report(analytics, start, end):
+    analytics.refresh()
+    print(f"\n**** REPORT {start} TO {end} ****")
+
+    days, occupancy = analytics.occupancy_by_day(start, end)
+    if not len(days):
+        print("No bookings in this period")
+        return
+    print("\nOccupancy per day:")
+    for day, rate in zip(days, occupancy):
+        print(f"  {day}  {rate * 100:5.1f}%")
+
+    print("\nRevenue by seat class:")
+    revenue = analytics.revenue_by_class(start, end)
+    for seat_class, amount in revenue.items():
+        print(f"  {SEAT_CLASS_NAMES[seat_class]:<12}{amount:>10} Rs")
+    print(f"  {'Total':<12}{sum(revenue.values()):>10} Rs")
+
+    print("\nSeats sold per movie:")
+    movies, _, trends = analytics.movie_trends(start, end)
+    for movie, daily in sorted(zip(movies, trends.tolist()), key=lambda item: -sum(item[1])):
+        print(f"  {sum(daily):>6}  {movie}  (per day: {', '.join(str(count) for count in daily)})")
+
+    print("\nMost popular seats (times sold):")
+    heatmap = analytics.heatmap(start, end)
+    print("     " + "".join(f"{col + 1:>4}" for col in range(COLS)))
+    for row in range(ROWS):
+        print(f"  {row + 1:>2} " + "".join(f"{count:>4}" for count in heatmap[row]))
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import DatabaseConnection
+
+    parser = argparse.ArgumentParser(description="Occupancy and revenue report")
+    parser.add_argument('--start', type=datetime.date.fromisoformat,
+                        default=datetime.date.today() - datetime.timedelta(days=30))
+    parser.add_argument('--end', type=datetime.date.fromisoformat, default=datetime.date.today())
+    args = parser.parse_args()
+    print_report(Analytics(DatabaseConnection()), args.start, args.end)
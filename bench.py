@@ -0,0 +1,349 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import load_config
+from database import ConnectionPool, DatabaseConnection, SQLiteBackend, create_pool
+from journal import JournaledBookingEngine
+from sharded import ShardedBookingEngine
+from migrate import migrate
+from seatmap import CAPACITY, index_label
+from service import BookingService, SEAT_CLASSES
+
+# Shows and accounts of their own, so a run against a real database only
+# ever touches rows it created
+MOVIES = [f"BENCH SHOW {number}" for number in range(1, 6)]
+
+BENCH_PASSWORD = "bench"
+
+# How long cancel-storm bookers keep waiting for seats to be freed
+STORM_TIMEOUT = 10.0
+
+
+def user_name(number):
+    return f"bench{number}"
+
+
+def user_phone(number):
+    return f"9{number:09d}"
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    rank = max(1, int(round(fraction * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Recorder:
+    # Latencies and outcomes per operation, shared by all simulated users
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.bookings = 0
+        self.conflicts = 0
+        self.retries = 0
+        self.contention_failures = 0
+        self._lock = threading.Lock()
+
+    def timed(self, operation, func, *args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self._add(operation, time.perf_counter() - start, failed=True)
+            raise
+        self._add(operation, time.perf_counter() - start)
+        return result
+
+    def _add(self, operation, elapsed, failed=False):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def booking(self, result):
+        with self._lock:
+            self.bookings += 1
+            self.retries += max(result.attempts - 1, 0)
+            if result.conflicts:
+                self.conflicts += 1
+            elif result.error:
+                self.contention_failures += 1
+
+    def report(self, elapsed):
+        operations = {}
+        total = 0
+        for operation, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            total += len(ordered)
+            operations[operation] = {
+                'count': len(ordered),
+                'errors': self.errors.get(operation, 0),
+                'throughput': len(ordered) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(ordered, 0.50) * 1000,
+                'p95_ms': percentile(ordered, 0.95) * 1000,
+                'p99_ms': percentile(ordered, 0.99) * 1000,
+                'max_ms': ordered[-1] * 1000,
+            }
+        return {
+            'elapsed_s': elapsed,
+            'operations': total,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'bookings': self.bookings,
+            'conflict_rate': self.conflicts / self.bookings if self.bookings else 0.0,
+            'retries_per_booking': self.retries / self.bookings if self.bookings else 0.0,
+            'contention_failures': self.contention_failures,
+            'by_operation': operations,
+        }
+
+
+def pick_free(service, show, rng, count):
+    booked = service.seat_map(*show)
+    free = [index for index in range(CAPACITY) if not booked.test(index)]
+    if not free:
+        return []
+    return [index_label(index) for index in rng.sample(free, min(count, len(free)))]
+
+
+def book_random(service, recorder, show, rng, number):
+    seats = pick_free(service, show, rng, rng.randint(1, 4))
+    if not seats:
+        return None
+    result = recorder.timed('book', service.book, *show, seats, user_phone(number), 'M', len(seats))
+    recorder.booking(result)
+    return result
+
+
+def rush_user(service, recorder, number, ops, rng):
+    # Everyone goes for the same show the moment bookings open
+    show = ('ac', MOVIES[2], datetime.date.today())
+    recorder.timed('sign_in', service.sign_in, user_name(number), BENCH_PASSWORD)
+    for _ in range(ops):
+        if book_random(service, recorder, show, rng, number) is None:
+            break
+    recorder.timed('check', service.check, user_phone(number))
+
+
+def spread_user(service, recorder, number, ops, rng):
+    # Traffic across every movie, class and bookable day
+    recorder.timed('sign_in', service.sign_in, user_name(number), BENCH_PASSWORD)
+    today = datetime.date.today()
+    for _ in range(ops):
+        show = (rng.choice(list(SEAT_CLASSES.values())), rng.choice(MOVIES),
+                today + datetime.timedelta(days=rng.randint(0, 4)))
+        result = book_random(service, recorder, show, rng, number)
+        tickets = recorder.timed('check', service.check, user_phone(number))
+        if result is not None and result.ok and tickets and rng.random() < 0.2:
+            recorder.timed('cancel', service.cancel_booking, result.booking_id, user_phone(number))
+
+
+class CancelStorm:
+    # The show being stormed, and when its cancellers have all finished
+    def __init__(self, show, cancellers):
+        self.show = show
+        self.cancellers = cancellers
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        if not cancellers:
+            self.finished.set()
+
+    def canceller_done(self):
+        with self._lock:
+            self.cancellers -= 1
+            if not self.cancellers:
+                self.finished.set()
+
+
+def cancel_storm_setup(service, users):
+    # Fill one show with bookings spread over all users before the storm
+    show = ('non_ac', MOVIES[0], datetime.date.today())
+    per_user = max(1, CAPACITY // users)
+    index = 0
+    for number in range(users):
+        seats = [index_label(seat) for seat in range(index, min(index + per_user, CAPACITY))]
+        index += per_user
+        if seats:
+            service.book(*show, seats, user_phone(number), 'F', len(seats))
+    return CancelStorm(show, (users + 1) // 2)
+
+
+def cancel_storm_user(service, recorder, number, ops, rng, storm):
+    # Half the users cancel everything they hold while the rest try to
+    # grab the seats being freed on the same show. The hall starts full, so
+    # bookers keep polling until they have made `ops` bookings, or the hall
+    # is full again with every canceller done.
+    recorder.timed('sign_in', service.sign_in, user_name(number), BENCH_PASSWORD)
+    if number % 2 == 0:
+        try:
+            for ticket in recorder.timed('check', service.check, user_phone(number)):
+                recorder.timed('cancel', service.cancel_booking, ticket['booking_id'], user_phone(number))
+        finally:
+            storm.canceller_done()
+    else:
+        booked = 0
+        deadline = time.monotonic() + STORM_TIMEOUT
+        while booked < ops and time.monotonic() < deadline:
+            finished = storm.finished.is_set()
+            result = book_random(service, recorder, storm.show, rng, number)
+            if result is None:
+                if finished:
+                    break
+                time.sleep(0.005)
+            elif result.ok:
+                booked += 1
+
+
+SCENARIOS = ['rush', 'spread', 'cancel-storm']
+
+
+def open_database(args, directory):
+    if args.database == 'config':
+        config = load_config()
+        config['pool']['max_size'] = str(max(args.users, config['pool'].getint('max_size')))
+        db = DatabaseConnection(create_pool(config))
+    else:
+        pool = ConnectionPool(SQLiteBackend(os.path.join(directory, 'bench.db')), max_size=args.users)
+        db = DatabaseConnection(pool)
+    # Keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        migrate(db)
+    movies = ', '.join(['%s'] * len(MOVIES))
+    with db.transaction() as cursor:
+        # Daily shows selling every class, so bookings pass the schedule check
+        cursor.execute(f"DELETE FROM shows WHERE mname IN ({movies})", MOVIES)
+        cursor.execute("SELECT COALESCE(MAX(revision), 0) + 1 FROM shows")
+        revision = cursor.fetchone()[0]
+        cursor.executemany(
+            "INSERT INTO shows (mname, movie, screen, Date, start_time, end_time, price_non_ac, price_ac, price_firstclass, cancelled, revision) "
+            "VALUES (%s, %s, %s, NULL, '00:00', '23:59', 200, 400, 700, 0, %s)",
+            [(movie, movie, f"Bench {number}", revision) for number, movie in enumerate(MOVIES, 1)])
+        cursor.execute(f"DELETE FROM bookings WHERE mname IN ({movies})", MOVIES)
+        for table in SEAT_CLASSES.values():
+            cursor.execute(f"DELETE FROM {table} WHERE mname IN ({movies})", MOVIES)
+        cursor.executemany("DELETE FROM user_accounts WHERE user_name = %s",
+                           [(user_name(number),) for number in range(args.users)])
+        cursor.executemany(
+            "INSERT INTO user_accounts (fname, lname, user_name, password, phno, gender, dob, age) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            [("Bench", str(number), user_name(number), BENCH_PASSWORD, user_phone(number), 'M', '2000-01-01', 25)
+             for number in range(args.users)])
+    return db
+
+
+def run_scenario(name, args):
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(args, directory)
+        engine = None
+        if args.shards:
+            database = {} if args.database == 'config' else {'backend': 'sqlite', 'sqlite_path': os.path.join(directory, 'bench.db')}
+            engine = ShardedBookingEngine(db, os.path.join(directory, 'bench.journal'), args.shards, database=database)
+        elif args.journal:
+            engine = JournaledBookingEngine(db, os.path.join(directory, 'bench.journal'))
+        service = BookingService(db=db, engine=engine)
+        recorder = Recorder()
+        extra = ()
+        if name == 'rush':
+            user = rush_user
+        elif name == 'spread':
+            user = spread_user
+        else:
+            user = cancel_storm_user
+            extra = (cancel_storm_setup(service, args.users),)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            futures = [executor.submit(user, service, recorder, number, args.ops,
+                                       random.Random(args.seed + number), *extra)
+                       for number in range(args.users)]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        report = recorder.report(elapsed)
+        report['cache'] = service.cache_stats()
+        if engine is not None:
+            engine.close()
+        db.pool.close()
+        return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline):
+    # Relative change per scenario; positive throughput and negative
+    # latency changes are improvements
+    changes = {}
+    for name, report in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            'throughput': report['throughput'] / before['throughput'] - 1 if before['throughput'] else None,
+        }
+        for operation, stats in report['by_operation'].items():
+            old = before['by_operation'].get(operation)
+            if old and old['p95_ms']:
+                changes[name][f"{operation}_p95"] = stats['p95_ms'] / old['p95_ms'] - 1
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the booking service with simulated concurrent users")
+    parser.add_argument('--scenario', choices=SCENARIOS + ['all'], default='all')
+    parser.add_argument('--users', type=int, default=20, help="concurrent simulated users")
+    parser.add_argument('--ops', type=int, default=5, help="booking attempts per user")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', choices=['sqlite', 'config'], default='sqlite',
+                        help="a throwaway SQLite file, or the database from mtb.ini (earlier bench rows are cleared first)")
+    parser.add_argument('--journal', action='store_true', help="book through the group-commit journal")
+    parser.add_argument('--shards', type=int, default=0, help="book through this many sharded worker processes")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    scenarios = SCENARIOS if args.scenario == 'all' else [args.scenario]
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'database': args.database,
+        'journal': args.journal,
+        'shards': args.shards,
+        'users': args.users,
+        'ops': args.ops,
+        'seed': args.seed,
+        'scenarios': {},
+    }
+    for name in scenarios:
+        print(f"Running {name} with {args.users} users", file=sys.stderr)
+        report['scenarios'][name] = run_scenario(name, args)
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['compared_to'] = compare(report, json.load(file))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
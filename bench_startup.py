@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the terminal menu must not load before someone books
+DEFERRED = ['tkinter', 'qrcode', 'PIL', 'mysql.connector', 'numpy', 'multiprocessing']
+
+FIRST_PROMPT = b'ENTER YOUR CHOICE'
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import MTB
+elapsed = time.perf_counter() - start
+print(json.dumps({{'import_s': elapsed, 'loaded': [name for name in {DEFERRED!r} if name in sys.modules]}}))
+"""
+
+
+def time_import():
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=HERE, capture_output=True, check=True).stdout
+    return json.loads(output)
+
+
+def time_interpreter():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def time_first_prompt(timeout):
+    # From starting MTB.py to its main menu asking for a choice
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-u', 'MTB.py'], cwd=HERE, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    seen = b''
+    try:
+        while FIRST_PROMPT not in seen:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                raise RuntimeError(f"MTB.py exited before its menu:\n{seen.decode(errors='replace')}")
+            seen += chunk
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError("MTB.py did not show its menu in time")
+        elapsed = time.perf_counter() - start
+        process.communicate(b'5\n', timeout=timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    return elapsed
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how quickly MTB.py reaches its first prompt")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=300.0,
+                        help="fail if the median time to the first prompt is above this")
+    parser.add_argument('--import-budget-ms', type=float, default=100.0,
+                        help="fail if the median time to import MTB is above this")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    interpreter, imports, prompts, loaded = [], [], [], set()
+    for _ in range(args.runs):
+        interpreter.append(time_interpreter())
+        probe = time_import()
+        imports.append(probe['import_s'])
+        loaded.update(probe['loaded'])
+        prompts.append(time_first_prompt(args.timeout))
+
+    report = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'interpreter_ms': ms(statistics.median(interpreter)),
+        'import_ms': {'median': ms(statistics.median(imports)), 'max': ms(max(imports))},
+        'first_prompt_ms': {'median': ms(statistics.median(prompts)), 'max': ms(max(prompts))},
+        'deferred_modules_loaded': sorted(loaded),
+        'budget_ms': args.budget_ms,
+        'import_budget_ms': args.import_budget_ms,
+    }
+    failures = []
+    if report['first_prompt_ms']['median'] > args.budget_ms:
+        failures.append(f"first prompt took {report['first_prompt_ms']['median']} ms (budget {args.budget_ms} ms)")
+    if report['import_ms']['median'] > args.import_budget_ms:
+        failures.append(f"importing MTB took {report['import_ms']['median']} ms (budget {args.import_budget_ms} ms)")
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(sorted(loaded))}")
+    report['failures'] = failures
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    for failure in failures:
+        print(f"Over budget: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+import random
+import time
+import uuid
+
+from holds import held_in, release_in
+from seatmap import SeatBitmap, index_label
+
+
+# Error on the valid orders of an all-or-nothing batch that had a failed order
+BATCH_ABORTED = "Not booked because another order in the batch failed"
+# Error for a booking id that does not exist or belongs to another phone
+BOOKING_NOT_FOUND = "Booking not found"
+
+
+class WriteConflict(Exception):
+    pass
+
+
+class SeatsHeld(Exception):
+    def __init__(self, show, seats):
+        super().__init__(show, seats)
+        self.show = show
+        self.seats = seats
+
+
+class BookingResult:
+    def __init__(self, seats=None, conflicts=None, attempts=0, error=None, booking_id=None, show=None):
+        self.seats = seats or []
+        self.conflicts = conflicts or []
+        self.attempts = attempts
+        self.error = error
+        self.booking_id = booking_id
+        # (table, movie, date) the seats belong to, set on cancellations
+        self.show = show
+        # True when returned again for a repeated idempotency key
+        self.replayed = False
+
+    @property
+    def ok(self):
+        return bool(self.seats) and not self.conflicts and not self.error
+
+    def seat_labels(self):
+        return [index_label(index) for index in self.seats]
+
+    def conflict_labels(self):
+        return [index_label(index) for index in self.conflicts]
+
+
+class BookingEngine:
+    # Optimistic concurrency: every inventory row carries a version number and
+    # a write only lands if the version is unchanged since it was read.
+    # With a cache, reads may be slightly stale; a failed version check or a
+    # conflict found in cached data is always re-checked against the database.
+    def __init__(self, db, cache=None, max_retries=20, base_delay=0.002, max_delay=0.05):
+        self.db = db
+        self.cache = cache
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _load(self, table, movie, date, primary=True):
+        # Version checks need the primary; seat maps only shown may come
+        # from a replica
+        query = f"SELECT seat_map, version FROM {table} WHERE mname = %s AND Date = %s"
+        result = self.db.fetch_one(query, (movie, date), primary)
+        if result:
+            return SeatBitmap.from_bytes(result[0]), result[1]
+        return SeatBitmap(), None
+
+    def _read(self, table, movie, date, fresh=False, primary=True):
+        if self.cache is None:
+            return self._load(table, movie, date, primary)
+        key = (table, movie, str(date))
+        if fresh:
+            self.cache.invalidate(key)
+        return self.cache.get_or_load(key, lambda: self._load(table, movie, date, primary))
+
+    def _written(self, table, movie, date, booked, version):
+        # Mirrors _write_inventory: insert -> version 1, update -> +1, delete -> no row
+        if self.cache is not None:
+            if not booked.count():
+                new_version = None
+            else:
+                new_version = 1 if version is None else version + 1
+            self.cache.put((table, movie, str(date)), booked, new_version)
+
+    def inventory(self, table, movie, date, fresh=False):
+        # A stale cached or replica copy is safe: book() and cancel() re-read
+        # from the primary before reporting a conflict, and their writes
+        # only land if the version is still current. fresh reads the primary.
+        return self._read(table, movie, date, fresh, primary=fresh)[0]
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def _write_inventory(self, cursor, table, movie, date, booked, version):
+        if version is None:
+            cursor.execute(f"INSERT INTO {table} (mname, Date, seat_map, version) VALUES (%s, %s, %s, 1)",
+                           (movie, date, booked.to_bytes()))
+        elif booked.count():
+            cursor.execute(f"UPDATE {table} SET seat_map = %s, version = version + 1 WHERE mname = %s AND Date = %s AND version = %s",
+                           (booked.to_bytes(), movie, date, version))
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE mname = %s AND Date = %s AND version = %s",
+                           (movie, date, version))
+        # Zero rows means another booking got in first
+        if not cursor.rowcount:
+            raise WriteConflict()
+
+    def _lost_first_insert(self, err, version):
+        # The first booking of a show inserts its inventory row, and a
+        # concurrent first booking makes that insert a duplicate: contention
+        # like a failed version check. Any other error is a real failure.
+        return version is None and isinstance(err, self.db.IntegrityError)
+
+    def _check_holds(self, cursor, show, seats, session=None):
+        # Other customers' seat holds, checked in the booking transaction
+        held = held_in(cursor, show, seats, session, lock=self.db.dialect == 'mysql')
+        if held:
+            raise SeatsHeld(show, held)
+
+    def book(self, table, movie, date, seats, phone, gender, num_tickets, session=None):
+        # session: the customer's seat hold session, whose holds on these
+        # seats do not block them and are released with the booking
+        seats = sorted(set(seats))
+        if not seats:
+            return BookingResult(error="No seats requested")
+
+        fresh = False
+        for attempt in range(self.max_retries):
+            booked, version = self._read(table, movie, date, fresh)
+            taken = [index for index in seats if booked.test(index)]
+            if taken:
+                if self.cache is not None and not fresh:
+                    fresh = True
+                    continue
+                return BookingResult(seats, taken, attempt + 1)
+
+            mine = SeatBitmap()
+            for index in seats:
+                booked.set(index)
+                mine.set(index)
+
+            try:
+                with self.db.transaction() as cursor:
+                    self._check_holds(cursor, (table, movie, date), seats, session)
+                    self._write_inventory(cursor, table, movie, date, booked, version)
+                    cursor.execute(
+                        "INSERT INTO bookings (seat_class, mname, Date, phno, Gender, tkts, seat_map) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                        (table, movie, date, phone, gender, num_tickets, mine.to_bytes()))
+                    booking_id = cursor.lastrowid
+                    release_in(cursor, (table, movie, date), seats, session)
+                self._written(table, movie, date, booked, version)
+                return BookingResult(seats, attempts=attempt + 1, booking_id=booking_id)
+            except SeatsHeld as held:
+                return BookingResult(seats, held.seats, attempt + 1, error="Some seats are being held by another customer.")
+            except WriteConflict:
+                pass
+            except self.db.Error as err:
+                if not self._lost_first_insert(err, version):
+                    return BookingResult(seats, attempts=attempt + 1, error=f"Could not save the booking: {err}")
+            fresh = True
+            self._backoff(attempt)
+
+        return BookingResult(seats, attempts=self.max_retries, error="Too much contention, please try again")
+
+    def book_many(self, orders, atomic=False):
+        # orders: (table, movie, date, seats, phone, gender, num_tickets)
+        # tuples, any number per show. Every order is checked against the
+        # seat maps (and the orders before it) first; the ones that fit are
+        # then written in one transaction: one version-checked inventory
+        # write per show and one executemany for the bookings. Returns a
+        # BookingResult per order. With atomic, a single failed order means
+        # nothing is booked.
+        results = [None] * len(orders)
+        pending = []
+        for n, order in enumerate(orders):
+            seats = sorted(set(order[3]))
+            if seats:
+                pending.append((n, order, seats))
+            else:
+                results[n] = BookingResult(error="No seats requested")
+
+        held = {}
+        for attempt in range(self.max_retries):
+            shows, accepted, failed = {}, [], len(pending) < len(orders)
+            for n, order, seats in pending:
+                show = tuple(order[:3])
+                if show not in shows:
+                    shows[show] = self._read(*show, fresh=True)
+                booked = shows[show][0]
+                taken = [index for index in seats if booked.test(index)]
+                if taken:
+                    results[n] = BookingResult(seats, taken, attempt + 1)
+                    failed = True
+                    continue
+                taken = [index for index in seats if index in held.get(show, ())]
+                if taken:
+                    results[n] = BookingResult(seats, taken, attempt + 1, error="Some seats are being held by another customer.")
+                    failed = True
+                    continue
+                for index in seats:
+                    booked.set(index)
+                accepted.append((n, order, seats))
+            if atomic and failed:
+                for n, order, seats in accepted:
+                    results[n] = BookingResult(seats, attempts=attempt + 1, error=BATCH_ABORTED)
+                return results
+            if not accepted:
+                return results
+
+            batch_id = uuid.uuid4().hex
+            rows = []
+            for n, order, seats in accepted:
+                mine = SeatBitmap()
+                for index in seats:
+                    mine.set(index)
+                rows.append((*order[:3], *order[4:7], mine.to_bytes(), batch_id))
+            written = {}
+            for n, order, seats in accepted:
+                written.setdefault(tuple(order[:3]), []).extend(seats)
+            try:
+                with self.db.transaction() as cursor:
+                    for show, show_seats in written.items():
+                        self._check_holds(cursor, show, show_seats)
+                    for show in written:
+                        self._write_inventory(cursor, *show, *shows[show])
+                    cursor.executemany(
+                        "INSERT INTO bookings (seat_class, mname, Date, phno, Gender, tkts, seat_map, batch_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                        rows)
+                    # Ids ascend in insert order
+                    cursor.execute("SELECT booking_id FROM bookings WHERE batch_id = %s ORDER BY booking_id", (batch_id,))
+                    booking_ids = [row[0] for row in cursor.fetchall()]
+                for show in written:
+                    self._written(*show, *shows[show])
+                for (n, order, seats), booking_id in zip(accepted, booking_ids):
+                    results[n] = BookingResult(seats, attempts=attempt + 1, booking_id=booking_id)
+                return results
+            except SeatsHeld as err:
+                # Fail the orders for those seats on the next pass
+                held.setdefault(err.show, set()).update(err.seats)
+                continue
+            except WriteConflict:
+                pass
+            except self.db.Error as err:
+                if not any(self._lost_first_insert(err, shows[show][1]) for show in written):
+                    for n, order, seats in accepted:
+                        results[n] = BookingResult(seats, attempts=attempt + 1, error=f"Could not save the bookings: {err}")
+                    return results
+            self._backoff(attempt)
+
+        for n, order, seats in pending:
+            results[n] = BookingResult(seats, attempts=self.max_retries, error="Too much contention, please try again")
+        return results
+
+    def _release_from_bookings(self, cursor, table, movie, date, seats, booking_id):
+        if booking_id is not None:
+            cursor.execute("SELECT booking_id, seat_map FROM bookings WHERE booking_id = %s", (booking_id,))
+        else:
+            cursor.execute("SELECT booking_id, seat_map FROM bookings WHERE mname = %s AND Date = %s AND seat_class = %s",
+                           (movie, date, table))
+        for found_id, seat_map in cursor.fetchall():
+            held = SeatBitmap.from_bytes(seat_map)
+            released = [index for index in seats if held.test(index)]
+            if not released:
+                continue
+            for index in released:
+                held.clear(index)
+            if held.count():
+                cursor.execute("UPDATE bookings SET seat_map = %s, tkts = %s WHERE booking_id = %s",
+                               (held.to_bytes(), held.count(), found_id))
+            else:
+                cursor.execute("DELETE FROM bookings WHERE booking_id = %s", (found_id,))
+
+    def cancel(self, table, movie, date, seats, booking_id=None):
+        seats = sorted(set(seats))
+        if not seats:
+            return BookingResult(error="No seats to cancel")
+
+        fresh = False
+        for attempt in range(self.max_retries):
+            booked, version = self._read(table, movie, date, fresh)
+            missing = [index for index in seats if not booked.test(index)]
+            if version is None or missing:
+                if self.cache is not None and not fresh:
+                    fresh = True
+                    continue
+                return BookingResult(seats, missing or seats, attempt + 1)
+
+            for index in seats:
+                booked.clear(index)
+
+            try:
+                with self.db.transaction() as cursor:
+                    self._write_inventory(cursor, table, movie, date, booked, version)
+                    self._release_from_bookings(cursor, table, movie, date, seats, booking_id)
+                self._written(table, movie, date, booked, version)
+                return BookingResult(seats, attempts=attempt + 1, booking_id=booking_id, show=(table, movie, date))
+            except WriteConflict:
+                pass
+            except self.db.Error as err:
+                # Only a lost version check is worth retrying
+                return BookingResult(seats, attempts=attempt + 1, error=f"Could not cancel the booking: {err}")
+            fresh = True
+            self._backoff(attempt)
+
+        return BookingResult(seats, attempts=self.max_retries, error="Too much contention, please try again")
+
+    def cancel_booking(self, booking_id, phone=None):
+        # With phone, only a booking made with that phone number is cancelled
+        booking = self.db.fetch_one("SELECT seat_class, mname, Date, seat_map, phno FROM bookings WHERE booking_id = %s",
+                                   (booking_id,), primary=True)
+        if not booking or (phone is not None and str(booking[4]) != str(phone)):
+            return BookingResult(error=BOOKING_NOT_FOUND)
+        table, movie, date, seat_map, _ = booking
+        return self.cancel(table, movie, date, list(SeatBitmap.from_bytes(seat_map).indices()), booking_id)
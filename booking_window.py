@@ -0,0 +1,293 @@
+import base64
+import tkinter as tk
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox, simpledialog
+
+from config import load_config
+from qr import get_renderer
+from seatcanvas import SeatCanvas
+from seatmap import LAYOUT, parse_seat, seat_labels, index_label
+from service import BookingService, ServiceError, SEAT_CLASS_NAMES, seat_class_for
+
+
+class MovieTicketBookingSystem:
+    REFRESH_MS = 2000
+
+    def __init__(self, service=None):
+        self.service = service or BookingService()
+        self.window = tk.Tk()
+        self.window.title("Movie Ticket Booking System")
+
+        self.selected_seats = []
+        self.create_seat_grid()
+        self.create_input_field()
+
+        self.phone = ""
+        self.gender = ""
+        self.num_tickets = 0
+
+        # Identifies this window's seat holds to the booking service
+        self.session = uuid.uuid4().hex
+        # (seats, key) of a booking attempt whose outcome is not known yet;
+        # pressing Book again for the same seats reuses the key
+        self.booking_key = None
+        # Runs the timed seat map refresh so its queries never block Tk
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mtb-seats")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+    def create_seat_grid(self):
+        seat_frame = tk.Frame(self.window)
+        seat_frame.pack(pady=20, padx=10)
+        self.seat_canvas = SeatCanvas(seat_frame, self.select_seat)
+        tk.Label(self.window, text="Red: booked   Green: selected   Orange: held   Dark grey: other seat class").pack()
+
+        button_frame = tk.Frame(self.window)
+        button_frame.pack(pady=10)
+        self.book_button = tk.Button(button_frame, text="Book Seats", command=self.book_seats)
+        self.book_button.pack(side=tk.LEFT, padx=5)
+        self.auto_pick_button = tk.Button(button_frame, text="Auto-pick", command=self.auto_pick)
+        self.auto_pick_button.pack(side=tk.LEFT, padx=5)
+
+    def create_input_field(self):
+        self.input_field = tk.Entry(self.window, width=30)
+        self.input_field.pack(pady=10)
+        self.input_field.bind("<Return>", self.handle_input)
+
+        instruction_label = tk.Label(self.window, text="Type 'clear' to reset seats or 'cancel' to cancel a booking")
+        instruction_label.pack()
+
+    def select_seat(self, index):
+        state = self.seat_canvas.state(index)
+        seat_id = index_label(index)
+
+        if state == 'booked':
+            messagebox.showerror("Error", "This seat is already booked.")
+        elif state == 'unavailable':
+            messagebox.showerror("Error", "This seat belongs to a different seat class.")
+        elif state == 'selected':
+            self.seat_canvas.set(index, None)
+            self.selected_seats.remove(seat_id)
+            self.service.release_seats(self.current_seat_type, self.current_movie, self.show_date, [seat_id], self.session)
+        else:
+            result = self.service.hold_seats(self.current_seat_type, self.current_movie, self.show_date, [seat_id], self.session)
+            if not result.ok:
+                messagebox.showerror("Error", result.error)
+                self.load_booked_seats()
+                return
+            self.seat_canvas.set(index, 'selected')
+            self.selected_seats.append(seat_id)
+
+    def generate_receipt(self, action, seats, movie, seat_type, cost):
+        receipt = f"""
+        ===== PVR LOGIX IMAX THEATRE =====
+        Receipt for Ticket {action.capitalize()}
+
+        Movie: {movie}
+        Date: {self.show_date}
+        Seat Type: {seat_type}
+        Seats: {', '.join(seats)}
+        Total Cost: {cost} Rs
+
+        Thank you for choosing PVR LOGIX IMAX THEATRE!
+        =======================================
+        """
+        return receipt
+
+    def auto_pick(self):
+        seats = self.service.best_seats(self.current_seat_type, self.current_movie, self.show_date, self.num_tickets, self.session)
+        if not seats:
+            messagebox.showerror("Error", f"Not enough free seats for {self.num_tickets} tickets.")
+            return
+        result = self.service.hold_seats(self.current_seat_type, self.current_movie, self.show_date, seats, self.session)
+        if not result.ok:
+            messagebox.showerror("Error", "Those seats were just taken, please try again.")
+            self.load_booked_seats()
+            return
+        self.service.release_seats(self.current_seat_type, self.current_movie, self.show_date,
+                                   [seat for seat in self.selected_seats if seat not in seats], self.session)
+        self.selected_seats = seats
+        self.load_booked_seats()
+
+    def book_seats(self):
+        if self.selected_seats and len(self.selected_seats) != self.num_tickets:
+            messagebox.showerror("Error", f"Please select exactly {self.num_tickets} seats (selected {len(self.selected_seats)}).")
+        elif self.selected_seats:
+            movie = self.current_movie
+            seat_type = self.current_seat_type
+            cost_per_seat = self.current_cost_per_seat
+            booking_date = self.show_date
+
+            seats = tuple(sorted(self.selected_seats))
+            if self.booking_key is None or self.booking_key[0] != seats:
+                self.booking_key = (seats, uuid.uuid4().hex)
+            try:
+                seat_type_name = SEAT_CLASS_NAMES[seat_class_for(seat_type)]
+                result = self.service.book(seat_type, movie, booking_date, self.selected_seats, self.phone, self.gender, self.num_tickets, self.session,
+                                           self.booking_key[1])
+                if result.ok or result.conflicts:
+                    self.booking_key = None
+                if result.conflicts:
+                    for seat in result.conflict_labels():
+                        self.selected_seats.remove(seat)
+                    self.load_booked_seats()
+                    messagebox.showerror("Error", f"{result.error or 'These seats were just booked by someone else.'}\nSeats: {', '.join(result.conflict_labels())}")
+                    return
+                if result.error:
+                    messagebox.showerror("Error", result.error)
+                    return
+
+                if result.replayed:
+                    # An earlier attempt went through after all
+                    messagebox.showinfo("Already Booked", f"These seats were already booked for you: {', '.join(self.selected_seats)}")
+                    for seat in self.selected_seats:
+                        self.seat_canvas.set(parse_seat(seat), 'booked')
+                    self.selected_seats = []
+                    return
+
+                cost = len(self.selected_seats) * cost_per_seat
+                # Start encoding the QR now; it is shown once ready without blocking the window
+                qr_future = self.generate_upi_qr_code(cost)
+                receipt = self.generate_receipt("booking", self.selected_seats, movie, seat_type_name, cost)
+                messagebox.showinfo("Booking Successful", f"You have booked the following seats: {', '.join(self.selected_seats)}\nTotal cost: {cost} Rs\n\nReceipt:\n{receipt}")
+                self.show_qr_when_ready(qr_future, cost)
+                
+                for seat in self.selected_seats:
+                    self.seat_canvas.set(parse_seat(seat), 'booked')
+                
+                self.selected_seats = []
+
+            except ServiceError as e:
+                messagebox.showerror("Error", str(e))
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to update booked seats: {str(e)}")
+        else:
+            messagebox.showerror("Error", "Please select at least one seat to book.")
+
+    def generate_upi_qr_code(self, cost):
+        upi_id = load_config()['qr']['upi_id']
+        return get_renderer().submit(upi_id, cost)
+
+    def show_qr_when_ready(self, future, cost):
+        # Polled from the Tk event loop so the worker thread never touches widgets
+        if not future.done():
+            self.window.after(50, self.show_qr_when_ready, future, cost)
+            return
+        try:
+            png = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to generate UPI QR code: {str(e)}")
+            return
+
+        qr_window = tk.Toplevel(self.window)
+        qr_window.title("Scan to Pay")
+        image = tk.PhotoImage(data=base64.b64encode(png))
+        label = tk.Label(qr_window, image=image)
+        label.image = image
+        label.pack(padx=10, pady=10)
+        tk.Label(qr_window, text=f"Pay {cost} Rs via UPI").pack(pady=(0, 10))
+
+    def handle_input(self, event):
+        user_input = self.input_field.get().strip().lower()
+        if user_input == "clear":
+            if messagebox.askyesno("Confirm Clear", "Are you sure you want to clear all booked seats?"):
+                self.reset_seat_colors()
+                self.input_field.delete(0, tk.END)
+        elif user_input == "cancel":
+            self.cancel_ticket()
+        self.input_field.delete(0, tk.END)
+
+    def reset_seat_colors(self):
+        for index, state in list(self.seat_canvas.states.items()):
+            if state == 'booked':
+                self.seat_canvas.set(index, None)
+
+    def cancel_ticket(self):
+        movie = simpledialog.askstring("Cancel Ticket", "Enter the movie name:")
+        seat_type = simpledialog.askstring("Cancel Ticket", "Enter seat type (1 for NON AC, 2 for AC, 3 for FIRST CLASS):")
+        if not movie or not seat_type:
+            return
+
+        try:
+            seat_type_name = SEAT_CLASS_NAMES[seat_class_for(seat_type)]
+        except ServiceError:
+            messagebox.showerror("Error", "Invalid seat type")
+            return
+
+        try:
+            booked = self.service.seat_map(seat_type, movie, self.show_date)
+            if booked.count():
+                seat_to_cancel = simpledialog.askstring("Cancel Ticket", f"Booked seats: {', '.join(seat_labels(booked))}\nEnter the seat number to cancel:")
+                try:
+                    index = parse_seat(seat_to_cancel or "")
+                except ValueError:
+                    index = None
+                if index is not None and self.service.cancel_seats(seat_type, movie, self.show_date, [seat_to_cancel]).ok:
+                    seat_to_cancel = index_label(index)
+
+                    self.seat_canvas.set(index, None)
+
+                    cost = self.current_cost_per_seat
+                    receipt = self.generate_receipt("cancellation", [seat_to_cancel], movie, seat_type_name, cost)
+                    messagebox.showinfo("Cancellation Successful", f"Ticket for seat {seat_to_cancel} has been cancelled.\n\nReceipt:\n{receipt}")
+                else:
+                    messagebox.showerror("Error", "Invalid seat number")
+            else:
+                messagebox.showerror("Error", "No booked seats found")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to cancel ticket: {str(e)}")
+
+    def run(self, movie, seat_type, cost_per_seat, phone, gender, num_tickets, date):
+        # Everything in this window books, holds and cancels for this show date
+        self.show_date = str(date)
+        self.current_movie = movie
+        self.current_seat_type = seat_type
+        self.current_cost_per_seat = cost_per_seat
+        self.phone = phone
+        self.gender = gender
+        self.num_tickets = num_tickets
+        self.seat_canvas.set_unavailable(LAYOUT.outside_zone(seat_class_for(seat_type)))
+        self.load_booked_seats()
+        self.window.after(self.REFRESH_MS, self.refresh_seats)
+        self.window.mainloop()
+
+    def fetch_seats(self):
+        # (booked bitmap, seats held by others); safe to call off the Tk thread
+        booked = self.service.seat_map(self.current_seat_type, self.current_movie, self.show_date)
+        held = self.service.held_seats(self.current_seat_type, self.current_movie, self.show_date, self.session)
+        return booked, held
+
+    def paint_seats(self, booked, held):
+        # Red: booked, green: selected here, orange: held by another customer
+        states = dict.fromkeys(held, 'held')
+        states.update((parse_seat(seat), 'selected') for seat in self.selected_seats)
+        states.update(dict.fromkeys(booked.indices(), 'booked'))
+        self.seat_canvas.render(states)
+
+    def load_booked_seats(self):
+        try:
+            self.paint_seats(*self.fetch_seats())
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load booked seats: {str(e)}")
+
+    def refresh_seats(self):
+        # Picks up other customers' bookings and holds while the grid is open.
+        # The queries run on the loader thread; the grid is repainted from
+        # the Tk event loop once they are done, as with the QR code.
+        self.paint_when_ready(self.loader.submit(self.fetch_seats))
+
+    def paint_when_ready(self, future):
+        if not future.done():
+            self.window.after(50, self.paint_when_ready, future)
+            return
+        try:
+            self.paint_seats(*future.result())
+        except Exception as e:
+            print(f"Failed to refresh seats: {str(e)}")
+        self.window.after(self.REFRESH_MS, self.refresh_seats)
+
+    def close(self):
+        self.loader.shutdown(wait=False)
+        if hasattr(self, 'current_movie'):
+            self.service.release_session(self.current_seat_type, self.current_movie, self.show_date, self.session)
+        self.window.destroy()
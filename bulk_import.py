@@ -0,0 +1,102 @@
+import argparse
+import csv
+import sys
+import time
+
+from service import BookingService, result_dict
+
+# export.py writes these columns too, so an export can be imported again
+FIELDS = ['seat_class', 'movie', 'date', 'phone', 'gender', 'tickets', 'seats']
+
+
+def read_orders(file):
+    # Yields (line number, order) with orders shaped like the POST /bookings body
+    reader = csv.DictReader(file)
+    missing = [field for field in ('seat_class', 'movie', 'date', 'phone', 'seats')
+               if field not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+    for row in reader:
+        tickets = (row.get('tickets') or '').strip()
+        yield reader.line_num, {
+            'class': row['seat_class'],
+            'movie': row['movie'],
+            'date': row['date'],
+            'phone': row['phone'],
+            'gender': row.get('gender') or 'n',
+            'tickets': int(tickets) if tickets.isdigit() else tickets or None,
+            'seats': row['seats'].replace(',', ' ').split(),
+        }
+
+
+def chunks(rows, size):
+    if not size:
+        yield list(rows)
+        return
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_orders(service, rows, chunk_size=0, atomic=False):
+    # Yields (line number, order, BookingResult); each chunk is one batch
+    for chunk in chunks(rows, chunk_size):
+        results = service.book_batch([order for _, order in chunk], atomic)
+        for (line, order), result in zip(chunk, results):
+            yield line, order, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Book group and corporate orders from a CSV file")
+    parser.add_argument('input', help=f"CSV file with the columns {', '.join(FIELDS)} ('-' for stdin)")
+    parser.add_argument('--atomic', action='store_true', help="book nothing if any order fails (with sharded workers, the orders must all go to one worker)")
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help="orders per transaction (default: the whole file in one)")
+    parser.add_argument('--errors', help="write the orders that failed, with the reason, to this CSV file")
+    args = parser.parse_args(argv)
+
+    service = BookingService()
+    file = sys.stdin if args.input == '-' else open(args.input, newline='')
+    start = time.perf_counter()
+    booked = seats = 0
+    failures = []
+    try:
+        for line, order, result in import_orders(service, read_orders(file), args.chunk_size, args.atomic):
+            if result.ok:
+                booked += 1
+                seats += len(result.seats)
+            else:
+                failure = result_dict(result)
+                failures.append({'line': line, 'error': failure['error'] or "Seats already booked",
+                                 'conflicts': ' '.join(failure['conflicts'])})
+    except ValueError as err:
+        print(f"Error: {err}", file=sys.stderr)
+        return 2
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        close = getattr(service.engine, 'close', None)
+        if close:
+            close()
+    elapsed = time.perf_counter() - start
+
+    for failure in failures[:20]:
+        print(f"Line {failure['line']}: {failure['error']} {failure['conflicts']}".rstrip(), file=sys.stderr)
+    if len(failures) > 20:
+        print(f"... and {len(failures) - 20} more", file=sys.stderr)
+    if args.errors and failures:
+        with open(args.errors, 'w', newline='') as errors:
+            writer = csv.DictWriter(errors, fieldnames=['line', 'error', 'conflicts'])
+            writer.writeheader()
+            writer.writerows(failures)
+    print(f"Booked {booked} orders ({seats} seats) in {elapsed:.2f} s; {len(failures)} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SeatMapCache:
+    # LRU + TTL cache of parsed show inventories: key -> (bitmap, version).
+    # Entries carry the inventory row version so a late write-back from a
+    # slower thread can never replace a newer seat map.
+    def __init__(self, max_entries=1024, ttl=2.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            bitmap, version, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return bitmap.copy(), version
+
+    def put(self, key, bitmap, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and version is not None and version < entry[1]:
+                return
+            self._entries[key] = (bitmap.copy(), version, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        bitmap, version = loader()
+        self.put(key, bitmap, version)
+        return bitmap, version
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,98 @@
+import configparser
+import os
+
+CONFIG_FILE = os.environ.get('MTB_CONFIG', 'mtb.ini')
+
+DEFAULTS = {
+    'database': {
+        'backend': 'mysql',
+        'host': 'localhost',
+        'port': '3306',
+        'user': 'root',
+        'password': '',
+        'database': 'pvrmovie',
+        'sqlite_path': 'pvrmovie.db',
+        'fetch_size': '500',
+    },
+    'replicas': {
+        'servers': '',
+        'eject_seconds': '30',
+        'read_your_writes_seconds': '2',
+    },
+    'hall': {
+        'rows': '10',
+        'cols': '10',
+        'aisles': '',
+        'zones': '',
+    },
+    'pool': {
+        'min_size': '1',
+        'max_size': '10',
+        'idle_timeout': '300',
+        'checkout_timeout': '10',
+    },
+    'server': {
+        'host': '127.0.0.1',
+        'port': '8080',
+        'workers': '32',
+    },
+    'holds': {
+        'ttl': '120',
+    },
+    'waitlist': {
+        'offer_ttl': '300',
+        'max_party': '10',
+    },
+    'idempotency': {
+        'max_entries': '10000',
+        'ttl': '86400',
+        'wait': '10',
+        'lease': '60',
+    },
+    'cache': {
+        'max_entries': '1024',
+        'ttl': '2',
+    },
+    'qr': {
+        'upi_id': '6397749277@paytm',
+        'workers': '2',
+        'max_bytes': str(4 * 1024 * 1024),
+        'cache_dir': '',
+    },
+    'schedule': {
+        'refresh_interval': '30',
+    },
+    'journal': {
+        'enabled': 'false',
+        'path': 'mtb.journal',
+        'batch_size': '128',
+        'flush_ms': '5',
+        'max_bytes': str(64 * 1024 * 1024),
+    },
+    'shards': {
+        'enabled': 'false',
+        'workers': '0',
+        'threads': '16',
+    },
+    'metrics': {
+        'enabled': 'true',
+        'slow_query_ms': '200',
+        'slow_query_log': '',
+        'dump_path': '',
+        'dump_interval': '60',
+    },
+}
+
+
+def load_config(path=None):
+    # Values come from the defaults above, then the ini file, then
+    # MTB_<SECTION>_<KEY> environment variables (e.g. MTB_DATABASE_PASSWORD)
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULTS)
+    config.read(path or CONFIG_FILE)
+    for section in config.sections():
+        for key in config[section]:
+            value = os.environ.get(f"MTB_{section}_{key}".upper())
+            if value is not None:
+                config[section][key] = value
+    return config
@@ -0,0 +1,525 @@
+import datetime
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import load_config
+from metrics import get_metrics
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class MySQLBackend:
+    dialect = 'mysql'
+
+    def __init__(self, host, port, user, password, database):
+        self.params = dict(host=host, port=port, user=user, passwd=password, database=database)
+        self._driver = None
+
+    @property
+    def driver(self):
+        # mysql.connector is slow to import; wait for the first connection
+        if self._driver is None:
+            import mysql.connector
+            self._driver = mysql.connector
+        return self._driver
+
+    @property
+    def Error(self):
+        return self.driver.Error
+
+    @property
+    def IntegrityError(self):
+        return self.driver.IntegrityError
+
+    def connect(self):
+        return self.driver.connect(**self.params)
+
+    def cursor(self, connection, buffered=True):
+        return connection.cursor(buffered=buffered)
+
+    def ping(self, connection):
+        return connection.is_connected()
+
+
+class SQLiteCursor:
+    # Lets the MySQL-style %s placeholders used throughout the app run on SQLite
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        self._cursor.execute(query.replace('%s', '?'), params or ())
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(query.replace('%s', '?'), seq_of_params)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedCursor:
+    # Times every statement for the metrics registry; rows are counted as
+    # they are fetched for queries and from rowcount for writes
+    def __init__(self, cursor, metrics, error_type):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._error_type = error_type
+        self._key = None
+
+    def _run(self, method, query, params, many):
+        start = time.perf_counter()
+        try:
+            method(query, params)
+        except self._error_type as err:
+            self._metrics.observe_statement(query, None if many else params, time.perf_counter() - start, error=err)
+            raise
+        rows = 0
+        if self._cursor.description is None and self._cursor.rowcount > 0:
+            rows = self._cursor.rowcount
+        self._key = self._metrics.observe_statement(query, None if many else params, time.perf_counter() - start, rows)
+        return self
+
+    def execute(self, query, params=None):
+        return self._run(self._cursor.execute, query, params, False)
+
+    def executemany(self, query, seq_of_params):
+        return self._run(self._cursor.executemany, query, seq_of_params, True)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._key:
+            self._metrics.add_rows(self._key, 1)
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if rows and self._key:
+            self._metrics.add_rows(self._key, len(rows))
+        return rows
+
+    def fetchmany(self, size):
+        rows = self._cursor.fetchmany(size)
+        if rows and self._key:
+            self._metrics.add_rows(self._key, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_converter("DATE", lambda value: datetime.date.fromisoformat(value.decode()))
+
+
+class SQLiteBackend:
+    dialect = 'sqlite'
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def cursor(self, connection, buffered=True):
+        # sqlite3 cursors step through results lazily either way
+        return SQLiteCursor(connection.cursor())
+
+    def ping(self, connection):
+        try:
+            connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+
+class ConnectionPool:
+    def __init__(self, backend, min_size=1, max_size=10, idle_timeout=300, checkout_timeout=10):
+        self.backend = backend
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle = deque()
+        self._size = 0
+        self._lock = threading.Condition()
+        # Connections are opened on demand; min_size is how many idle ones
+        # are kept once open
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except self.backend.Error:
+            pass
+
+    def _evict_idle(self):
+        # Oldest idle connections sit at the left end of the deque
+        now = time.monotonic()
+        evicted = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            evicted.append(self._idle.popleft()[0])
+            self._size -= 1
+        return evicted
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._lock:
+                evicted = self._evict_idle()
+                connection = None
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No database connection free after {self.checkout_timeout}s")
+                    self._lock.wait(remaining)
+                if self._idle:
+                    connection = self._idle.pop()[0]
+                else:
+                    self._size += 1
+            for stale in evicted:
+                self._close(stale)
+
+            if connection is None:
+                try:
+                    return self.backend.connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            if self.backend.ping(connection):
+                return connection
+            self._discard(connection)
+
+    def release(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def _discard(self, connection):
+        self._close(connection)
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self, connection=None):
+        # Optionally wraps a connection already taken with acquire()
+        if connection is None:
+            connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            # A failed statement may have left the connection broken
+            if self.backend.ping(connection):
+                self.release(connection)
+            else:
+                self._discard(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for connection, _ in idle:
+            self._close(connection)
+
+
+class ReplicaSet:
+    # Read-only copies of the primary, taken in turn. A replica that cannot
+    # hand out a connection or run a read is ejected for eject_seconds, then
+    # tried again.
+    def __init__(self, pools, eject_seconds=30.0, clock=time.monotonic):
+        self.pools = pools
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self._ejected = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        # The next replica not currently ejected, or None
+        with self._lock:
+            now = self.clock()
+            for _ in range(len(self.pools)):
+                pool = self.pools[self._next]
+                self._next = (self._next + 1) % len(self.pools)
+                if self._ejected.get(pool, now) <= now:
+                    self._ejected.pop(pool, None)
+                    return pool
+            return None
+
+    def eject(self, pool):
+        with self._lock:
+            self._ejected[pool] = self.clock() + self.eject_seconds
+
+    def healthy(self):
+        with self._lock:
+            now = self.clock()
+            return sum(1 for pool in self.pools if self._ejected.get(pool, now) <= now)
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+
+def create_backend(config, server=None):
+    # server: a replica's "host[:port]" (MySQL) or file path (SQLite)
+    # instead of the primary's
+    section = config['database']
+    if section['backend'] == 'sqlite':
+        return SQLiteBackend(server or section['sqlite_path'])
+    if section['backend'] == 'mysql':
+        host, _, port = (server or '').partition(':')
+        return MySQLBackend(host or section['host'], int(port or section['port']), section['user'],
+                            section['password'], section['database'])
+    raise ValueError(f"Unknown database backend: {section['backend']}")
+
+
+def create_pool(config, server=None):
+    section = config['pool']
+    return ConnectionPool(create_backend(config, server),
+                          min_size=section.getint('min_size'),
+                          max_size=section.getint('max_size'),
+                          idle_timeout=section.getfloat('idle_timeout'),
+                          checkout_timeout=section.getfloat('checkout_timeout'))
+
+
+def create_replicas(config):
+    servers = [server.strip() for server in config['replicas']['servers'].split(',') if server.strip()]
+    if not servers:
+        return None
+    return ReplicaSet([create_pool(config, server) for server in servers],
+                      config['replicas'].getfloat('eject_seconds'))
+
+
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool(load_config())
+        return _pool
+
+
+def get_replicas():
+    global _replicas
+    with _pool_lock:
+        if _replicas is None:
+            _replicas = create_replicas(load_config()) or False
+        return _replicas or None
+
+
+class DatabaseConnection:
+    # Writes, and reads passed primary=True, go to the primary. Other reads
+    # go to the [replicas] servers in turn, except that a thread reads from
+    # the primary for read_your_writes_seconds after its last write, and
+    # inside `with db.primary():`. Replicas only apply to the configured
+    # database; a connection given its own pool has none unless passed some.
+    def __init__(self, pool=None, metrics=None, fetch_size=None, replicas=None):
+        # Nothing connects until the first query, so front ends can show
+        # their first prompt without waiting for the database
+        self._pool = pool
+        self._replicas = replicas if replicas is not None or pool is not None else False
+        self.metrics = metrics or get_metrics()
+        config = load_config()
+        self.fetch_size = fetch_size or config['database'].getint('fetch_size')
+        self.read_your_writes = config['replicas'].getfloat('read_your_writes_seconds')
+        self._local = threading.local()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = get_pool()
+        return self._pool
+
+    @property
+    def replicas(self):
+        if self._replicas is False:
+            self._replicas = get_replicas()
+        return self._replicas
+
+    @contextmanager
+    def primary(self):
+        # Every read in the block (on this thread) goes to the primary
+        self._local.pinned = getattr(self._local, 'pinned', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.pinned -= 1
+
+    def _pinned(self):
+        if getattr(self._local, 'pinned', 0):
+            return True
+        return time.monotonic() - getattr(self._local, 'wrote_at', float('-inf')) < self.read_your_writes
+
+    def _checkout(self, primary=False):
+        # (pool, connection) to read from
+        replicas = self.replicas
+        if replicas is not None and not primary and not self._pinned():
+            while True:
+                replica = replicas.choose()
+                if replica is None:
+                    break
+                try:
+                    return replica, replica.acquire()
+                except (PoolTimeout, replica.backend.Error) as err:
+                    print(f"Read replica unavailable, using the others for {replicas.eject_seconds:g}s: {err}")
+                    replicas.eject(replica)
+        return self.pool, self.pool.acquire()
+
+    @property
+    def dialect(self):
+        return self.pool.backend.dialect
+
+    @property
+    def Error(self):
+        return self.pool.backend.Error
+
+    @property
+    def IntegrityError(self):
+        return self.pool.backend.IntegrityError
+
+    @contextmanager
+    def _cursor(self, pool, connection=None):
+        with pool.connection(connection) as connection:
+            cursor = pool.backend.cursor(connection)
+            if self.metrics.enabled:
+                cursor = InstrumentedCursor(cursor, self.metrics, pool.backend.Error)
+            try:
+                yield cursor
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except pool.backend.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        # Always on the primary
+        try:
+            with self._cursor(self.pool) as cursor:
+                yield cursor
+        finally:
+            self._local.wrote_at = time.monotonic()
+
+    def execute_query(self, query, params=None):
+        try:
+            with self.transaction() as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                return cursor.rowcount
+        except self.pool.backend.Error as err:
+            print(f"Error: {err}")
+            return None
+
+    def _run_read(self, pool, connection, query, params, fetch):
+        with self._cursor(pool, connection) as cursor:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            return fetch(cursor)
+
+    def _read(self, query, params, primary, fetch):
+        # A replica whose query fails (a dropped link, a replica that lost
+        # a table) is ejected like one that refuses connections, and the
+        # read is run once more on the primary
+        pool, connection = self._checkout(primary)
+        if pool is self.pool:
+            return self._run_read(pool, connection, query, params, fetch)
+        try:
+            return self._run_read(pool, connection, query, params, fetch)
+        except pool.backend.Error as err:
+            print(f"Read replica failed, using the others for {self.replicas.eject_seconds:g}s: {err}")
+            self.replicas.eject(pool)
+        return self._run_read(self.pool, self.pool.acquire(), query, params, fetch)
+
+    def fetch_one(self, query, params=None, primary=False):
+        try:
+            return self._read(query, params, primary, lambda cursor: cursor.fetchone())
+        except self.Error as err:
+            print(f"Error: {err}")
+            return None
+
+    def fetch_all(self, query, params=None, primary=False):
+        try:
+            return self._read(query, params, primary, lambda cursor: cursor.fetchall())
+        except self.Error as err:
+            print(f"Error: {err}")
+            return None
+
+    def iter_rows(self, query, params=None, batch_size=None, primary=False):
+        # Streams rows with an unbuffered cursor, fetch_size rows at a time,
+        # so memory stays bounded however many rows match. The connection
+        # is held until the generator is exhausted or closed; one abandoned
+        # half-way still has unread rows on it, so it is not reused.
+        # Unlike fetch_all, database errors are raised to the caller, except
+        # that a replica failing before the first row is ejected and the
+        # query run on the primary, as in _read.
+        pool, connection = self._checkout(primary)
+        rows = self._stream(pool, connection, query, params, batch_size)
+        try:
+            if pool is not self.pool:
+                try:
+                    first = next(rows)
+                except StopIteration:
+                    return
+                except pool.backend.Error as err:
+                    print(f"Read replica failed, using the others for {self.replicas.eject_seconds:g}s: {err}")
+                    self.replicas.eject(pool)
+                    rows = self._stream(self.pool, self.pool.acquire(), query, params, batch_size)
+                else:
+                    yield first
+            yield from rows
+        finally:
+            rows.close()
+
+    def _stream(self, pool, connection, query, params, batch_size):
+        cursor = pool.backend.cursor(connection, buffered=False)
+        if self.metrics.enabled:
+            cursor = InstrumentedCursor(cursor, self.metrics, pool.backend.Error)
+        finished = False
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size or self.fetch_size)
+                if not rows:
+                    break
+                yield from rows
+            connection.commit()
+            finished = True
+        finally:
+            if finished:
+                cursor.close()
+                pool.release(connection)
+            else:
+                pool._discard(connection)
@@ -0,0 +1,68 @@
+import argparse
+import csv
+import datetime
+import json
+import sys
+
+from database import DatabaseConnection
+from service import BOOKING_QUERY, booking_dict
+
+FIELDS = ['booking_id', 'seat_class', 'seat_type', 'movie', 'gender', 'date', 'tickets', 'phone', 'seats']
+
+
+def iter_bookings(db, start=None, end=None, batch_size=None):
+    conditions, params = [], []
+    if start:
+        conditions.append("Date >= %s")
+        params.append(start)
+    if end:
+        conditions.append("Date <= %s")
+        params.append(end)
+    query = BOOKING_QUERY
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    for row in db.iter_rows(query + " ORDER BY booking_id", params, batch_size):
+        yield booking_dict(row)
+
+
+def write_csv(bookings, file):
+    writer = csv.DictWriter(file, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for booking in bookings:
+        writer.writerow(dict(booking, seats=' '.join(booking['seats'])))
+        count += 1
+    return count
+
+
+def write_jsonl(bookings, file):
+    count = 0
+    for booking in bookings:
+        file.write(json.dumps(booking) + "\n")
+        count += 1
+    return count
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export bookings without loading them all into memory")
+    parser.add_argument('--format', choices=WRITERS, default='csv')
+    parser.add_argument('--output', help="file to write (default: stdout)")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help="first show date, YYYY-MM-DD")
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help="last show date, YYYY-MM-DD")
+    parser.add_argument('--batch-size', type=int, help="rows fetched per round trip")
+    args = parser.parse_args(argv)
+
+    bookings = iter_bookings(DatabaseConnection(), args.start, args.end, args.batch_size)
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            count = WRITERS[args.format](bookings, file)
+        print(f"Exported {count} bookings to {args.output}")
+    else:
+        WRITERS[args.format](bookings, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
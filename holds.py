@@ -0,0 +1,107 @@
+import threading
+import time
+
+SHOW_CONDITION = "seat_class = %s AND mname = %s AND Date = %s"
+
+
+def seat_marks(seats):
+    return ', '.join(['%s'] * len(seats))
+
+
+def held_in(cursor, show, seats, session=None, now=None, lock=False):
+    # Seats among `seats` held by anyone but `session`, read inside the
+    # caller's transaction. With lock (MySQL), the rows and the gaps between
+    # them stay locked until it commits, so no hold can slip in meanwhile.
+    query = (f"SELECT seat_index FROM seat_holds WHERE {SHOW_CONDITION} AND seat_index IN ({seat_marks(seats)}) "
+             "AND expires_at > %s AND session <> %s")
+    if lock:
+        query += " FOR UPDATE"
+    cursor.execute(query, (*show, *seats, time.time() if now is None else now, session or ''))
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def release_in(cursor, show, seats, session):
+    if session:
+        cursor.execute(f"DELETE FROM seat_holds WHERE {SHOW_CONDITION} AND session = %s AND seat_index IN ({seat_marks(seats)})",
+                       (*show, session, *seats))
+
+
+class SeatHoldManager:
+    # Short leases on seats a customer has selected but not yet booked: one
+    # seat_holds row per seat, keyed by show and seat, with the Unix time it
+    # lapses. Every process on the database (kiosks, server.py) sees the same
+    # holds, and BookingEngine checks them in the transaction that books the
+    # seats. Lapsed rows are ignored by every query and deleted now and then.
+    def __init__(self, db, ttl=120, clock=time.time, purge_interval=60.0):
+        self.db = db
+        self.ttl = ttl
+        self.clock = clock
+        self.purge_interval = purge_interval
+        self._purged_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _purge(self, now, force=False):
+        with self._lock:
+            if not force and now - self._purged_at < self.purge_interval:
+                return
+            self._purged_at = now
+        self.db.execute_query("DELETE FROM seat_holds WHERE expires_at <= %s", (now,))
+
+    def expire(self):
+        self._purge(self.clock(), force=True)
+
+    def hold(self, show, seats, session, ttl=None):
+        # All or nothing: returns the seats held by someone else, if any
+        seats = sorted(set(seats))
+        if not seats:
+            return []
+        now = self.clock()
+        self._purge(now)
+        rows = [(*show, index, session, now + (ttl or self.ttl)) for index in seats]
+        for _ in range(3):
+            try:
+                with self.db.transaction() as cursor:
+                    conflicts = held_in(cursor, show, seats, session, now)
+                    if conflicts:
+                        return conflicts
+                    # Our own earlier holds on these seats, and lapsed ones.
+                    # Another customer's live hold stays, so a claim racing
+                    # it fails on the primary key below.
+                    cursor.execute(f"DELETE FROM seat_holds WHERE {SHOW_CONDITION} AND seat_index IN ({seat_marks(seats)}) "
+                                   "AND (session = %s OR expires_at <= %s)", (*show, *seats, session, now))
+                    cursor.executemany(
+                        "INSERT INTO seat_holds (seat_class, mname, Date, seat_index, session, expires_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                        rows)
+                return []
+            except self.db.IntegrityError:
+                # Another customer took one of the seats first; see which
+                pass
+            except self.db.Error as err:
+                # A deadlock or lock timeout against a concurrent claim
+                print(f"Error: {err}")
+        # Still contended after the retries: report the seats as held
+        return sorted(self.held_by_others(show, session) & set(seats)) or seats
+
+    def release(self, show, seats, session):
+        if seats:
+            with self.db.transaction() as cursor:
+                release_in(cursor, show, sorted(set(seats)), session)
+
+    def release_session(self, show, session):
+        self.db.execute_query(f"DELETE FROM seat_holds WHERE {SHOW_CONDITION} AND session = %s", (*show, session))
+
+    def held_by_others(self, show, session=None):
+        rows = self.db.fetch_all(
+            f"SELECT seat_index FROM seat_holds WHERE {SHOW_CONDITION} AND expires_at > %s AND session <> %s",
+            (*show, self.clock(), session or ''), primary=True) or []
+        return {row[0] for row in rows}
+
+    def held_by(self, show, session):
+        rows = self.db.fetch_all(
+            f"SELECT seat_index FROM seat_holds WHERE {SHOW_CONDITION} AND expires_at > %s AND session = %s",
+            (*show, self.clock(), session), primary=True) or []
+        return {row[0] for row in rows}
+
+    def __len__(self):
+        row = self.db.fetch_one("SELECT COUNT(*) FROM seat_holds WHERE expires_at > %s", (self.clock(),), primary=True)
+        return row[0] if row else 0
@@ -0,0 +1,154 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from booking_engine import BookingResult
+
+MAX_KEY_LENGTH = 64
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+def fingerprint(*request):
+    return hashlib.sha256(json.dumps(request, default=str).encode()).hexdigest()
+
+
+def dump_result(result):
+    return json.dumps({
+        'seats': result.seats,
+        'conflicts': result.conflicts,
+        'attempts': result.attempts,
+        'error': result.error,
+        'booking_id': result.booking_id,
+        'show': [result.show[0], result.show[1], str(result.show[2])] if result.show else None,
+    })
+
+
+def load_result(text):
+    data = json.loads(text)
+    show = data.pop('show')
+    if show:
+        show = (show[0], show[1], datetime.date.fromisoformat(show[2]))
+    return BookingResult(show=show, **data)
+
+
+class IdempotencyStore:
+    # Outcomes of book/cancel requests by client-supplied key, kept in the
+    # idempotency_keys table for ttl seconds, the most recent also in a
+    # bounded LRU cache. A request claims its key with an insert before it
+    # runs, so a duplicate arriving meanwhile (from any thread or process)
+    # waits for the first outcome instead of running again. Only final
+    # outcomes are kept: a booking made, or whatever the caller's `final`
+    # check accepts (seats already booked by someone else). Anything else,
+    # such as seats only held for now or a lost race, frees the key so the
+    # retry runs for real. created_at is when the key was last claimed; a
+    # claim with no outcome after `lease` seconds belonged to a process that
+    # died, and the next repeat takes it over.
+    def __init__(self, db, max_entries=10000, ttl=86400.0, wait=10.0, lease=60.0, clock=time.time):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait = wait
+        self.lease = lease
+        self.clock = clock
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._claims = 0
+        self.replays = 0
+
+    def _cached(self, key):
+        with self._lock:
+            record = self._cache.get(key)
+            if record is None:
+                return None
+            if record[2] + self.ttl <= self.clock():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return record
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._cache[key] = record
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _claim(self, key, request):
+        # None once the key is ours, else (fingerprint, stored result or None, created_at)
+        now = self.clock()
+        try:
+            with self.db.transaction() as cursor:
+                cursor.execute("DELETE FROM idempotency_keys WHERE idem_key = %s AND created_at < %s",
+                               (key, now - self.ttl))
+                cursor.execute("INSERT INTO idempotency_keys (idem_key, fingerprint, created_at) VALUES (%s, %s, %s)",
+                               (key, request, now))
+            self._claims += 1
+            if self._claims % 1000 == 0:
+                self.db.execute_query("DELETE FROM idempotency_keys WHERE created_at < %s", (now - self.ttl,))
+            return None
+        except self.db.IntegrityError:
+            pass
+        row = self.db.fetch_one("SELECT fingerprint, result, created_at FROM idempotency_keys WHERE idem_key = %s",
+                                (key,), primary=True)
+        if row is None:
+            # Freed by a failed attempt in the meantime; claim again
+            return request, None, now
+        fingerprint, result, claimed = row
+        if result is None and fingerprint == request and claimed < now - self.lease:
+            taken = self.db.execute_query(
+                "UPDATE idempotency_keys SET created_at = %s WHERE idem_key = %s AND result IS NULL AND created_at = %s",
+                (now, key, claimed))
+            if taken == 1:
+                print(f"Taking over idempotency key {key}, claimed {now - claimed:.0f}s ago without an outcome")
+                return None
+        return fingerprint, result, claimed
+
+    def _finish(self, key, request, result, final):
+        if result.ok or (final is not None and final(result)):
+            stored = dump_result(result)
+            self.db.execute_query("UPDATE idempotency_keys SET result = %s WHERE idem_key = %s", (stored, key))
+            self._remember(key, (request, stored, self.clock()))
+        else:
+            self.db.execute_query("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+
+    def run(self, key, request, func, final=None):
+        # func() runs at most once per key; repeats get its BookingResult
+        # back with .replayed set. final(result) says whether a failed
+        # outcome will stay that way and may be replayed.
+        if not key:
+            return func()
+        if len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(f"Idempotency keys are at most {MAX_KEY_LENGTH} characters")
+        deadline = self.clock() + self.wait
+        while True:
+            try:
+                record = self._cached(key) or self._claim(key, request)
+            except self.db.Error as err:
+                return BookingResult(error=f"Could not record this request, please try again: {err}")
+            if record is None:
+                break
+            if record[0] != request:
+                raise IdempotencyError("This idempotency key was already used for a different request")
+            if record[1] is not None:
+                self.replays += 1
+                result = load_result(record[1])
+                result.replayed = True
+                return result
+            if self.clock() >= deadline:
+                return BookingResult(error="An earlier request with this key has not finished yet; "
+                                           "check your tickets before trying again")
+            time.sleep(0.05)
+
+        try:
+            result = func()
+        except BaseException:
+            self.db.execute_query("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+            raise
+        self._finish(key, request, result, final)
+        return result
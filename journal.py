@@ -0,0 +1,458 @@
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from booking_engine import BATCH_ABORTED, BookingEngine, BookingResult, WriteConflict
+from seatmap import SeatBitmap
+
+
+class JournalError(Exception):
+    pass
+
+
+def encode(record):
+    payload = json.dumps(record, separators=(',', ':')).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def read_journal(path):
+    # Stops at the first damaged line: only a torn write at the very end can
+    # produce one, and nobody was told that entry was durable
+    records = []
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return records
+    with file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            checksum, _, payload = line[:-1].partition(b' ')
+            try:
+                if int(checksum, 16) != zlib.crc32(payload):
+                    break
+                records.append(json.loads(payload))
+            except ValueError:
+                break
+    return records
+
+
+def lock_journal(path):
+    # An exclusive lock on the journal, held by the engine that owns it for
+    # as long as it runs. A second process replaying or truncating the same
+    # journal would lose the first one's unapplied entries and hand out the
+    # same booking ids. Windows locks a sidecar file instead, since its locks
+    # would also block writes to the journal itself.
+    file = open(path if fcntl else path + '.lock', 'ab')
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        raise JournalError(f"Booking journal {path} is in use by another process")
+    return file
+
+
+class Journal:
+    # Append-only file with group commit: callers queue a record and get a
+    # Future; one thread writes everything queued so far and covers it with
+    # a single fsync, once batch_size records are waiting or flush_interval
+    # has passed since the first one.
+    def __init__(self, path, batch_size=128, flush_interval=0.005, on_durable=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_durable = on_durable
+        self.file = open(path, 'ab')
+        self.durable_seq = 0
+        self.error = None
+        self._pending = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._file_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="mtb-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        future = Future()
+        with self._cond:
+            if self.error is not None:
+                raise JournalError(f"Booking journal unavailable: {self.error}")
+            if self._closed:
+                raise JournalError("Booking journal is closed")
+            self._pending.append((record, future))
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            if self.error is not None:
+                raise self.error
+            with self._file_lock:
+                self.file.write(b''.join(encode(record) for record, _ in batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.durable_seq = batch[-1][0]['seq']
+        except OSError as err:
+            # After a failed fsync the file contents are unknown, so stop
+            # taking new work rather than acknowledge anything else
+            self.error = err
+            for _, future in batch:
+                future.set_exception(JournalError(f"Booking journal unavailable: {err}"))
+            return
+        if self.on_durable:
+            self.on_durable([record for record, _ in batch])
+        for record, future in batch:
+            future.set_result(record['seq'])
+
+    def truncate(self, applied_seq, max_bytes):
+        # Everything written is in the database, so the file can start over
+        with self._file_lock:
+            if self.durable_seq == applied_seq and self.file.tell() > max_bytes:
+                self.file.truncate(0)
+                os.fsync(self.file.fileno())
+
+    def stop(self):
+        # Writes out everything queued, then refuses new records
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def close(self):
+        self.stop()
+        self.file.close()
+
+
+class JournaledBookingEngine(BookingEngine):
+    # Write path for a process that owns all booking writes (e.g. server.py).
+    # Bookings and cancellations are checked against seat maps held in
+    # memory, appended to the journal and acknowledged once it is fsynced.
+    # A background thread then applies them to the database in batches, one
+    # transaction per batch, recording the last applied sequence number in
+    # journal_state in that same transaction. On startup, journal entries
+    # past that number are replayed before anything else runs.
+    # Several engines can share a database (see sharded.py) as long as each
+    # owns its own shows, journal file, journal_state row (state_id) and
+    # booking ids (those equal to id_offset modulo id_step).
+    def __init__(self, db, path, cache=None, batch_size=128, flush_interval=0.005, max_bytes=64 * 1024 * 1024,
+                 max_shows=1024, state_id=1, id_offset=0, id_step=1):
+        super().__init__(db, cache)
+        self.path = path
+        self.state_id = state_id
+        self.id_offset = id_offset
+        self.id_step = id_step
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_shows = max_shows
+        self._lock = threading.Lock()
+        self._shows = {}
+        self._unapplied = {}
+        self._queue = deque()
+        self._applied = threading.Condition()
+        self._stopping = False
+
+        self._owner = lock_journal(path)
+        try:
+            self.applied_seq, self._seq = self._recover()
+            row = self.db.fetch_one("SELECT COALESCE(MAX(booking_id), 0) FROM bookings", primary=True)
+            if row is None:
+                raise JournalError("Could not read the last booking id")
+        except BaseException:
+            self._owner.close()
+            raise
+        self._booking_id = row[0]
+
+        self.journal = Journal(path, batch_size, flush_interval, self._enqueue)
+        self.journal.durable_seq = self._seq
+        self._applier = threading.Thread(target=self._apply_loop, name="mtb-journal-apply", daemon=True)
+        self._applier.start()
+
+    # Startup
+
+    def _recover(self):
+        row = self.db.fetch_one("SELECT applied_seq FROM journal_state WHERE id = %s", (self.state_id,), primary=True)
+        if row is None and self.state_id != 1:
+            self.db.execute_query("INSERT INTO journal_state (id, applied_seq) VALUES (%s, 0)", (self.state_id,))
+            row = self.db.fetch_one("SELECT applied_seq FROM journal_state WHERE id = %s", (self.state_id,), primary=True)
+        if row is None:
+            raise JournalError("journal_state is missing, run migrate.py")
+        applied = row[0]
+        records = read_journal(self.path)
+        pending = [record for record in records if record['seq'] > applied]
+        for start in range(0, len(pending), self.batch_size):
+            self._apply(pending[start:start + self.batch_size])
+        if pending:
+            print(f"Replayed {len(pending)} journaled booking changes")
+            applied = pending[-1]['seq']
+        with open(self.path, 'wb') as file:
+            os.fsync(file.fileno())
+        return applied, max([applied] + [record['seq'] for record in records])
+
+    # Applying journaled changes to the database
+
+    def _insert_bookings(self, cursor, rows):
+        if rows:
+            cursor.executemany(
+                "INSERT INTO bookings (booking_id, seat_class, mname, Date, phno, Gender, tkts, seat_map) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                rows)
+
+    def _apply_batch(self, cursor, batch):
+        # Records carry seat changes, not whole seat maps, so a batch can be
+        # re-run on top of whatever the database holds after a conflict
+        shows = {}
+        inserts = []
+        for record in batch:
+            table, movie, date = record['table'], record['movie'], datetime.date.fromisoformat(record['date'])
+            if (table, movie, date) not in shows:
+                cursor.execute(f"SELECT seat_map, version FROM {table} WHERE mname = %s AND Date = %s", (movie, date))
+                row = cursor.fetchone()
+                shows[table, movie, date] = (SeatBitmap.from_bytes(row[0]), row[1]) if row else (SeatBitmap(), None)
+            booked = shows[table, movie, date][0]
+            if record['op'] == 'book':
+                mine = SeatBitmap()
+                for index in record['seats']:
+                    booked.set(index)
+                    mine.set(index)
+                inserts.append((record['booking_id'], table, movie, date, record['phone'], record['gender'],
+                                record['tickets'], mine.to_bytes()))
+            else:
+                for index in record['seats']:
+                    booked.clear(index)
+                # Bookings earlier in the batch must exist before they are released
+                self._insert_bookings(cursor, inserts)
+                inserts = []
+                self._release_from_bookings(cursor, table, movie, date, record['seats'], record['booking_id'])
+        self._insert_bookings(cursor, inserts)
+        for (table, movie, date), (booked, version) in shows.items():
+            if version is not None or booked.count():
+                self._write_inventory(cursor, table, movie, date, booked, version)
+        cursor.execute("UPDATE journal_state SET applied_seq = %s WHERE id = %s", (batch[-1]['seq'], self.state_id))
+
+    def _apply(self, batch):
+        for attempt in range(self.max_retries):
+            try:
+                with self.db.transaction() as cursor:
+                    self._apply_batch(cursor, batch)
+                return
+            except (WriteConflict, self.db.Error):
+                self._backoff(attempt)
+        raise JournalError(f"Could not apply journal entries {batch[0]['seq']}-{batch[-1]['seq']}")
+
+    def _enqueue(self, records):
+        with self._applied:
+            self._queue.extend(records)
+            self._applied.notify_all()
+
+    def _apply_loop(self):
+        while True:
+            with self._applied:
+                while not self._queue and not self._stopping:
+                    self._applied.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._applied.wait(remaining)
+                batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+            try:
+                self._apply(batch)
+            except JournalError as err:
+                # The entries are durable in the journal; keep them queued
+                # and retry, or leave them for replay on the next start
+                print(f"Error: {err}")
+                if self._stopping:
+                    return
+                time.sleep(1)
+                continue
+            self._applied_batch(batch)
+
+    def _applied_batch(self, batch):
+        with self._lock:
+            for record in batch:
+                show = (record['table'], record['movie'], datetime.date.fromisoformat(record['date']))
+                self._unapplied[show] -= 1
+                if not self._unapplied[show]:
+                    del self._unapplied[show]
+            if len(self._shows) > self.max_shows:
+                for show in [show for show in self._shows if show not in self._unapplied]:
+                    del self._shows[show]
+        with self._applied:
+            for _ in batch:
+                self._queue.popleft()
+            self.applied_seq = batch[-1]['seq']
+            self._applied.notify_all()
+        self.journal.truncate(self.applied_seq, self.max_bytes)
+
+    def wait_applied(self, timeout=10.0):
+        # Blocks until everything acknowledged so far is in the database
+        with self._lock:
+            target = self._seq
+        with self._applied:
+            return self._applied.wait_for(lambda: self.applied_seq >= target, timeout)
+
+    # Seat state
+
+    def _state(self, show):
+        # Shows with unapplied journal entries always stay loaded, so a seat
+        # map read from the database here is never missing a change
+        booked = self._shows.get(show)
+        if booked is None:
+            booked = self._shows[show] = self._load(*show)[0]
+        return booked
+
+    def inventory(self, table, movie, date, fresh=False):
+        # The seat maps in memory are always current
+        with self._lock:
+            return self._state((table, movie, date)).copy()
+
+    def _journal(self, show, record):
+        # Called with self._lock held, so journal order matches seat state order
+        self._seq += 1
+        record.update(seq=self._seq, table=show[0], movie=show[1], date=str(show[2]))
+        future = self.journal.append(record)
+        self._unapplied[show] = self._unapplied.get(show, 0) + 1
+        return future
+
+    def _wait(self, future, seats, booking_id, show=None):
+        try:
+            future.result()
+        except JournalError as err:
+            return BookingResult(seats, attempts=1, error=str(err))
+        return BookingResult(seats, attempts=1, booking_id=booking_id, show=show)
+
+    def book(self, table, movie, date, seats, phone, gender, num_tickets, session=None):
+        # There is no booking transaction to check seat holds in; the
+        # service reads them just before (BookingService._book)
+        seats = sorted(set(seats))
+        if not seats:
+            return BookingResult(error="No seats requested")
+        show = (table, movie, date)
+        with self._lock:
+            booked = self._state(show)
+            taken = [index for index in seats if booked.test(index)]
+            if taken:
+                return BookingResult(seats, taken, 1)
+            booking_id = self._booking_id + 1
+            booking_id += (self.id_offset - booking_id) % self.id_step
+            try:
+                future = self._journal(show, {'op': 'book', 'seats': seats, 'booking_id': booking_id,
+                                              'phone': phone, 'gender': gender, 'tickets': num_tickets})
+            except JournalError as err:
+                return BookingResult(seats, error=str(err))
+            self._booking_id = booking_id
+            for index in seats:
+                booked.set(index)
+        return self._wait(future, seats, booking_id)
+
+    def book_many(self, orders, atomic=False):
+        # Same contract as BookingEngine.book_many. The orders are checked
+        # and journaled under one hold of the lock, so they share fsyncs and
+        # reach the database in the applier's executemany batches.
+        results = [None] * len(orders)
+        accepted = []
+        with self._lock:
+            claimed = {}
+            for n, order in enumerate(orders):
+                show, seats = tuple(order[:3]), sorted(set(order[3]))
+                if not seats:
+                    results[n] = BookingResult(error="No seats requested")
+                    continue
+                booked = self._state(show)
+                mine = claimed.setdefault(show, set())
+                taken = [index for index in seats if booked.test(index) or index in mine]
+                if taken:
+                    results[n] = BookingResult(seats, taken, 1)
+                    continue
+                mine.update(seats)
+                accepted.append((n, order, show, seats))
+            if atomic and len(accepted) < len(orders):
+                for n, order, show, seats in accepted:
+                    results[n] = BookingResult(seats, attempts=1, error=BATCH_ABORTED)
+                return results
+            futures = []
+            for n, order, show, seats in accepted:
+                booking_id = self._booking_id + 1
+                booking_id += (self.id_offset - booking_id) % self.id_step
+                try:
+                    future = self._journal(show, {'op': 'book', 'seats': seats, 'booking_id': booking_id,
+                                                  'phone': order[4], 'gender': order[5], 'tickets': order[6]})
+                except JournalError as err:
+                    results[n] = BookingResult(seats, error=str(err))
+                    continue
+                self._booking_id = booking_id
+                booked = self._state(show)
+                for index in seats:
+                    booked.set(index)
+                futures.append((n, future, seats, booking_id))
+        for n, future, seats, booking_id in futures:
+            results[n] = self._wait(future, seats, booking_id)
+        return results
+
+    def cancel(self, table, movie, date, seats, booking_id=None):
+        seats = sorted(set(seats))
+        if not seats:
+            return BookingResult(error="No seats to cancel")
+        show = (table, movie, date)
+        with self._lock:
+            booked = self._state(show)
+            missing = [index for index in seats if not booked.test(index)]
+            if missing:
+                return BookingResult(seats, missing, 1)
+            try:
+                future = self._journal(show, {'op': 'cancel', 'seats': seats, 'booking_id': booking_id})
+            except JournalError as err:
+                return BookingResult(seats, error=str(err))
+            for index in seats:
+                booked.clear(index)
+        return self._wait(future, seats, booking_id, show)
+
+    def cancel_booking(self, booking_id, phone=None):
+        # The booking row may still be waiting in the journal
+        if not self.wait_applied():
+            return BookingResult(error="Bookings are still being saved, please try again")
+        return super().cancel_booking(booking_id, phone)
+
+    def close(self):
+        self.journal.stop()
+        with self._applied:
+            self._stopping = True
+            self._applied.notify_all()
+        self._applier.join()
+        self.journal.close()
+        self._owner.close()
@@ -0,0 +1,252 @@
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from config import load_config
+
+# Upper bounds in seconds, Prometheus style (an implicit +Inf bucket follows)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+slow_query_log = logging.getLogger('mtb.slow_query')
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query):
+    # One key per statement shape: literals and placeholders become ?,
+    # placeholder lists of any length collapse, whitespace is squeezed
+    query = re.sub(r"'(?:[^']|'')*'", '?', query)
+    query = re.sub(r'\b\d+\b', '?', query)
+    query = query.replace('%s', '?')
+    query = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', query)
+    return ' '.join(query.split())
+
+
+def redact(params):
+    # Slow query log entries show parameter types, never values
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile; coarse but cheap
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': self.total,
+            'p50_le_s': self.quantile(0.50),
+            'p95_le_s': self.quantile(0.95),
+            'p99_le_s': self.quantile(0.99),
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.rows = 0
+
+
+class Metrics:
+    # Statement and span timings for the whole process. Recording is one
+    # lock, a dict lookup and a bisect, cheap enough to leave on everywhere.
+    def __init__(self, slow_query_ms=200.0, enabled=True):
+        self.enabled = enabled
+        self.slow_query_s = slow_query_ms / 1000 if slow_query_ms else None
+        self.statements = {}
+        self.spans = {}
+        self.slow_queries = 0
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        # hook(kind, name, seconds, error) runs after every statement
+        # ('statement', normalized SQL) and span ('span', span name)
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _notify(self, kind, name, seconds, error):
+        for hook in self._hooks:
+            try:
+                hook(kind, name, seconds, error)
+            except Exception as err:
+                print(f"Metrics hook failed: {err}")
+
+    def observe_statement(self, query, params, seconds, rows=0, error=None):
+        key = normalize_sql(query)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = Stats()
+            stats.latency.observe(seconds)
+            stats.rows += rows
+            if error is not None:
+                stats.errors += 1
+            slow = self.slow_query_s is not None and seconds >= self.slow_query_s
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            slow_query_log.warning("slow query %.1f ms%s: %s params=%s", seconds * 1000,
+                                   " (failed)" if error is not None else "", key, redact(params))
+        if self._hooks:
+            self._notify('statement', key, seconds, error)
+        return key
+
+    def add_rows(self, key, rows):
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is not None:
+                stats.rows += rows
+
+    def observe_span(self, name, seconds, error=None):
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = Stats()
+            stats.latency.observe(seconds)
+            if error is not None:
+                stats.errors += 1
+        if self._hooks:
+            self._notify('span', name, seconds, error)
+
+    @contextmanager
+    def span(self, name):
+        # with metrics.span("book_seats"): ... times a whole flow
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as err:
+            self.observe_span(name, time.perf_counter() - start, err)
+            raise
+        self.observe_span(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'time': time.time(),
+                'slow_queries': self.slow_queries,
+                'statements': {key: dict(stats.latency.as_dict(), errors=stats.errors, rows=stats.rows)
+                               for key, stats in self.statements.items()},
+                'spans': {name: dict(stats.latency.as_dict(), errors=stats.errors)
+                          for name, stats in self.spans.items()},
+            }
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            self._histograms(lines, 'mtb_db_statement_duration_seconds', 'statement', self.statements,
+                             "Database statement latency by normalized SQL")
+            self._counters(lines, 'mtb_db_statement_rows_total', 'statement', self.statements, 'rows',
+                           "Rows returned or affected")
+            self._counters(lines, 'mtb_db_statement_errors_total', 'statement', self.statements, 'errors',
+                           "Statements that raised a database error")
+            self._histograms(lines, 'mtb_span_duration_seconds', 'span', self.spans,
+                             "Application span latency")
+            self._counters(lines, 'mtb_span_errors_total', 'span', self.spans, 'errors',
+                           "Spans that ended with an exception")
+            lines.append("# HELP mtb_db_slow_queries_total Statements slower than the slow query threshold")
+            lines.append("# TYPE mtb_db_slow_queries_total counter")
+            lines.append(f"mtb_db_slow_queries_total {self.slow_queries}")
+        return '\n'.join(lines) + '\n'
+
+    def _histograms(self, lines, metric, label, table, help_text):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, stats in table.items():
+            value = escape_label(name)
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.latency.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {stats.latency.count}')
+            lines.append(f'{metric}_sum{{{label}="{value}"}} {stats.latency.total}')
+            lines.append(f'{metric}_count{{{label}="{value}"}} {stats.latency.count}')
+
+    def _counters(self, lines, metric, label, table, field, help_text):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in table.items():
+            lines.append(f'{metric}{{{label}="{escape_label(name)}"}} {getattr(stats, field)}')
+
+    def dump_json(self, path):
+        # Written to a temporary file first so readers never see half a dump
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temporary, path)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsDumper(threading.Thread):
+    def __init__(self, metrics, path, interval=60.0):
+        super().__init__(name="mtb-metrics-dump", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.metrics.dump_json(self.path)
+            except OSError as err:
+                print(f"Could not write metrics to {self.path}: {err}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            section = load_config()['metrics']
+            _metrics = Metrics(section.getfloat('slow_query_ms'), section.getboolean('enabled'))
+            if section['slow_query_log']:
+                handler = logging.FileHandler(section['slow_query_log'])
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                slow_query_log.addHandler(handler)
+            if section['dump_path']:
+                MetricsDumper(_metrics, section['dump_path'], section.getfloat('dump_interval')).start()
+        return _metrics
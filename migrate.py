@@ -0,0 +1,283 @@
+from seatmap import SeatBitmap, parse_legacy_seats
+
+SEAT_TABLES = ['non_ac', 'ac', 'firstclass']
+
+MIGRATIONS = []
+
+
+class MigrationError(Exception):
+    pass
+
+
+def migration(version, name):
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return register
+
+
+def run_statement(db, query, params=None):
+    if db.execute_query(query, params) is None:
+        raise MigrationError(f"Statement failed: {query}")
+
+
+@migration(1, "base schema")
+def create_base_schema(db):
+    run_statement(db, """
+        CREATE TABLE IF NOT EXISTS user_accounts (
+            fname VARCHAR(50),
+            lname VARCHAR(50),
+            user_name VARCHAR(50) PRIMARY KEY,
+            password VARCHAR(50),
+            phno VARCHAR(10) UNIQUE,
+            gender VARCHAR(1),
+            dob DATE,
+            age INT
+        )""")
+    for table in SEAT_TABLES:
+        run_statement(db, f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                mname VARCHAR(100),
+                Gender VARCHAR(1),
+                Date DATE,
+                tkts INT,
+                phno VARCHAR(10),
+                booked_seats TEXT
+            )""")
+
+
+@migration(2, "seat bitmap")
+def convert_booked_seats(db):
+    # One bit per seat, row-major; the width is fixed by the hall capacity
+    for table in SEAT_TABLES:
+        run_statement(db, f"ALTER TABLE {table} ADD COLUMN seat_map VARBINARY(255)")
+        rows = db.fetch_all(f"SELECT mname, Date, booked_seats FROM {table}") or []
+        for mname, date, booked_seats in rows:
+            try:
+                bitmap = parse_legacy_seats(booked_seats)
+            except ValueError as err:
+                raise MigrationError(f"{table} row for {mname} on {date}: {err}")
+            run_statement(db,
+                f"UPDATE {table} SET seat_map = %s WHERE mname = %s AND Date = %s AND booked_seats = %s",
+                (bitmap.to_bytes(), mname, date, booked_seats))
+        run_statement(db, f"ALTER TABLE {table} DROP COLUMN booked_seats")
+
+
+@migration(3, "inventory version column")
+def add_inventory_version(db):
+    for table in SEAT_TABLES:
+        run_statement(db, f"ALTER TABLE {table} ADD COLUMN version INT NOT NULL DEFAULT 0")
+
+        # Concurrent first bookings used to be able to create two rows for one
+        # show; merge them so (mname, Date) can become unique
+        duplicates = db.fetch_all(
+            f"SELECT mname, Date FROM {table} GROUP BY mname, Date HAVING COUNT(*) > 1") or []
+        for mname, date in duplicates:
+            rows = db.fetch_all(
+                f"SELECT seat_map, Gender, tkts, phno FROM {table} WHERE mname = %s AND Date = %s",
+                (mname, date))
+            merged = SeatBitmap()
+            for row in rows:
+                for index in SeatBitmap.from_bytes(row[0]).indices():
+                    merged.set(index)
+            gender, tkts, phno = rows[-1][1:]
+            run_statement(db, f"DELETE FROM {table} WHERE mname = %s AND Date = %s", (mname, date))
+            run_statement(db,
+                f"INSERT INTO {table} (mname, Date, seat_map, version, Gender, tkts, phno) VALUES (%s, %s, %s, 1, %s, %s, %s)",
+                (mname, date, merged.to_bytes(), gender, tkts, phno))
+
+        run_statement(db, f"CREATE UNIQUE INDEX ux_{table}_show ON {table} (mname, Date)")
+
+
+@migration(4, "bookings table")
+def create_bookings(db):
+    # One row per customer booking across all seat classes; the seat class
+    # tables keep only the per-show inventory
+    if db.dialect == 'sqlite':
+        booking_id = "booking_id INTEGER PRIMARY KEY AUTOINCREMENT"
+    else:
+        booking_id = "booking_id INT AUTO_INCREMENT PRIMARY KEY"
+    run_statement(db, f"""
+        CREATE TABLE bookings (
+            {booking_id},
+            seat_class VARCHAR(12) NOT NULL,
+            mname VARCHAR(100) NOT NULL,
+            Date DATE NOT NULL,
+            phno VARCHAR(10),
+            Gender VARCHAR(1),
+            tkts INT,
+            seat_map VARBINARY(255)
+        )""")
+    run_statement(db, "CREATE INDEX ix_bookings_phno_date ON bookings (phno, Date)")
+    run_statement(db, "CREATE INDEX ix_bookings_mname_date ON bookings (mname, Date)")
+
+    for table in SEAT_TABLES:
+        run_statement(db, f"""
+            INSERT INTO bookings (seat_class, mname, Date, phno, Gender, tkts, seat_map)
+            SELECT '{table}', mname, Date, phno, Gender, tkts, seat_map FROM {table}
+            WHERE seat_map IS NOT NULL""")
+        for column in ['Gender', 'tkts', 'phno']:
+            run_statement(db, f"ALTER TABLE {table} DROP COLUMN {column}")
+
+
+@migration(5, "show schedule")
+def create_shows(db):
+    # Structured screenings replace the fixed list of titles; a NULL Date
+    # means the show runs every day
+    if db.dialect == 'sqlite':
+        show_id = "show_id INTEGER PRIMARY KEY AUTOINCREMENT"
+    else:
+        show_id = "show_id INT AUTO_INCREMENT PRIMARY KEY"
+    run_statement(db, f"""
+        CREATE TABLE shows (
+            {show_id},
+            mname VARCHAR(100) NOT NULL,
+            movie VARCHAR(100) NOT NULL,
+            screen VARCHAR(20) NOT NULL,
+            Date DATE,
+            start_time CHAR(5) NOT NULL,
+            end_time CHAR(5) NOT NULL,
+            price_non_ac INT,
+            price_ac INT,
+            price_firstclass INT,
+            cancelled INT NOT NULL DEFAULT 0,
+            revision INT NOT NULL
+        )""")
+    run_statement(db, "CREATE INDEX ix_shows_date_start ON shows (Date, start_time)")
+    run_statement(db, "CREATE INDEX ix_shows_revision ON shows (revision)")
+
+    # The old hardcoded line-up, keeping its titles as the inventory key so
+    # existing bookings still match their show
+    legacy = [
+        ("VENOM ZEHER KA KAEHER (Hindi dub) Timings:10am to 1pm", "VENOM ZEHER KA KAEHER (Hindi dub)", "Screen 1", "10:00", "13:00"),
+        ("JEENE NHI DUNGA (Hindi dub) Timings:2pm to 4pm", "JEENE NHI DUNGA (Hindi dub)", "Screen 2", "14:00", "16:00"),
+        ("PUSHPA 2 (Hindi dub) Timings:7pm to 9pm", "PUSHPA 2 (Hindi dub)", "Screen 1", "19:00", "21:00"),
+        ("RED NOTICE 2 (English) Timings:10am to 12pm", "RED NOTICE 2 (English)", "Screen 3", "10:00", "12:00"),
+        ("KANCHNA 2 (Horror) Timings:1pm to 3pm", "KANCHNA 2 (Horror)", "Screen 3", "13:00", "15:00"),
+    ]
+    for revision, (mname, movie, screen, start, end) in enumerate(legacy, 1):
+        run_statement(db, """
+            INSERT INTO shows (mname, movie, screen, Date, start_time, end_time, price_non_ac, price_ac, price_firstclass, cancelled, revision)
+            VALUES (%s, %s, %s, NULL, %s, %s, 200, 400, 700, 0, %s)""",
+            (mname, movie, screen, start, end, revision))
+
+
+@migration(6, "booking journal checkpoint")
+def create_journal_state(db):
+    # Last journal entry applied to the database, written in the same
+    # transaction as the entries themselves
+    run_statement(db, """
+        CREATE TABLE journal_state (
+            id INT PRIMARY KEY,
+            applied_seq BIGINT NOT NULL
+        )""")
+    run_statement(db, "INSERT INTO journal_state (id, applied_seq) VALUES (1, 0)")
+
+
+@migration(7, "daily show stats")
+def create_daily_show_stats(db):
+    # One row per show per finished day, filled in by analytics.aggregate_days
+    run_statement(db, """
+        CREATE TABLE daily_show_stats (
+            Date DATE NOT NULL,
+            seat_class VARCHAR(12) NOT NULL,
+            mname VARCHAR(100) NOT NULL,
+            movie VARCHAR(100) NOT NULL,
+            booked INT NOT NULL,
+            revenue INT NOT NULL,
+            seat_map VARBINARY(255),
+            PRIMARY KEY (Date, seat_class, mname)
+        )""")
+
+
+@migration(8, "waitlist")
+def create_waitlist(db):
+    # Customers waiting for seats on a sold-out show. status is 'waiting',
+    # 'offered' (seats held for them until offer_expires, a Unix time),
+    # 'booked', 'expired' or 'left'.
+    if db.dialect == 'sqlite':
+        waitlist_id = "waitlist_id INTEGER PRIMARY KEY AUTOINCREMENT"
+    else:
+        waitlist_id = "waitlist_id INT AUTO_INCREMENT PRIMARY KEY"
+    run_statement(db, f"""
+        CREATE TABLE waitlist (
+            {waitlist_id},
+            seat_class VARCHAR(12) NOT NULL,
+            mname VARCHAR(100) NOT NULL,
+            Date DATE NOT NULL,
+            phno VARCHAR(10) NOT NULL,
+            Gender VARCHAR(1),
+            party INT NOT NULL,
+            status VARCHAR(8) NOT NULL,
+            seat_map VARBINARY(255),
+            offer_expires DOUBLE
+        )""")
+    run_statement(db, "CREATE INDEX ix_waitlist_show ON waitlist (mname, Date, seat_class, status)")
+    run_statement(db, "CREATE INDEX ix_waitlist_phno ON waitlist (phno)")
+
+
+@migration(9, "idempotency keys")
+def create_idempotency_keys(db):
+    # Outcome of each book/cancel request sent with a client idempotency
+    # key; result stays NULL while the first attempt is running
+    run_statement(db, """
+        CREATE TABLE idempotency_keys (
+            idem_key VARCHAR(64) PRIMARY KEY,
+            fingerprint CHAR(64) NOT NULL,
+            result TEXT,
+            created_at DOUBLE NOT NULL
+        )""")
+    run_statement(db, "CREATE INDEX ix_idempotency_keys_created ON idempotency_keys (created_at)")
+
+
+@migration(10, "booking batch id")
+def add_booking_batch_id(db):
+    # Set on bookings made together by BookingEngine.book_many, which reads
+    # their ids back by it
+    run_statement(db, "ALTER TABLE bookings ADD COLUMN batch_id VARCHAR(32)")
+    run_statement(db, "CREATE INDEX ix_bookings_batch ON bookings (batch_id)")
+
+
+@migration(11, "seat holds")
+def create_seat_holds(db):
+    # Seats selected but not yet booked, shared by every process; a row
+    # stops counting once expires_at (Unix time) has passed
+    run_statement(db, """
+        CREATE TABLE seat_holds (
+            seat_class VARCHAR(12) NOT NULL,
+            mname VARCHAR(100) NOT NULL,
+            Date DATE NOT NULL,
+            seat_index INT NOT NULL,
+            session VARCHAR(64) NOT NULL,
+            expires_at DOUBLE NOT NULL,
+            PRIMARY KEY (seat_class, mname, Date, seat_index)
+        )""")
+    run_statement(db, "CREATE INDEX ix_seat_holds_expires ON seat_holds (expires_at)")
+
+
+def applied_versions(db):
+    run_statement(db, """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100)
+        )""")
+    rows = db.fetch_all("SELECT version FROM schema_migrations") or []
+    return {row[0] for row in rows}
+
+
+def migrate(db):
+    with db.primary():
+        done = applied_versions(db)
+        for version, name, func in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {name}")
+            func(db)
+            run_statement(db, "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+    print("Schema is up to date")
+
+
+if __name__ == "__main__":
+    from database import DatabaseConnection
+    migrate(DatabaseConnection())
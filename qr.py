@@ -0,0 +1,112 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import load_config
+
+
+def upi_url(upi_id, amount):
+    return f"upi://{upi_id}?amount={amount}&currency=INR&purpose=Payment"
+
+
+def render_png(upi_id, amount):
+    # Imported here, on a worker thread: qrcode pulls in PIL
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(upi_url(upi_id, amount))
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+class QRRenderer:
+    # The PNG only depends on (upi_id, amount), so each one is encoded once on
+    # a worker thread and then served from a byte-size bounded LRU cache,
+    # optionally backed by files in cache_dir.
+    def __init__(self, workers=2, max_bytes=4 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir or None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mtb-qr")
+        self._cache = OrderedDict()
+        self._size = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, upi_id, amount):
+        return os.path.join(self.cache_dir, f"upi_qr_code_{upi_id}_{amount}.png")
+
+    def _remember(self, key, png):
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = png
+            self._size += len(png)
+            while self._size > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._size -= len(evicted)
+
+    def cached(self, upi_id, amount):
+        with self._lock:
+            png = self._cache.get((upi_id, amount))
+            if png is not None:
+                self._cache.move_to_end((upi_id, amount))
+            return png
+
+    def _load_or_render(self, upi_id, amount):
+        key = (upi_id, amount)
+        try:
+            png = None
+            if self.cache_dir and os.path.exists(self._path(upi_id, amount)):
+                with open(self._path(upi_id, amount), 'rb') as file:
+                    png = file.read()
+            if png is None:
+                png = render_png(upi_id, amount)
+                if self.cache_dir:
+                    with open(self._path(upi_id, amount), 'wb') as file:
+                        file.write(png)
+            self._remember(key, png)
+            return png
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def submit(self, upi_id, amount):
+        # Returns a Future; concurrent requests for the same code share one render
+        png = self.cached(upi_id, amount)
+        if png is not None:
+            future = Future()
+            future.set_result(png)
+            return future
+        with self._lock:
+            future = self._pending.get((upi_id, amount))
+            if future is None:
+                future = self.executor.submit(self._load_or_render, upi_id, amount)
+                self._pending[(upi_id, amount)] = future
+            return future
+
+    def png(self, upi_id, amount):
+        return self.submit(upi_id, amount).result()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'bytes': self._size, 'pending': len(self._pending)}
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            section = load_config()['qr']
+            _renderer = QRRenderer(section.getint('workers'), section.getint('max_bytes'), section['cache_dir'])
+        return _renderer
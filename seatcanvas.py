@@ -0,0 +1,108 @@
+import tkinter as tk
+
+from seatmap import LAYOUT, index_label
+
+COLOURS = {
+    'free': '#d9d9d9',
+    'booked': 'red',
+    'selected': 'green',
+    'held': 'orange',
+    'unavailable': '#7f7f7f',
+}
+
+# Seats are drawn with their labels only while there is room for them
+LABEL_MIN_SIZE = 30
+
+
+class SeatCanvas:
+    # The whole hall on a single Canvas, one rectangle per seat created
+    # once. render() compares the new seat states with the ones on screen
+    # and reconfigures only the seats that changed, so a refresh of a
+    # 1,500-seat hall costs as much as the number of seats that moved.
+    def __init__(self, parent, on_click, layout=LAYOUT, max_width=900, max_height=520):
+        self.layout = layout
+        self.on_click = on_click
+        self.states = {}
+        self.unavailable = frozenset()
+
+        aisle_count = len(layout.aisles)
+        self.size = max(8, min(40, (max_width - 40) // (layout.cols + aisle_count) - 2))
+        pitch = self.size + 2
+        margin = 30
+        self.col_x = []
+        x = margin
+        for col in range(layout.cols):
+            self.col_x.append(x)
+            x += pitch + (self.size if col + 1 in layout.aisles else 0)
+        width = x + 10
+        height = margin + layout.rows * pitch + 10
+
+        frame = tk.Frame(parent)
+        frame.pack()
+        self.canvas = tk.Canvas(frame, width=min(width, max_width), height=min(height, max_height),
+                                scrollregion=(0, 0, width, height), highlightthickness=0)
+        if width > max_width:
+            x_scroll = tk.Scrollbar(frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+            x_scroll.pack(side=tk.BOTTOM, fill=tk.X)
+            self.canvas.configure(xscrollcommand=x_scroll.set)
+        if height > max_height:
+            y_scroll = tk.Scrollbar(frame, orient=tk.VERTICAL, command=self.canvas.yview)
+            y_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+            self.canvas.configure(yscrollcommand=y_scroll.set)
+        self.canvas.pack(side=tk.LEFT)
+
+        self.canvas.create_text(width // 2, margin // 2, text="SCREEN")
+        self.items = []
+        self._index_of = {}
+        labels = self.size >= LABEL_MIN_SIZE
+        for row in range(layout.rows):
+            y = margin + row * pitch
+            self.canvas.create_text(margin // 2, y + self.size // 2, text=str(row + 1))
+            for col in range(layout.cols):
+                index = row * layout.cols + col
+                x = self.col_x[col]
+                item = self.canvas.create_rectangle(x, y, x + self.size, y + self.size,
+                                                    fill=COLOURS['free'], outline='#555555', tags='seat')
+                self.items.append(item)
+                self._index_of[item] = index
+                if labels:
+                    text = self.canvas.create_text(x + self.size // 2, y + self.size // 2,
+                                                   text=index_label(index), font=('TkDefaultFont', 7), tags='seat')
+                    self._index_of[text] = index
+        self.canvas.tag_bind('seat', '<Button-1>', self._click)
+
+    def _click(self, event):
+        current = self.canvas.find_withtag('current')
+        if current and current[0] in self._index_of:
+            self.on_click(self._index_of[current[0]])
+
+    def state(self, index):
+        return self.states.get(index) or ('unavailable' if index in self.unavailable else 'free')
+
+    def _paint(self, index, state):
+        self.canvas.itemconfigure(self.items[index], fill=COLOURS[state])
+
+    def set_unavailable(self, indices):
+        # Seats outside the current seat class's rows
+        indices = frozenset(indices)
+        changed = self.unavailable ^ indices
+        self.unavailable = indices
+        for index in changed:
+            self._paint(index, self.state(index))
+
+    def set(self, index, state):
+        before = self.state(index)
+        if state:
+            self.states[index] = state
+        else:
+            self.states.pop(index, None)
+        if self.state(index) != before:
+            self._paint(index, self.state(index))
+
+    def render(self, states):
+        # states: index -> 'booked' / 'selected' / 'held'; anything missing is free
+        old = self.states
+        self.states = dict(states)
+        for index in old.keys() | self.states.keys():
+            if old.get(index) != self.states.get(index):
+                self._paint(index, self.state(index))
@@ -0,0 +1,176 @@
+from config import load_config
+
+# seat_map columns are VARBINARY(255), one bit per seat
+MAX_CAPACITY = 255 * 8
+
+
+class HallLayout:
+    # Size of the auditorium, the columns an aisle follows and the rows each
+    # seat class sells. Seats are numbered row-major from 0 and labelled
+    # "row-col" from 1, so every label names exactly one seat.
+    def __init__(self, rows=10, cols=10, aisles=(), zones=None):
+        if rows < 1 or cols < 1 or rows * cols > MAX_CAPACITY:
+            raise ValueError(f"A hall needs 1 to {MAX_CAPACITY} seats, not {rows}x{cols}")
+        self.rows = rows
+        self.cols = cols
+        self.capacity = rows * cols
+        self.aisles = frozenset(aisles)
+        self.zones = zones or {}
+        for seat_class, (first, last) in self.zones.items():
+            if not 0 <= first <= last < rows:
+                raise ValueError(f"Rows {first + 1}-{last + 1} for {seat_class} are outside the hall")
+        self._outside = {}
+
+    def zone_rows(self, seat_class):
+        # First and last row (from 0) a seat class may sell; the whole hall by default
+        return self.zones.get(seat_class, (0, self.rows - 1))
+
+    def zone_seats(self, seat_class):
+        # Indices of the seats a seat class may sell, row by row
+        first, last = self.zone_rows(seat_class)
+        return range(first * self.cols, (last + 1) * self.cols)
+
+    def in_zone(self, seat_class, index):
+        first, last = self.zone_rows(seat_class)
+        return first <= index // self.cols <= last
+
+    def outside_zone(self, seat_class):
+        outside = self._outside.get(seat_class)
+        if outside is None:
+            first, last = self.zone_rows(seat_class)
+            outside = self._outside[seat_class] = frozenset(
+                index for index in range(self.capacity) if not first <= index // self.cols <= last)
+        return outside
+
+
+def parse_layout(section):
+    # aisles = 4, 16      -> an aisle after columns 4 and 16
+    # zones = ac:1-10, firstclass:11-12
+    aisles = [int(col) for col in section['aisles'].split(',') if col.strip()]
+    zones = {}
+    for zone in section['zones'].split(','):
+        if zone.strip():
+            seat_class, _, rows = zone.partition(':')
+            first, _, last = rows.partition('-')
+            zones[seat_class.strip()] = (int(first) - 1, int(last or first) - 1)
+    return HallLayout(section.getint('rows'), section.getint('cols'), aisles, zones)
+
+
+LAYOUT = parse_layout(load_config()['hall'])
+ROWS = LAYOUT.rows
+COLS = LAYOUT.cols
+CAPACITY = LAYOUT.capacity
+
+# Number of set bits for every possible byte value
+_POPCOUNT = bytes(bin(i).count('1') for i in range(256))
+
+
+class SeatBitmap:
+    def __init__(self, capacity=CAPACITY, data=None):
+        self.capacity = capacity
+        size = (capacity + 7) // 8
+        if data:
+            data = bytes(data)[:size]
+            self.bits = bytearray(data) + bytearray(size - len(data))
+        else:
+            self.bits = bytearray(size)
+
+    @classmethod
+    def from_bytes(cls, data, capacity=CAPACITY):
+        return cls(capacity, data)
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def copy(self):
+        return SeatBitmap(self.capacity, self.bits)
+
+    def _check(self, index):
+        if not 0 <= index < self.capacity:
+            raise IndexError(f"Seat index {index} out of range")
+
+    def test(self, index):
+        self._check(index)
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def set(self, index):
+        self._check(index)
+        self.bits[index >> 3] |= 1 << (index & 7)
+
+    def clear(self, index):
+        self._check(index)
+        self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def count(self):
+        return sum(_POPCOUNT[b] for b in self.bits)
+
+    def indices(self):
+        for byte_index, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                index = (byte_index << 3) + low.bit_length() - 1
+                if index < self.capacity:
+                    yield index
+                byte ^= low
+
+    def __len__(self):
+        return self.count()
+
+    def __contains__(self, index):
+        return self.test(index)
+
+    def __eq__(self, other):
+        return isinstance(other, SeatBitmap) and self.capacity == other.capacity and self.bits == other.bits
+
+
+def seat_index(row, col):
+    if not (0 <= row < ROWS and 0 <= col < COLS):
+        raise ValueError(f"Seat ({row + 1}, {col + 1}) is outside the hall")
+    return row * COLS + col
+
+
+def seat_position(index):
+    return divmod(index, COLS)
+
+
+def seat_label(row, col):
+    return f"{row + 1}-{col + 1}"
+
+
+def index_label(index):
+    return seat_label(*seat_position(index))
+
+
+def parse_seat(label):
+    # Accepts "row-col" labels as well as the old "{row}{col}" ones, where
+    # row and column run from 1 to 10 (e.g. "11", "110", "101", "1010").
+    # The old form only means anything in the original 10x10 hall.
+    label = label.strip()
+    if '-' in label:
+        row, col = label.split('-', 1)
+        return seat_index(int(row) - 1, int(col) - 1)
+    if not label.isdigit() or (ROWS, COLS) != (10, 10):
+        raise ValueError(f"Invalid seat number: {label}")
+    if len(label) == 2:
+        row, col = label[0], label[1]
+    elif len(label) == 3 and label.endswith('10'):
+        row, col = label[0], '10'
+    elif len(label) == 3 and label.startswith('10'):
+        row, col = '10', label[2]
+    elif label == '1010':
+        row, col = '10', '10'
+    else:
+        raise ValueError(f"Invalid seat number: {label}")
+    return seat_index(int(row) - 1, int(col) - 1)
+
+
+def parse_legacy_seats(booked_seats):
+    bitmap = SeatBitmap()
+    for seat in (booked_seats or '').split(','):
+        if seat.strip():
+            bitmap.set(parse_seat(seat))
+    return bitmap
+
+
+def seat_labels(bitmap):
+    return [index_label(index) for index in bitmap.indices()]
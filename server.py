@@ -0,0 +1,257 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from booking_engine import BOOKING_NOT_FOUND
+from config import load_config
+from seatmap import seat_labels, index_label
+from service import BookingService, ServiceError, result_dict
+
+MAX_BODY = 64 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class BookingServer:
+    # JSON over HTTP/1.1. The service does blocking DB work, so every call is
+    # handed to a thread pool and the event loop only deals with sockets.
+    def __init__(self, service=None, workers=32):
+        self.service = service or BookingService()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mtb-db")
+        self.routes = {
+            ('POST', '/signin'): self.sign_in,
+            ('GET', '/shows'): self.list_shows,
+            ('GET', '/seats'): self.seat_map,
+            ('GET', '/seats/best'): self.best_seats,
+            ('POST', '/holds'): self.hold,
+            ('DELETE', '/holds'): self.release,
+            ('POST', '/bookings'): self.book,
+            ('POST', '/bookings/batch'): self.book_batch,
+            ('GET', '/bookings'): self.check,
+            ('DELETE', '/bookings'): self.cancel,
+            ('POST', '/waitlist'): self.join_waitlist,
+            ('GET', '/waitlist'): self.waitlist,
+            ('POST', '/waitlist/accept'): self.accept_offer,
+            ('DELETE', '/waitlist'): self.leave_waitlist,
+            ('GET', '/stats'): self.stats,
+            ('GET', '/metrics'): self.metrics,
+        }
+
+    async def call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    # Handlers take (query, body, path_arg) and return a JSON-serialisable value
+
+    async def sign_in(self, query, body, arg):
+        user = await self.call(self.service.sign_in, body.get('username'), body.get('password'))
+        if not user:
+            raise HttpError(HTTPStatus.UNAUTHORIZED, "ACCOUNT DOES NOT EXIST")
+        return user
+
+    async def list_shows(self, query, body, arg):
+        return {'shows': await self.call(self.service.list_shows, required(query, 'date'))}
+
+    async def seat_map(self, query, body, arg):
+        show = required(query, 'class'), required(query, 'movie'), required(query, 'date')
+        bitmap = await self.call(self.service.seat_map, *show)
+        held = await self.call(self.service.held_seats, *show, query.get('session'))
+        return {'booked': seat_labels(bitmap), 'count': bitmap.count(), 'held': [index_label(index) for index in sorted(held)]}
+
+    async def best_seats(self, query, body, arg):
+        count = required(query, 'count')
+        if not count.isdigit():
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'count' must be a number")
+        seats = await self.call(self.service.best_seats, required(query, 'class'), required(query, 'movie'), required(query, 'date'),
+                                int(count), query.get('session'))
+        return {'seats': seats}
+
+    async def hold(self, query, body, arg):
+        result = await self.call(self.service.hold_seats, required(body, 'class'), required(body, 'movie'), required(body, 'date'),
+                                 seat_list(body), required(body, 'session'))
+        return (HTTPStatus.OK if result.ok else HTTPStatus.CONFLICT), result_dict(result)
+
+    async def release(self, query, body, arg):
+        await self.call(self.service.release_seats, required(body, 'class'), required(body, 'movie'), required(body, 'date'),
+                        seat_list(body), required(body, 'session'))
+        return {'released': body['seats']}
+
+    async def book(self, query, body, arg):
+        seats = seat_list(body)
+        result = await self.call(self.service.book, required(body, 'class'), required(body, 'movie'), required(body, 'date'),
+                                 seats, required(body, 'phone'), body.get('gender', 'n'), body.get('tickets', len(seats)),
+                                 body.get('session'), query.get('idempotency_key'))
+        status = HTTPStatus.CREATED if result.ok else HTTPStatus.CONFLICT
+        return status, result_dict(result)
+
+    async def book_batch(self, query, body, arg):
+        orders = required(body, 'orders')
+        if not isinstance(orders, list):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'orders' must be a list of bookings")
+        results = await self.call(self.service.book_batch, orders, bool(body.get('atomic')))
+        booked = sum(1 for result in results if result.ok)
+        if booked == len(results):
+            status = HTTPStatus.CREATED
+        else:
+            status = HTTPStatus.MULTI_STATUS if booked else HTTPStatus.CONFLICT
+        return status, {'booked': booked, 'failed': len(results) - booked,
+                        'results': [result_dict(result) for result in results]}
+
+    async def check(self, query, body, arg):
+        return {'bookings': await self.call(self.service.check, required(query, 'phone'))}
+
+    async def cancel(self, query, body, arg):
+        if not arg or not arg.isdigit():
+            raise HttpError(HTTPStatus.NOT_FOUND, "Booking id required")
+        result = await self.call(self.service.cancel_booking, int(arg), required(query, 'phone'),
+                                 query.get('idempotency_key'))
+        if result.error == BOOKING_NOT_FOUND:
+            raise HttpError(HTTPStatus.NOT_FOUND, result.error)
+        return (HTTPStatus.OK if result.ok else HTTPStatus.CONFLICT), result_dict(result)
+
+    async def join_waitlist(self, query, body, arg):
+        waitlist_id, position = await self.call(self.service.join_waitlist, required(body, 'class'), required(body, 'movie'),
+                                                required(body, 'date'), required(body, 'phone'), body.get('gender', 'n'),
+                                                required(body, 'tickets'))
+        return HTTPStatus.CREATED, {'waitlist_id': waitlist_id, 'position': position}
+
+    async def waitlist(self, query, body, arg):
+        return {'waitlist': await self.call(self.service.waitlist_entries, required(query, 'phone'))}
+
+    async def accept_offer(self, query, body, arg):
+        result = await self.call(self.service.accept_offer, waitlist_id(arg), required(body, 'phone'))
+        return (HTTPStatus.CREATED if result.ok else HTTPStatus.CONFLICT), result_dict(result)
+
+    async def leave_waitlist(self, query, body, arg):
+        await self.call(self.service.leave_waitlist, waitlist_id(arg), required(query, 'phone'))
+        return {'left': int(arg)}
+
+    async def stats(self, query, body, arg):
+        return {'seat_map_cache': self.service.cache_stats(), 'queries': self.service.query_stats(),
+                'idempotent_replays': self.service.idempotency.replays}
+
+    async def metrics(self, query, body, arg):
+        # Plain text in the Prometheus exposition format
+        return self.service.metrics.prometheus()
+
+    def route(self, method, path):
+        parts = path.rstrip('/').split('/')
+        handler = self.routes.get((method, '/'.join(parts)))
+        if handler:
+            return handler, None
+        handler = self.routes.get((method, '/'.join(parts[:-1])))
+        if handler and len(parts) > 2:
+            return handler, parts[-1]
+        raise HttpError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+    async def dispatch(self, method, target, body, headers=None):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        # Retries of a book/cancel send the same key and get the first outcome back
+        if headers and headers.get('idempotency-key'):
+            query['idempotency_key'] = headers['idempotency-key']
+        handler, arg = self.route(method, url.path)
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        try:
+            response = await handler(query, payload, arg)
+        except ServiceError as err:
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(err))
+        if isinstance(response, tuple):
+            return response
+        return HTTPStatus.OK, response
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    status, payload = await self.dispatch(method.upper(), target, body, headers)
+                except HttpError as err:
+                    status, payload = err.status, {'error': err.message}
+                except Exception as err:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(err)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode(), "application/json"
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Booking service listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def required(values, key):
+    if values.get(key) in (None, ''):
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Missing '{key}'")
+    return values[key]
+
+
+def waitlist_id(arg):
+    if not arg or not arg.isdigit():
+        raise HttpError(HTTPStatus.NOT_FOUND, "Waitlist id required")
+    return int(arg)
+
+
+def seat_list(body):
+    seats = required(body, 'seats')
+    if not isinstance(seats, list) or not all(isinstance(seat, str) for seat in seats):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "'seats' must be a list of seat labels")
+    return seats
+
+
+if __name__ == "__main__":
+    section = load_config()['server']
+    server = BookingServer(workers=section.getint('workers'))
+    asyncio.run(server.serve(section['host'], section.getint('port')))
@@ -0,0 +1,432 @@
+import datetime
+
+from allocator import SeatAllocator
+from booking_engine import BATCH_ABORTED, BookingEngine, BookingResult
+from cache import SeatMapCache
+from config import load_config
+from database import DatabaseConnection
+from holds import SeatHoldManager
+from idempotency import IdempotencyError, IdempotencyStore, fingerprint
+from journal import JournaledBookingEngine
+from seatmap import LAYOUT, SeatBitmap, parse_seat, index_label
+from showtimes import ShowSchedule
+from waitlist import WaitlistManager, WaitlistError
+
+# Menu choice -> inventory table
+SEAT_CLASSES = {'1': 'non_ac', '2': 'ac', '3': 'firstclass'}
+SEAT_CLASS_NAMES = {'non_ac': "Non AC", 'ac': "AC", 'firstclass': "First Class"}
+PRICES = {'non_ac': 200, 'ac': 400, 'firstclass': 700}
+
+BOOKING_WINDOW_DAYS = 4
+
+BOOKING_QUERY = "SELECT booking_id, seat_class, mname, Gender, Date, tkts, phno, seat_map FROM bookings"
+
+
+class ServiceError(Exception):
+    pass
+
+
+def valid_phone(phone):
+    return bool(phone) and phone.startswith(("6", "7", "8", "9")) and len(phone) == 10 and phone.isdigit()
+
+
+def seat_class_for(choice):
+    # Accepts either the menu choice ('1', '2', '3') or the table name
+    if choice in SEAT_CLASSES:
+        return SEAT_CLASSES[choice]
+    if choice in SEAT_CLASS_NAMES:
+        return choice
+    raise ServiceError("Invalid seat type")
+
+
+def as_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise ServiceError(f"Invalid date: {value}")
+
+
+def user_dict(row):
+    return {
+        'first_name': row[0],
+        'last_name': row[1],
+        'user_name': row[2],
+        'phone': row[4],
+        'gender': row[5],
+        'dob': str(row[6]) if row[6] else None,
+        'age': row[7],
+    }
+
+
+def parse_seats(seats):
+    if not all(isinstance(seat, str) for seat in seats):
+        raise ServiceError("Seats must be labels like '1-1'")
+    try:
+        return [parse_seat(seat) for seat in seats]
+    except ValueError as err:
+        raise ServiceError(str(err))
+
+
+def check_tickets(tickets, indices):
+    # One ticket per seat, each seat once
+    if isinstance(tickets, bool) or not isinstance(tickets, int) or tickets < 1:
+        raise ServiceError("'tickets' must be a positive whole number")
+    if len(set(indices)) != len(indices):
+        raise ServiceError("A seat is listed more than once")
+    if tickets != len(indices):
+        raise ServiceError(f"{tickets} tickets do not match the {len(indices)} seats chosen")
+    return tickets
+
+
+def booking_dict(row):
+    return {
+        'booking_id': row[0],
+        'seat_class': row[1],
+        'seat_type': SEAT_CLASS_NAMES.get(row[1], row[1]),
+        'movie': row[2],
+        'gender': row[3],
+        'date': str(row[4]),
+        'tickets': row[5],
+        'phone': row[6],
+        'seats': [index_label(index) for index in SeatBitmap.from_bytes(row[7]).indices()],
+    }
+
+
+class BookingService:
+    def __init__(self, db=None, holds=None, cache=None, engine=None):
+        config = load_config()
+        self.db = db or DatabaseConnection()
+        self.cache = cache or SeatMapCache(config['cache'].getint('max_entries'), config['cache'].getfloat('ttl'))
+        self.engine = engine or self.create_engine(config)
+        self.holds = holds or SeatHoldManager(self.db, config['holds'].getfloat('ttl'))
+        self.allocator = SeatAllocator()
+        self.waitlist = WaitlistManager(self.db, self.holds, config['waitlist'].getfloat('offer_ttl'),
+                                        config['waitlist'].getint('max_party'),
+                                        inventory=lambda *show: self.engine.inventory(*show, fresh=True))
+        section = config['idempotency']
+        self.idempotency = IdempotencyStore(self.db, section.getint('max_entries'), section.getfloat('ttl'),
+                                            section.getfloat('wait'), section.getfloat('lease'))
+        self.metrics = self.db.metrics
+        self.schedule = ShowSchedule(self.db, BOOKING_WINDOW_DAYS, config['schedule'].getfloat('refresh_interval'))
+
+    def create_engine(self, config):
+        section = config['journal']
+        if config['shards'].getboolean('enabled'):
+            from sharded import ShardedBookingEngine
+            return ShardedBookingEngine(self.db, section['path'], config['shards'].getint('workers') or None,
+                                        config['shards'].getint('threads'), section.getint('batch_size'),
+                                        section.getfloat('flush_ms') / 1000, section.getint('max_bytes'))
+        if section.getboolean('enabled'):
+            return JournaledBookingEngine(self.db, section['path'], self.cache, section.getint('batch_size'),
+                                          section.getfloat('flush_ms') / 1000, section.getint('max_bytes'))
+        return BookingEngine(self.db, self.cache)
+
+    # Accounts
+
+    def sign_in(self, username, password):
+        with self.metrics.span("sign_in"):
+            user = self.db.fetch_one("SELECT * FROM user_accounts WHERE user_name = %s AND password = %s", (username, password))
+            return user_dict(user) if user else None
+
+    def sign_up(self, first_name, last_name, username, password, phone, gender, dob, age):
+        if not valid_phone(phone):
+            raise ServiceError("Enter a Valid phone number")
+        if self.db.fetch_one("SELECT * FROM user_accounts WHERE user_name = %s", (username,), primary=True):
+            raise ServiceError('SORRY, USERNAME ALREADY EXISTS, PLEASE CHOOSE A DIFFERENT USERNAME')
+        if self.db.fetch_one("SELECT * FROM user_accounts WHERE PHNO = %s", (phone,), primary=True):
+            raise ServiceError('SORRY, THIS PHONE NUMBER IS ALREADY IN USE, PLEASE CHOOSE A DIFFERENT PHONE NUMBER')
+        try:
+            dob_date = datetime.datetime.strptime(dob, '%d-%m-%Y').date()
+        except ValueError:
+            raise ServiceError("Invalid date format. Please use DD-MM-YYYY.")
+
+        rowcount = self.db.execute_query(
+            "INSERT INTO user_accounts (fname, lname, user_name, password, phno, gender, dob, age) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (first_name, last_name, username, password, phone, gender, dob_date.strftime('%Y-%m-%d'), age)
+        )
+        if not rowcount:
+            raise ServiceError("Could not create the account")
+        return self.sign_in(username, password)
+
+    def delete_account(self, username, password):
+        rowcount = self.db.execute_query("DELETE FROM user_accounts WHERE user_name = %s AND password = %s", (username, password))
+        return bool(rowcount)
+
+    # Shows
+
+    def list_shows(self, date):
+        # Served from the in-memory catalog, which only holds the booking window
+        date = as_date(date)
+        return [show.as_dict(date) for show in self.schedule.shows_for(date)]
+
+    def scheduled_show(self, seat_class, movie, date):
+        # The show key for a show in the booking window that sells this
+        # seat class, with its schedule entry
+        key = self.show_key(seat_class, movie, date)
+        show = self.schedule.find(movie, key[2])
+        if show is None:
+            raise ServiceError("No such show on this date")
+        if key[0] not in show.prices:
+            raise ServiceError(f"{SEAT_CLASS_NAMES[key[0]]} is not available for this show")
+        return key, show
+
+    def price(self, seat_class, movie=None, date=None):
+        if movie is None:
+            return PRICES[seat_class_for(seat_class)]
+        key, show = self.scheduled_show(seat_class, movie, date)
+        return show.prices[key[0]]
+
+    def seat_map(self, seat_class, movie, date):
+        return self.engine.inventory(*self.show_key(seat_class, movie, date))
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def query_stats(self):
+        return self.metrics.snapshot()
+
+    # Seat holds
+
+    def show_key(self, seat_class, movie, date):
+        return seat_class_for(seat_class), movie, as_date(date)
+
+    def outside_zone(self, seat_class, indices):
+        # Seats in rows this seat class does not sell
+        return [index for index in indices if not LAYOUT.in_zone(seat_class, index)]
+
+    def hold_seats(self, seat_class, movie, date, seats, session):
+        show = self.scheduled_show(seat_class, movie, date)[0]
+        indices = parse_seats(seats)
+        outside = self.outside_zone(show[0], indices)
+        if outside:
+            return BookingResult(indices, outside, error="This seat belongs to a different seat class.")
+        booked = self.seat_map(*show)
+        taken = [index for index in indices if booked.test(index)]
+        if taken:
+            return BookingResult(indices, taken, error="This seat is already booked.")
+        conflicts = self.holds.hold(show, indices, session)
+        if conflicts:
+            return BookingResult(indices, conflicts, error="This seat is being held by another customer.")
+        return BookingResult(indices)
+
+    def release_seats(self, seat_class, movie, date, seats, session):
+        self.holds.release(self.show_key(seat_class, movie, date), parse_seats(seats), session)
+
+    def release_session(self, seat_class, movie, date, session):
+        self.holds.release_session(self.show_key(seat_class, movie, date), session)
+
+    def held_seats(self, seat_class, movie, date, session=None):
+        # Seats held by anyone other than `session`. Polled by the seat map,
+        # so it also lets lapsed waitlist offers move on.
+        self.waitlist.expire()
+        return self.unavailable(self.show_key(seat_class, movie, date), session)
+
+    def unavailable(self, show, session=None):
+        # Seats `session` may not take even though they are not booked:
+        # other customers' holds and seats offered to the waitlist
+        return self.holds.held_by_others(show, session) | self.waitlist.offered_seats(show, session)
+
+    def best_seats(self, seat_class, movie, date, count, session=None):
+        # Best available seats for a party: one contiguous block near the
+        # centre of the hall if possible, otherwise as few pieces as possible
+        show = self.show_key(seat_class, movie, date)
+        seats = self.allocator.allocate(show, self.seat_map(*show), int(count),
+                                        self.unavailable(show, session), LAYOUT.zone_rows(show[0]))
+        return [index_label(index) for index in seats] if seats else []
+
+    # Bookings
+
+    def _once(self, idempotency_key, request, func, final=None):
+        # Runs func at most once per key; see IdempotencyStore
+        try:
+            return self.idempotency.run(idempotency_key, fingerprint(*request), func, final)
+        except IdempotencyError as err:
+            raise ServiceError(str(err))
+
+    def book(self, seat_class, movie, date, seats, phone, gender, num_tickets, session=None, idempotency_key=None):
+        if not valid_phone(phone):
+            raise ServiceError("Enter a valid phone number")
+        show = self.scheduled_show(seat_class, movie, date)[0]
+        indices = parse_seats(seats)
+        check_tickets(num_tickets, indices)
+        return self._once(idempotency_key, ('book', show, sorted(indices), phone, gender, num_tickets),
+                          lambda: self._book(show, indices, phone, gender, num_tickets, session),
+                          lambda result: self._taken(show, result.conflicts))
+
+    def _taken(self, show, seats):
+        # Whether every one of `seats` is booked, so a retry cannot succeed;
+        # seats only held may come free again
+        if not seats:
+            return False
+        booked = self.seat_map(*show)
+        return all(booked.test(index) for index in seats)
+
+    def _book(self, show, indices, phone, gender, num_tickets, session):
+        outside = self.outside_zone(show[0], indices)
+        if outside:
+            return BookingResult(indices, outside, error="Some seats belong to a different seat class.")
+        with self.metrics.span("book_seats"):
+            held = self.unavailable(show, session)
+            conflicts = [index for index in indices if index in held]
+            if conflicts:
+                return BookingResult(indices, conflicts, error="Some seats are being held by another customer.")
+            result = self.engine.book(*show, indices, phone, gender, num_tickets, session)
+            if result.ok:
+                self.holds.release(show, indices, session)
+                self.allocator.update(show, self.seat_map(*show), indices)
+            return result
+
+    def _batch_order(self, order, held):
+        # One batch order (a dict like the POST /bookings body) as an engine
+        # order tuple, or ServiceError
+        if not isinstance(order, dict):
+            raise ServiceError("Each order must be an object")
+        for key in ('class', 'movie', 'date', 'seats', 'phone'):
+            if order.get(key) in (None, '', []):
+                raise ServiceError(f"Missing '{key}'")
+        if not valid_phone(str(order['phone'])):
+            raise ServiceError("Enter a valid phone number")
+        if not isinstance(order['seats'], list):
+            raise ServiceError("'seats' must be a list of seat labels")
+        show = self.show_key(order['class'], order['movie'], order['date'])
+        if show not in held:
+            # Once per show in the batch; held doubles as the shows checked
+            self.scheduled_show(*show)
+        indices = parse_seats(order['seats'])
+        tickets = order.get('tickets')
+        tickets = check_tickets(len(indices) if tickets is None else tickets, indices)
+        if self.outside_zone(show[0], indices):
+            raise ServiceError("Some seats belong to a different seat class.")
+        if show not in held:
+            held[show] = self.unavailable(show)
+        if any(index in held[show] for index in indices):
+            raise ServiceError("Some seats are being held by another customer.")
+        return (*show, indices, str(order['phone']), order.get('gender') or 'n', tickets)
+
+    def book_batch(self, orders, atomic=False):
+        # Group and corporate orders: many bookings across shows and seat
+        # classes, checked in one pass and written in one transaction.
+        # Returns a BookingResult per order, in order; with atomic, either
+        # every order is booked or none is. With sharded workers an atomic
+        # batch must keep to one worker's shows, or none of it is booked.
+        results = [None] * len(orders)
+        valid, positions, held = [], [], {}
+        for n, order in enumerate(orders):
+            try:
+                valid.append(self._batch_order(order, held))
+                positions.append(n)
+            except ServiceError as err:
+                results[n] = BookingResult(error=str(err))
+        if atomic and len(valid) < len(orders):
+            for n, order in zip(positions, valid):
+                results[n] = BookingResult(order[3], error=BATCH_ABORTED)
+            return results
+        if not valid:
+            return results
+        with self.metrics.span("book_batch"):
+            booked = {}
+            for n, order, result in zip(positions, valid, self.engine.book_many(valid, atomic)):
+                results[n] = result
+                if result.ok:
+                    booked.setdefault(tuple(order[:3]), []).extend(result.seats)
+            for show, seats in booked.items():
+                self.allocator.update(show, self.seat_map(*show), seats)
+        return results
+
+    def iter_bookings(self, phone):
+        # Yields each ticket as soon as it is read, in bounded memory
+        if not valid_phone(phone):
+            raise ServiceError("Enter a Valid phone number")
+        try:
+            for row in self.db.iter_rows(BOOKING_QUERY + " WHERE phno = %s ORDER BY Date", (phone,)):
+                yield booking_dict(row)
+        except self.db.Error as err:
+            raise ServiceError(f"Could not look up tickets: {err}")
+
+    def check(self, phone):
+        with self.metrics.span("ticket_checking"):
+            return list(self.iter_bookings(phone))
+
+    def cancel_booking(self, booking_id, phone, idempotency_key=None):
+        # Only the phone number the booking was made with may cancel it
+        if not valid_phone(phone):
+            raise ServiceError("Enter a valid phone number")
+        return self._once(idempotency_key, ('cancel_booking', booking_id, phone),
+                          lambda: self._cancel_booking(booking_id, phone), lambda result: bool(result.conflicts))
+
+    def _cancel_booking(self, booking_id, phone):
+        with self.metrics.span("ticket_cancelling"):
+            result = self.engine.cancel_booking(booking_id, phone)
+            if result.ok and result.show:
+                self.allocator.update(result.show, self.seat_map(*result.show), result.seats)
+                self.waitlist.seats_freed(result.show, result.seats)
+            return result
+
+    def cancel_seats(self, seat_class, movie, date, seats, idempotency_key=None):
+        show = self.show_key(seat_class, movie, date)
+        indices = parse_seats(seats)
+        return self._once(idempotency_key, ('cancel_seats', show, sorted(indices)),
+                          lambda: self._cancel_seats(show, indices), lambda result: bool(result.conflicts))
+
+    def _cancel_seats(self, show, indices):
+        with self.metrics.span("ticket_cancelling"):
+            result = self.engine.cancel(*show, indices)
+            if result.ok:
+                self.allocator.update(show, self.seat_map(*show), indices)
+                self.waitlist.seats_freed(show, indices)
+            return result
+
+    # Waitlist
+
+    def free_seats(self, seat_class, movie, date, session=None):
+        # Seats of this class still bookable by `session`
+        show = self.show_key(seat_class, movie, date)
+        booked = self.seat_map(*show)
+        held = self.unavailable(show, session)
+        return sum(1 for index in LAYOUT.zone_seats(show[0]) if index not in held and not booked.test(index))
+
+    def join_waitlist(self, seat_class, movie, date, phone, gender, party):
+        # Returns (waitlist id, place in the queue)
+        if not valid_phone(phone):
+            raise ServiceError("Enter a valid phone number")
+        if self.free_seats(seat_class, movie, date) >= int(party):
+            raise ServiceError("Seats are still available for this show")
+        try:
+            return self.waitlist.join(self.show_key(seat_class, movie, date), phone, gender, int(party))
+        except WaitlistError as err:
+            raise ServiceError(str(err))
+
+    def waitlist_entries(self, phone):
+        if not valid_phone(phone):
+            raise ServiceError("Enter a valid phone number")
+        return self.waitlist.entries(phone)
+
+    def accept_offer(self, waitlist_id, phone):
+        try:
+            waiter = self.waitlist.offer(waitlist_id, phone)
+        except WaitlistError as err:
+            raise ServiceError(str(err))
+        result = self.book(*waiter.show, [index_label(index) for index in waiter.seats], phone, waiter.gender,
+                           waiter.party, WaitlistManager.session(waitlist_id))
+        if result.ok:
+            self.waitlist.accepted(waitlist_id)
+        return result
+
+    def leave_waitlist(self, waitlist_id, phone):
+        try:
+            self.waitlist.leave(waitlist_id, phone)
+        except WaitlistError as err:
+            raise ServiceError(str(err))
+
+
+def result_dict(result):
+    return {
+        'ok': result.ok,
+        'booking_id': result.booking_id,
+        'seats': result.seat_labels(),
+        'conflicts': result.conflict_labels(),
+        'error': result.error,
+        'replayed': result.replayed,
+    }
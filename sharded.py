@@ -0,0 +1,227 @@
+import glob
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from booking_engine import BookingResult
+from config import load_config
+from database import DatabaseConnection, create_pool
+from journal import JournaledBookingEngine
+
+
+ATOMIC_ACROSS_SHARDS = ("An all-or-nothing batch must keep to shows of one booking worker; "
+                        "book it without atomic or in smaller batches")
+
+
+class ShardError(Exception):
+    pass
+
+
+def shard_for(table, movie, date, shards):
+    # Stable across processes and runs, unlike hash()
+    return zlib.crc32(f"{table}|{movie}|{date}".encode()) % shards
+
+
+def open_worker_engine(shard, shards, options):
+    config = load_config()
+    for key, value in options.get('database', {}).items():
+        config['database'][key] = value
+    db = DatabaseConnection(create_pool(config))
+    return JournaledBookingEngine(db, f"{options['journal_path']}.{shard}", None, options['batch_size'],
+                                  options['flush_interval'], options['max_bytes'],
+                                  state_id=shard + 2, id_offset=shard, id_step=shards)
+
+
+def replay_journals(db, journal_path, workers):
+    # Applies what every shard journal of an earlier run still holds before
+    # any worker starts. With a different number of workers a show may have
+    # moved to another shard, which must not load it while the old shard's
+    # changes to it are still only in the journal. Journals of shards that
+    # no longer exist are removed once applied.
+    for path in glob.glob(glob.escape(journal_path) + '.*'):
+        shard = path[len(journal_path) + 1:]
+        if not shard.isdigit():
+            continue
+        if os.path.getsize(path):
+            JournaledBookingEngine(db, path, state_id=int(shard) + 2).close()
+        if int(shard) >= workers:
+            os.remove(path)
+
+
+def worker_main(shard, shards, connection, options):
+    # One process per shard. Requests are run on a few threads so that
+    # bookings waiting for the same fsync share it; the engine's lock still
+    # applies them to the in-memory seat maps one at a time.
+    try:
+        engine = open_worker_engine(shard, shards, options)
+    except Exception as err:
+        connection.send((None, str(err)))
+        return
+    connection.send((None, None))
+    send_lock = threading.Lock()
+
+    def run(request_id, method, args):
+        try:
+            reply = (request_id, getattr(engine, method)(*args))
+        except Exception as err:
+            reply = (request_id, BookingResult(error=f"Booking worker {shard} failed: {err}"))
+        with send_lock:
+            connection.send(reply)
+
+    with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix=f"mtb-shard-{shard}") as executor:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            executor.submit(run, *message)
+    engine.close()
+    engine.db.pool.close()
+
+
+class Shard:
+    # Router side of one worker: a pipe, and the requests waiting on it
+    def __init__(self, context, number, shards, options):
+        self.number = number
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(number, shards, child, options),
+                                       name=f"mtb-shard-{number}", daemon=True)
+        self.process.start()
+        child.close()
+        self._ids = itertools.count(1)
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def wait_ready(self, timeout):
+        if not self.connection.poll(timeout):
+            raise ShardError(f"Booking worker {self.number} did not start")
+        _, error = self.connection.recv()
+        if error:
+            raise ShardError(f"Booking worker {self.number} could not start: {error}")
+        self._reader = threading.Thread(target=self._read, name=f"mtb-shard-reader-{self.number}", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                request_id, result = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._waiting.pop(request_id, None)
+            if future is not None:
+                future.set_result(result)
+        # The worker is gone; nothing still waiting will be answered
+        with self._lock:
+            waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            future.set_result(BookingResult(error=f"Booking worker {self.number} stopped"))
+
+    def submit(self, method, *args):
+        future = Future()
+        with self._lock:
+            if not self.process.is_alive():
+                future.set_result(BookingResult(error=f"Booking worker {self.number} is not running"))
+                return future
+            request_id = next(self._ids)
+            self._waiting[request_id] = future
+            self.connection.send((request_id, method, args))
+        return future
+
+    def call(self, method, *args):
+        return self.submit(method, *args).result()
+
+    def stop(self, timeout):
+        with self._lock:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+
+class ShardedBookingEngine:
+    # Drop-in replacement for BookingEngine when one database row per show
+    # is the bottleneck. Shows are hash-partitioned across worker processes;
+    # each worker owns its shows' seat maps in memory, checks and applies
+    # bookings for them without database locks, and persists them through
+    # its own group-commit journal (journal.JournaledBookingEngine).
+    # Booking ids are striped so that id % workers is the shard that made it.
+    def __init__(self, db, journal_path, workers=None, threads=16, batch_size=128, flush_interval=0.005,
+                 max_bytes=64 * 1024 * 1024, database=None, start_timeout=30.0):
+        self.db = db
+        self.workers = workers or multiprocessing.cpu_count()
+        options = {
+            'journal_path': journal_path,
+            'threads': threads,
+            'batch_size': batch_size,
+            'flush_interval': flush_interval,
+            'max_bytes': max_bytes,
+            'database': database or {},
+        }
+        replay_journals(db, journal_path, self.workers)
+        # Workers start from a fresh interpreter rather than a fork of this
+        # process and its threads and open connections
+        context = multiprocessing.get_context('spawn')
+        self.shards = [Shard(context, number, self.workers, options) for number in range(self.workers)]
+        try:
+            for shard in self.shards:
+                shard.wait_ready(start_timeout)
+        except ShardError:
+            self.close()
+            raise
+
+    def _owner(self, table, movie, date):
+        return self.shards[shard_for(table, movie, date, self.workers)]
+
+    def inventory(self, table, movie, date, fresh=False):
+        return self._owner(table, movie, date).call('inventory', table, movie, date, fresh)
+
+    def book(self, table, movie, date, seats, phone, gender, num_tickets, session=None):
+        return self._owner(table, movie, date).call('book', table, movie, date, seats, phone, gender, num_tickets,
+                                                    session)
+
+    def book_many(self, orders, atomic=False):
+        # Each worker gets its own orders in one message, all workers at
+        # once. Workers commit independently, so an atomic batch is only
+        # taken when all its shows belong to one worker.
+        groups = {}
+        for n, order in enumerate(orders):
+            groups.setdefault(self._owner(*order[:3]), []).append(n)
+        if atomic and len(groups) > 1:
+            return [BookingResult(order[3], error=ATOMIC_ACROSS_SHARDS) for order in orders]
+        futures = [(positions, shard.submit('book_many', [orders[n] for n in positions], atomic))
+                   for shard, positions in groups.items()]
+        results = [None] * len(orders)
+        for positions, future in futures:
+            replies = future.result()
+            if isinstance(replies, BookingResult):
+                replies = [replies] * len(positions)
+            for n, result in zip(positions, replies):
+                results[n] = result
+        return results
+
+    def cancel(self, table, movie, date, seats, booking_id=None):
+        return self._owner(table, movie, date).call('cancel', table, movie, date, seats, booking_id)
+
+    def cancel_booking(self, booking_id, phone=None):
+        # Bookings made before sharding belong to whichever shard owns their
+        # show; newer ones may not be in the database yet, but their id says
+        # which shard has them
+        booking = self.db.fetch_one("SELECT seat_class, mname, Date FROM bookings WHERE booking_id = %s", (booking_id,),
+                                   primary=True)
+        shard = self._owner(*booking) if booking else self.shards[booking_id % self.workers]
+        return shard.call('cancel_booking', booking_id, phone)
+
+    def close(self, timeout=10.0):
+        for shard in self.shards:
+            shard.stop(timeout)
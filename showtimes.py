@@ -0,0 +1,234 @@
+import datetime
+import threading
+import time
+
+SEAT_CLASS_COLUMNS = {'non_ac': 'price_non_ac', 'ac': 'price_ac', 'firstclass': 'price_firstclass'}
+
+SHOW_COLUMNS = ("show_id, mname, movie, screen, Date, start_time, end_time, "
+                "price_non_ac, price_ac, price_firstclass, cancelled, revision")
+
+
+class ScheduleError(Exception):
+    pass
+
+
+class Show:
+    # One scheduled screening. `date` is None for shows that run every day.
+    # `mname` is the key the seat inventory and bookings are stored under.
+    def __init__(self, show_id, mname, movie, screen, date, start, end, prices, cancelled=False, revision=0):
+        self.show_id = show_id
+        self.mname = mname
+        self.movie = movie
+        self.screen = screen
+        self.date = date
+        self.start = start
+        self.end = end
+        self.prices = prices
+        self.cancelled = cancelled
+        self.revision = revision
+
+    @classmethod
+    def from_row(cls, row):
+        prices = {seat_class: price for seat_class, price in zip(SEAT_CLASS_COLUMNS, row[7:10]) if price is not None}
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6], prices, bool(row[10]), row[11])
+
+    def runs_on(self, date):
+        return self.date is None or self.date == date
+
+    def as_dict(self, date=None):
+        return {
+            'show_id': self.show_id,
+            'mname': self.mname,
+            'movie': self.movie,
+            'screen': self.screen,
+            'date': str(date or self.date) if (date or self.date) else None,
+            'start': self.start,
+            'end': self.end,
+            'prices': dict(self.prices),
+        }
+
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').strftime('%H:%M')
+    except (TypeError, ValueError):
+        raise ScheduleError(f"Invalid time: {value} (use HH:MM)")
+
+
+def show_key(movie, screen, start, end):
+    return f"{movie} ({screen}) {start}-{end}"
+
+
+class ShowSchedule:
+    # Shows live in the indexed `shows` table; the ones inside the booking
+    # window are also kept in memory, bucketed by date, so listing the shows
+    # for a day is a dictionary lookup. Every write bumps the row's revision,
+    # which lets refresh() fetch only the rows changed since the last look.
+    def __init__(self, db, window_days=4, refresh_interval=30.0, clock=time.monotonic):
+        self.db = db
+        self.window_days = window_days
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._shows = {}
+        self._by_date = {}
+        self._window_start = None
+        self._revision = 0
+        self._checked_at = None
+        self._lock = threading.RLock()
+
+    def _window(self, today):
+        return [today + datetime.timedelta(days=offset) for offset in range(self.window_days + 1)]
+
+    def _place(self, show):
+        for date in self._by_date:
+            if show.runs_on(date):
+                shows = self._by_date[date]
+                shows.append(show)
+                shows.sort(key=lambda item: (item.start, item.screen))
+
+    def _remove(self, show_id):
+        show = self._shows.pop(show_id, None)
+        if show is None:
+            return
+        for shows in self._by_date.values():
+            if show in shows:
+                shows.remove(show)
+
+    def _apply(self, show):
+        self._revision = max(self._revision, show.revision)
+        self._remove(show.show_id)
+        if not show.cancelled and (show.date is None or show.date in self._by_date):
+            self._shows[show.show_id] = show
+            self._place(show)
+
+    def reload(self):
+        today = datetime.date.today()
+        dates = self._window(today)
+        rows = self.db.fetch_all(
+            f"SELECT {SHOW_COLUMNS} FROM shows WHERE cancelled = 0 AND (Date IS NULL OR Date BETWEEN %s AND %s)",
+            (dates[0], dates[-1]))
+        revision = self.db.fetch_one("SELECT COALESCE(MAX(revision), 0) FROM shows")
+        if rows is None or revision is None:
+            raise ScheduleError("Could not load the show schedule")
+        with self._lock:
+            self._shows = {}
+            self._by_date = {date: [] for date in dates}
+            self._revision = 0
+            for row in rows:
+                self._apply(Show.from_row(row))
+            self._revision = max(self._revision, revision[0])
+            self._window_start = today
+            self._checked_at = self.clock()
+
+    def refresh(self):
+        # Rows written by two processes at once can share a revision, so the
+        # last one seen is read again rather than skipped
+        if self._window_start != datetime.date.today():
+            self.reload()
+            return
+        rows = self.db.fetch_all(f"SELECT {SHOW_COLUMNS} FROM shows WHERE revision >= %s", (self._revision,))
+        if rows is None:
+            return
+        with self._lock:
+            for row in rows:
+                self._apply(Show.from_row(row))
+            self._checked_at = self.clock()
+
+    def _current(self):
+        if self._window_start is None or self._window_start != datetime.date.today():
+            self.reload()
+        elif self.clock() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def shows_for(self, date):
+        self._current()
+        with self._lock:
+            return list(self._by_date.get(date, ()))
+
+    def find(self, mname, date):
+        for show in self.shows_for(date):
+            if show.mname == mname:
+                return show
+        return None
+
+    def _next_revision(self, cursor):
+        cursor.execute("SELECT COALESCE(MAX(revision), 0) + 1 FROM shows")
+        return cursor.fetchone()[0]
+
+    def add_show(self, movie, screen, start, end, prices, date=None):
+        start, end = parse_time(start), parse_time(end)
+        if end <= start:
+            raise ScheduleError("A show must end after it starts")
+        unknown = set(prices) - set(SEAT_CLASS_COLUMNS)
+        if unknown or not prices:
+            raise ScheduleError(f"Prices are needed per seat class ({', '.join(SEAT_CLASS_COLUMNS)})")
+        mname = show_key(movie, screen, start, end)
+        if len(mname) > 100:
+            raise ScheduleError("Movie title is too long")
+
+        with self.db.transaction() as cursor:
+            # Same screen, overlapping times, on a day both shows run
+            cursor.execute(
+                "SELECT mname FROM shows WHERE cancelled = 0 AND screen = %s AND start_time < %s AND end_time > %s "
+                "AND (Date IS NULL OR %s IS NULL OR Date = %s)",
+                (screen, end, start, date, date))
+            clash = cursor.fetchone()
+            if clash:
+                raise ScheduleError(f"{screen} is already showing {clash[0]} then")
+            revision = self._next_revision(cursor)
+            cursor.execute(
+                "INSERT INTO shows (mname, movie, screen, Date, start_time, end_time, price_non_ac, price_ac, price_firstclass, cancelled, revision) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 0, %s)",
+                (mname, movie, screen, date, start, end,
+                 prices.get('non_ac'), prices.get('ac'), prices.get('firstclass'), revision))
+            show_id = cursor.lastrowid
+        self.refresh()
+        return show_id
+
+    def cancel_show(self, show_id):
+        # Kept as a cancelled row so other processes see the change on refresh
+        with self.db.transaction() as cursor:
+            revision = self._next_revision(cursor)
+            cursor.execute("UPDATE shows SET cancelled = 1, revision = %s WHERE show_id = %s AND cancelled = 0",
+                           (revision, show_id))
+            cancelled = cursor.rowcount
+        self.refresh()
+        return bool(cancelled)
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import DatabaseConnection
+
+    parser = argparse.ArgumentParser(description="Manage the show schedule")
+    commands = parser.add_subparsers(dest='command', required=True)
+    listing = commands.add_parser('list', help="shows on a date")
+    listing.add_argument('date', type=datetime.date.fromisoformat)
+    adding = commands.add_parser('add', help="schedule a show")
+    adding.add_argument('movie')
+    adding.add_argument('screen')
+    adding.add_argument('start', help="HH:MM")
+    adding.add_argument('end', help="HH:MM")
+    adding.add_argument('--date', type=datetime.date.fromisoformat, help="only on this date (default: every day)")
+    for seat_class in SEAT_CLASS_COLUMNS:
+        adding.add_argument(f"--{seat_class.replace('_', '-')}", dest=seat_class, type=int, help=f"{seat_class} price")
+    cancelling = commands.add_parser('cancel', help="cancel a show")
+    cancelling.add_argument('show_id', type=int)
+    args = parser.parse_args()
+
+    schedule = ShowSchedule(DatabaseConnection())
+    try:
+        if args.command == 'list':
+            for show in schedule.shows_for(args.date):
+                prices = ', '.join(f"{seat_class} {price}" for seat_class, price in show.prices.items())
+                print(f"{show.show_id}. {show.start}-{show.end} {show.screen}: {show.movie} ({prices})")
+        elif args.command == 'add':
+            prices = {seat_class: getattr(args, seat_class) for seat_class in SEAT_CLASS_COLUMNS
+                      if getattr(args, seat_class) is not None}
+            print(f"Scheduled show {schedule.add_show(args.movie, args.screen, args.start, args.end, prices, args.date)}")
+        elif schedule.cancel_show(args.show_id):
+            print("Show cancelled")
+        else:
+            print("No such show")
+    except ScheduleError as err:
+        print(err)
@@ -0,0 +1,49 @@
+import datetime
+import os
+import sys
+
+# Tests run on a throwaway SQLite file each, whatever mtb.ini says
+os.environ['MTB_CONFIG'] = os.devnull
+os.environ['MTB_DATABASE_BACKEND'] = 'sqlite'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from database import ConnectionPool, DatabaseConnection, SQLiteBackend
+from migrate import migrate
+from service import BookingService
+
+
+class Clock:
+    # Stand-in for time.time/time.monotonic that only moves when told
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = ConnectionPool(SQLiteBackend(str(tmp_path / 'mtb.db')))
+    db = DatabaseConnection(pool)
+    migrate(db)
+    yield db
+    pool.close()
+
+
+@pytest.fixture
+def service(db):
+    return BookingService(db)
+
+
+@pytest.fixture
+def show(service):
+    # (seat_class, movie, date) of a show on sale today
+    today = datetime.date.today()
+    return 'non_ac', service.list_shows(today)[0]['mname'], today
@@ -0,0 +1,68 @@
+from allocator import FreeRunIndex, SeatAllocator
+from seatmap import SeatBitmap
+
+
+def bitmap(*indices):
+    seats = SeatBitmap(100)
+    for index in indices:
+        seats.set(index)
+    return seats
+
+
+def test_runs_per_row_stop_at_booked_seats_and_aisles():
+    index = FreeRunIndex(bitmap(3, 4), rows=10, cols=10, aisles={7})
+    assert index.runs[0] == [(0, 3), (5, 2), (7, 3)]
+    assert index.longest[0] == 3
+    assert index.runs[1] == [(0, 7), (7, 3)]
+    assert index.free_count() == 98
+
+
+def test_best_block_is_central():
+    index = FreeRunIndex(bitmap(), rows=10, cols=10, aisles=())
+    # Rows 5 and 6 are equally central; the first wins
+    assert index.allocate(4) == [43, 44, 45, 46]
+
+
+def test_block_avoids_booked_and_blocked_seats():
+    booked = bitmap(*range(40, 60))
+    index = FreeRunIndex(booked, rows=10, cols=10, aisles=())
+    seats = index.allocate(3, blocked={34, 35, 64, 65})
+    assert len(seats) == 3
+    assert not set(seats) & ({34, 35, 64, 65} | set(range(40, 60)))
+    assert seats[-1] - seats[0] == 2 and seats[0] // 10 == seats[-1] // 10
+
+
+def test_split_when_no_row_has_room():
+    # Only two seats free per row
+    booked = bitmap(*[index for index in range(100) if index % 10 not in (4, 5)])
+    index = FreeRunIndex(booked, rows=10, cols=10, aisles=())
+    seats = index.allocate(5)
+    assert len(seats) == 5 and all(index % 10 in (4, 5) for index in seats)
+    assert FreeRunIndex(bitmap(*range(99)), rows=10, cols=10, aisles=()).allocate(2) is None
+
+
+def test_zone_rows_limit_the_search():
+    index = FreeRunIndex(bitmap(), rows=10, cols=10, aisles=())
+    seats = index.allocate(3, rows=(8, 9))
+    assert all(80 <= index < 100 for index in seats)
+
+
+def test_update_and_sync_follow_the_seat_map():
+    booked = bitmap()
+    index = FreeRunIndex(booked, rows=10, cols=10, aisles=())
+    booked.set(45)
+    index.update(booked, [45])
+    assert index.runs[4] == [(0, 5), (6, 4)]
+    booked.set(12)
+    booked.clear(45)
+    index.sync(booked)
+    assert index.runs[1] == [(0, 2), (3, 7)]
+    assert index.runs[4] == [(0, 10)]
+
+
+def test_allocator_keeps_one_index_per_show():
+    allocator = SeatAllocator(max_shows=1)
+    allocator.allocate('a', bitmap(), 2)
+    allocator.allocate('b', bitmap(), 2)
+    assert list(allocator._indexes) == ['b']
+    assert allocator.allocate('b', bitmap(*range(40, 50)), 10) == list(range(50, 60))
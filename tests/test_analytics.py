@@ -0,0 +1,82 @@
+import datetime
+
+import numpy as np
+
+from analytics import Analytics, aggregate_days, unpack_seat_maps
+from seatmap import SeatBitmap
+
+TODAY = datetime.date.today()
+YESTERDAY = TODAY - datetime.timedelta(days=1)
+VENOM = "VENOM ZEHER KA KAEHER (Hindi dub) Timings:10am to 1pm"
+PUSHPA = "PUSHPA 2 (Hindi dub) Timings:7pm to 9pm"
+
+
+def seat_map(*indices):
+    seats = SeatBitmap()
+    for index in indices:
+        seats.set(index)
+    return seats.to_bytes()
+
+
+def sell(db, seat_class, mname, date, *indices):
+    db.execute_query(f"INSERT INTO {seat_class} (mname, Date, seat_map, version) VALUES (%s, %s, %s, 1)",
+                     (mname, date, seat_map(*indices)))
+
+
+def test_seat_maps_unpack_bit_by_bit():
+    seats = unpack_seat_maps([seat_map(0, 9, 99), None, b'\x01'])
+    assert seats.shape == (3, 100)
+    assert np.flatnonzero(seats[0]).tolist() == [0, 9, 99]
+    assert not seats[1].any()
+    assert np.flatnonzero(seats[2]).tolist() == [0]
+
+
+def test_finished_days_are_summarised_once(db):
+    sell(db, 'non_ac', VENOM, YESTERDAY, 0, 1, 2)
+    sell(db, 'ac', "Gone (Screen 9) 10:00-12:00", YESTERDAY, 0)
+    sell(db, 'non_ac', PUSHPA, TODAY, 0)
+    assert aggregate_days(db, TODAY) == 2
+    assert aggregate_days(db, TODAY) == 0
+    rows = db.fetch_all("SELECT seat_class, movie, booked, revenue FROM daily_show_stats ORDER BY seat_class")
+    # Shows dropped from the schedule fall back to the standard prices
+    assert [tuple(row) for row in rows] == [
+        ('ac', "Gone (Screen 9) 10:00-12:00", 1, 400),
+        ('non_ac', "VENOM ZEHER KA KAEHER (Hindi dub)", 3, 600),
+    ]
+
+
+def test_report_figures(db):
+    sell(db, 'non_ac', VENOM, YESTERDAY, 0, 1, 2)
+    sell(db, 'ac', VENOM, YESTERDAY, 0)
+    sell(db, 'non_ac', PUSHPA, TODAY, 0, 5, 9, 10)
+    analytics = Analytics(db)
+    analytics.refresh()
+
+    days, occupancy = analytics.occupancy_by_day(YESTERDAY, TODAY)
+    assert days.tolist() == [YESTERDAY, TODAY]
+    assert occupancy.tolist() == [4 / 200, 4 / 100]
+    assert analytics.revenue_by_class(YESTERDAY, TODAY) == {'non_ac': 1400, 'ac': 400, 'firstclass': 0}
+
+    heatmap = analytics.heatmap(YESTERDAY, TODAY)
+    assert heatmap.shape == (10, 10)
+    assert heatmap[0, 0] == 3 and heatmap[1, 0] == 1 and heatmap.sum() == 8
+    assert analytics.heatmap(YESTERDAY, TODAY, 'ac').sum() == 1
+
+    movies, days, trends = analytics.movie_trends(YESTERDAY, TODAY)
+    assert dict(zip(movies, trends.tolist())) == {
+        "VENOM ZEHER KA KAEHER (Hindi dub)": [4, 0],
+        "PUSHPA 2 (Hindi dub)": [0, 4],
+    }
+    assert analytics.occupancy_by_day(TODAY, TODAY)[0].tolist() == [TODAY]
+
+
+def test_refresh_reads_history_once_and_live_shows_again(db):
+    sell(db, 'non_ac', VENOM, YESTERDAY, 0)
+    sell(db, 'non_ac', PUSHPA, TODAY, 0)
+    analytics = Analytics(db)
+    analytics.refresh()
+    db.execute_query("UPDATE non_ac SET seat_map = %s WHERE mname = %s AND Date = %s",
+                     (seat_map(0, 1), PUSHPA, TODAY))
+    analytics.refresh()
+    assert len(analytics.history.dates) == 1
+    assert analytics.revenue_by_class(YESTERDAY, TODAY)['non_ac'] == 600
@@ -0,0 +1,54 @@
+import threading
+
+from booking_engine import BookingEngine
+
+
+def test_conflicting_seats_are_reported(db, show):
+    engine = BookingEngine(db)
+    assert engine.book(*show, [1, 2], '9000000000', 'm', 2).ok
+    result = engine.book(*show, [2, 3], '9111111111', 'f', 2)
+    assert not result.ok
+    assert result.conflicts == [2]
+    assert result.conflict_labels() == ['1-3']
+    assert list(engine.inventory(*show).indices()) == [1, 2]
+
+
+def test_concurrent_bookings_of_a_seat_book_it_once(db, show):
+    engine = BookingEngine(db)
+    results = []
+    lock = threading.Lock()
+
+    def book(n):
+        result = engine.book(*show, [5, 10 + n], f"90000000{n:02d}", 'm', 2)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=book, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(result.ok for result in results) == 1
+    assert all(result.conflicts == [5] for result in results if not result.ok)
+    row = db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)
+    assert row[0] == 1
+
+
+def test_cancel_reports_seats_not_booked(db, show):
+    engine = BookingEngine(db)
+    assert engine.book(*show, [1], '9000000000', 'm', 1).ok
+    result = engine.cancel(*show, [1, 2])
+    assert result.conflicts == [2]
+    assert list(engine.inventory(*show).indices()) == [1]
+
+
+def test_database_errors_are_reported_not_retried(db, show):
+    engine = BookingEngine(db)
+    assert engine.book(*show, [1], '9000000000', 'm', 1).ok
+    db.execute_query("ALTER TABLE bookings RENAME TO bookings_gone")
+    result = engine.cancel(*show, [1])
+    assert not result.ok and result.attempts == 1
+    assert result.error.startswith("Could not cancel the booking")
+    result = engine.book(*show, [2], '9000000000', 'm', 1)
+    assert not result.ok and result.attempts == 1
+    assert result.error.startswith("Could not save the booking")
@@ -0,0 +1,42 @@
+import io
+
+from booking_engine import BATCH_ABORTED
+from bulk_import import import_orders, read_orders
+
+HEADER = "seat_class,movie,date,phone,gender,tickets,seats\n"
+
+
+def orders_csv(show, *lines):
+    seat_class, movie, date = show
+    return io.StringIO(HEADER + "".join(f"{seat_class},{movie},{date},{line}\n" for line in lines))
+
+
+def test_read_orders(show):
+    [(line, order)] = read_orders(orders_csv(show, '9000000000,m,2,"1-1, 1-2"'))
+    assert line == 2
+    assert order['seats'] == ['1-1', '1-2']
+    assert order['tickets'] == 2
+    assert order['movie'] == show[1]
+
+
+def test_import_books_valid_orders_and_reports_the_rest(db, service, show):
+    rows = read_orders(orders_csv(show,
+                                  '9000000000,m,2,1-1 1-2',
+                                  '9111111111,f,1,1-2',
+                                  'not a phone,m,1,1-3',
+                                  '9222222222,f,,1-4 1-5'))
+    results = [(line, result) for line, _, result in import_orders(service, rows, chunk_size=2)]
+    assert [line for line, _ in results] == [2, 3, 4, 5]
+    ok = [result.ok for _, result in results]
+    assert ok == [True, False, False, True]
+    assert results[1][1].conflicts == [1]
+    assert db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)[0] == 2
+    assert list(service.seat_map(*show).indices()) == [0, 1, 3, 4]
+
+
+def test_atomic_import_books_nothing_if_an_order_fails(db, service, show):
+    rows = read_orders(orders_csv(show, '9000000000,m,1,1-1', '9111111111,f,1,99-99'))
+    results = [result for _, _, result in import_orders(service, rows, atomic=True)]
+    assert not any(result.ok for result in results)
+    assert results[0].error == BATCH_ABORTED
+    assert db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)[0] == 0
@@ -0,0 +1,62 @@
+from booking_engine import BookingEngine
+from cache import SeatMapCache
+from seatmap import SeatBitmap
+
+
+def bitmap(*indices):
+    seats = SeatBitmap()
+    for index in indices:
+        seats.set(index)
+    return seats
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SeatMapCache(ttl=2, clock=clock)
+    cache.put('show', bitmap(1), 3)
+    assert cache.get('show') == (bitmap(1), 3)
+    clock.now += 2
+    assert cache.get('show') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_older_versions_never_replace_newer_ones(clock):
+    cache = SeatMapCache(clock=clock)
+    cache.put('show', bitmap(1, 2), 5)
+    cache.put('show', bitmap(1), 4)
+    assert cache.get('show') == (bitmap(1, 2), 5)
+    cache.put('show', bitmap(1, 2, 3), 6)
+    assert cache.get('show') == (bitmap(1, 2, 3), 6)
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = SeatMapCache(max_entries=2, clock=clock)
+    cache.put('a', bitmap(), 1)
+    cache.put('b', bitmap(), 1)
+    cache.get('a')
+    cache.put('c', bitmap(), 1)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cached_copies_cannot_be_changed_by_callers(clock):
+    cache = SeatMapCache(clock=clock)
+    seats = bitmap(1)
+    cache.put('show', seats, 1)
+    seats.set(2)
+    cached, _ = cache.get('show')
+    cached.set(3)
+    assert cache.get('show')[0] == bitmap(1)
+
+
+def test_engine_writes_through_and_rechecks_stale_conflicts(db, show, clock):
+    cache = SeatMapCache(ttl=60, clock=clock)
+    engine = BookingEngine(db, cache)
+    assert engine.book(*show, [1], '9000000000', 'm', 1).ok
+    assert cache.get((show[0], show[1], str(show[2]))) == (bitmap(1), 1)
+
+    # Another process cancels; our cached copy still shows the seat booked
+    BookingEngine(db).cancel(*show, [1])
+    assert engine.inventory(*show) == bitmap(1)
+    assert engine.book(*show, [1], '9111111111', 'f', 1).ok
+    assert engine.inventory(*show, fresh=True) == bitmap(1)
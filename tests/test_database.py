@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from config import load_config
+from database import ConnectionPool, PoolTimeout, SQLiteBackend, create_pool
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / 'pool.db'))
+
+
+def test_connections_are_reused(backend):
+    pool = ConnectionPool(backend, max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    pool.close()
+
+
+def test_checkout_waits_for_a_free_connection_then_times_out(backend):
+    pool = ConnectionPool(backend, max_size=1, checkout_timeout=0.2)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    releaser = threading.Timer(0.05, pool.release, (held,))
+    releaser.start()
+    assert pool.acquire() is held
+    releaser.join()
+
+
+def test_broken_connections_are_replaced_on_checkout(backend):
+    pool = ConnectionPool(backend, max_size=1)
+    broken = pool.acquire()
+    pool.release(broken)
+    broken.close()
+    with pool.connection() as connection:
+        assert connection is not broken
+        assert connection.execute("SELECT 1").fetchone() == (1,)
+
+
+def test_idle_connections_beyond_min_size_are_evicted(backend):
+    pool = ConnectionPool(backend, min_size=1, max_size=3, idle_timeout=0)
+    connections = [pool.acquire() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+    pool.release(pool.acquire())
+    assert pool._size == 1
+
+
+def test_failed_statement_returns_a_healthy_connection(backend):
+    pool = ConnectionPool(backend, max_size=1)
+    with pytest.raises(backend.Error):
+        with pool.connection() as connection:
+            connection.execute("SELECT * FROM missing")
+    with pool.connection() as again:
+        assert again is connection
+
+
+def test_environment_overrides_the_config_file(tmp_path, monkeypatch):
+    path = tmp_path / 'mtb.ini'
+    path.write_text("[database]\nhost = db.example\nuser = booking\n[pool]\nmax_size = 4\n")
+    monkeypatch.setenv('MTB_DATABASE_USER', 'override')
+    config = load_config(str(path))
+    assert config['database']['host'] == 'db.example'
+    assert config['database']['user'] == 'override'
+    assert config['database']['password'] == ''
+    assert create_pool(config).max_size == 4
+
+
+def test_streamed_rows_return_the_connection_when_finished(db):
+    pool = db.pool
+    size = pool._size
+    rows = list(db.iter_rows("SELECT mname FROM shows ORDER BY show_id", batch_size=2))
+    assert len(rows) == 5
+    assert pool._size == size and len(pool._idle) == size
+
+
+def test_abandoned_stream_discards_its_connection(db):
+    pool = db.pool
+    size = pool._size
+    rows = db.iter_rows("SELECT mname FROM shows ORDER BY show_id", batch_size=2)
+    next(rows)
+    rows.close()
+    # Unread rows may still be on it, so it is closed rather than reused
+    assert pool._size == size - 1 and len(pool._idle) == size - 1
+    assert db.fetch_one("SELECT COUNT(*) FROM shows")[0] == 5
@@ -0,0 +1,66 @@
+import threading
+
+import holds as holds_module
+from booking_engine import BookingEngine
+from holds import SeatHoldManager
+
+
+def test_hold_blocks_other_sessions_until_it_expires(db, show, clock):
+    holds = SeatHoldManager(db, ttl=60, clock=clock)
+    assert holds.hold(show, [1, 2], 'alice') == []
+    assert holds.hold(show, [2, 3], 'bob') == [2]
+    assert holds.held_by_others(show, 'bob') == {1, 2}
+    assert holds.held_by(show, 'alice') == {1, 2}
+
+    clock.now += 61
+    assert holds.held_by_others(show, 'bob') == set()
+    assert holds.hold(show, [2, 3], 'bob') == []
+    assert len(holds) == 2
+
+
+def test_release_frees_only_the_sessions_seats(db, show):
+    holds = SeatHoldManager(db, ttl=60)
+    holds.hold(show, [1, 2], 'alice')
+    holds.release(show, [1, 2], 'bob')
+    assert holds.held_by_others(show) == {1, 2}
+    holds.release(show, [1], 'alice')
+    assert holds.held_by_others(show) == {2}
+
+
+def test_engine_refuses_seats_held_by_another_session(db, show):
+    holds = SeatHoldManager(db, ttl=60)
+    engine = BookingEngine(db)
+    holds.hold(show, [4], 'alice')
+    result = engine.book(*show, [4], '9111111111', 'f', 1, 'bob')
+    assert not result.ok
+    assert result.conflicts == [4]
+    assert engine.book(*show, [4], '9000000000', 'm', 1, 'alice').ok
+    assert holds.held_by_others(show) == set()
+
+
+
+def test_racing_claims_on_a_seat_grant_it_once(db, show, monkeypatch):
+    holds = SeatHoldManager(db, ttl=60)
+    barrier = threading.Barrier(2)
+    checked = threading.local()
+    held_in = holds_module.held_in
+
+    def held_in_then_wait(*args, **kwargs):
+        # Both claims see the seat free before either writes
+        held = held_in(*args, **kwargs)
+        if not getattr(checked, 'done', False):
+            checked.done = True
+            barrier.wait(5)
+        return held
+
+    monkeypatch.setattr(holds_module, 'held_in', held_in_then_wait)
+    results = {}
+    threads = [threading.Thread(target=lambda session=session: results.update({session: holds.hold(show, [5], session)}))
+               for session in ('alice', 'bob')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results.values()) == [[], [5]]
+    winner = 'alice' if results['alice'] == [] else 'bob'
+    assert holds.held_by(show, winner) == {5}
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from service import ServiceError
+
+
+def bookings(db):
+    return db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)[0]
+
+
+def test_repeated_key_replays_the_booking(db, service, show):
+    first = service.book(*show, ['1-1', '1-2'], '9000000000', 'm', 2, idempotency_key='order-1')
+    again = service.book(*show, ['1-1', '1-2'], '9000000000', 'm', 2, idempotency_key='order-1')
+    assert first.ok and not first.replayed
+    assert again.ok and again.replayed
+    assert again.booking_id == first.booking_id
+    assert bookings(db) == 1
+    assert service.idempotency.replays == 1
+
+
+def test_key_reused_for_another_request_is_refused(service, show):
+    service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    with pytest.raises(ServiceError):
+        service.book(*show, ['1-2'], '9000000000', 'm', 1, idempotency_key='order-1')
+
+
+def test_seats_booked_by_someone_else_are_replayed(service, show):
+    service.book(*show, ['1-1'], '9111111111', 'f', 1)
+    first = service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    again = service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    assert first.conflicts == [0]
+    assert again.conflicts == [0] and again.replayed
+
+
+def test_seats_only_held_free_the_key(service, show):
+    service.hold_seats(*show, ['1-1'], 'alice')
+    first = service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    assert not first.ok
+    service.release_seats(*show, ['1-1'], 'alice')
+    again = service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    assert again.ok and not again.replayed
+
+
+def test_repeated_cancel_is_replayed(db, service, show):
+    booking = service.book(*show, ['1-1'], '9000000000', 'm', 1)
+    assert service.cancel_booking(booking.booking_id, '9000000000', idempotency_key='cancel-1').ok
+    again = service.cancel_booking(booking.booking_id, '9000000000', idempotency_key='cancel-1')
+    assert again.ok and again.replayed
+    assert bookings(db) == 0
+
+
+def test_claim_left_by_a_dead_process_is_taken_over(db, service, show):
+    store = service.idempotency
+    # Simulate a claim whose process died before recording an outcome
+    store.db.execute_query("INSERT INTO idempotency_keys (idem_key, fingerprint, created_at) VALUES (%s, %s, %s)",
+                           ('order-1', 'same', store.clock()))
+    store.wait = 0
+    assert store.run('order-1', 'same', lambda: service.book(*show, ['1-1'], '9000000000', 'm', 1)).error
+    store.clock = lambda: time.time() + store.lease + 1
+    result = store.run('order-1', 'same', lambda: service.book(*show, ['1-1'], '9000000000', 'm', 1))
+    assert result.ok and not result.replayed
+    assert bookings(db) == 1
+
+
+def test_database_errors_are_not_taken_for_a_claimed_key(db, service, show):
+    db.execute_query("ALTER TABLE idempotency_keys RENAME TO idempotency_gone")
+    result = service.book(*show, ['1-1'], '9000000000', 'm', 1, idempotency_key='order-1')
+    assert result.error.startswith("Could not record this request")
+    assert bookings(db) == 0
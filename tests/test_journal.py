@@ -0,0 +1,37 @@
+import pytest
+
+from journal import JournalError, JournaledBookingEngine
+
+
+def test_unapplied_bookings_are_replayed_on_start(db, show, tmp_path):
+    path = str(tmp_path / 'mtb.journal')
+    engine = JournaledBookingEngine(db, path)
+
+    # The database goes away after the journal is fsynced: the booking is
+    # confirmed but never applied, as if the process died right then
+    def crash(batch):
+        raise JournalError("database unavailable")
+    engine._apply = crash
+    result = engine.book(*show, [1, 2], '9000000000', 'm', 2)
+    assert result.ok
+    engine.close()
+    assert db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)[0] == 0
+
+    engine = JournaledBookingEngine(db, path)
+    try:
+        row = db.fetch_one("SELECT booking_id, phno, tkts FROM bookings", primary=True)
+        assert row == (result.booking_id, '9000000000', 2)
+        assert list(engine.inventory(*show).indices()) == [1, 2]
+        assert engine.book(*show, [2], '9111111111', 'f', 1).conflicts == [2]
+    finally:
+        engine.close()
+
+
+def test_journal_is_owned_by_one_engine(db, tmp_path):
+    path = str(tmp_path / 'mtb.journal')
+    engine = JournaledBookingEngine(db, path)
+    try:
+        with pytest.raises(JournalError):
+            JournaledBookingEngine(db, path)
+    finally:
+        engine.close()
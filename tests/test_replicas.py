@@ -0,0 +1,66 @@
+import sqlite3
+
+from database import ConnectionPool, DatabaseConnection, ReplicaSet, SQLiteBackend
+
+
+def replica_db(db, replicas):
+    # Reads go to the replicas; read_your_writes is off so the test's own
+    # writes do not pin them to the primary
+    routed = DatabaseConnection(db.pool, replicas=replicas)
+    routed.read_your_writes = 0
+    return routed
+
+
+def test_replicas_are_taken_in_turn_and_ejected_for_a_while(clock):
+    first, second = object(), object()
+    replicas = ReplicaSet([first, second], eject_seconds=30, clock=clock)
+    assert [replicas.choose() for _ in range(3)] == [first, second, first]
+    replicas.eject(first)
+    assert replicas.healthy() == 1
+    assert [replicas.choose() for _ in range(2)] == [second, second]
+    clock.now += 31
+    assert replicas.healthy() == 2
+
+
+def test_reads_use_the_replica(db, tmp_path):
+    db.execute_query("INSERT INTO user_accounts (user_name) VALUES (%s)", ('primary',))
+    copy = str(tmp_path / 'replica.db')
+    sqlite3.connect(copy).execute("CREATE TABLE user_accounts (user_name VARCHAR(50))").connection.commit()
+    replica = ConnectionPool(SQLiteBackend(copy))
+    routed = replica_db(db, ReplicaSet([replica]))
+    assert routed.fetch_all("SELECT user_name FROM user_accounts") == []
+    assert routed.fetch_all("SELECT user_name FROM user_accounts", primary=True) == [('primary',)]
+    replica.close()
+
+
+def test_failed_read_ejects_the_replica_and_uses_the_primary(db, tmp_path):
+    db.execute_query("INSERT INTO user_accounts (user_name) VALUES (%s)", ('primary',))
+    # A replica that has not caught up with the schema
+    replica = ConnectionPool(SQLiteBackend(str(tmp_path / 'empty.db')))
+    replicas = ReplicaSet([replica])
+    routed = replica_db(db, replicas)
+    assert routed.fetch_one("SELECT user_name FROM user_accounts") == ('primary',)
+    assert replicas.healthy() == 0
+    assert routed.fetch_all("SELECT user_name FROM user_accounts") == [('primary',)]
+    replica.close()
+
+
+def test_unreachable_replica_is_ejected(db, tmp_path):
+    db.execute_query("INSERT INTO user_accounts (user_name) VALUES (%s)", ('primary',))
+    replica = ConnectionPool(SQLiteBackend(str(tmp_path / 'missing' / 'replica.db')))
+    replicas = ReplicaSet([replica])
+    routed = replica_db(db, replicas)
+    assert routed.fetch_one("SELECT user_name FROM user_accounts") == ('primary',)
+    assert replicas.healthy() == 0
+
+
+def test_streamed_read_falls_back_to_the_primary(db, tmp_path):
+    for name in ('first', 'second', 'third'):
+        db.execute_query("INSERT INTO user_accounts (user_name) VALUES (%s)", (name,))
+    replica = ConnectionPool(SQLiteBackend(str(tmp_path / 'empty.db')))
+    replicas = ReplicaSet([replica])
+    routed = replica_db(db, replicas)
+    rows = routed.iter_rows("SELECT user_name FROM user_accounts ORDER BY user_name", batch_size=2)
+    assert [row[0] for row in rows] == ['first', 'second', 'third']
+    assert replicas.healthy() == 0
+    replica.close()
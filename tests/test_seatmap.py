@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from database import ConnectionPool, DatabaseConnection, SQLiteBackend
+from migrate import create_base_schema, migrate
+from seatmap import SeatBitmap, index_label, parse_legacy_seats, parse_seat, seat_labels
+
+
+def test_bitmap_set_clear_and_count():
+    bitmap = SeatBitmap(100)
+    for index in (0, 7, 8, 99):
+        bitmap.set(index)
+    bitmap.clear(7)
+    assert list(bitmap.indices()) == [0, 8, 99]
+    assert bitmap.count() == len(bitmap) == 3
+    assert 8 in bitmap and 7 not in bitmap
+    with pytest.raises(IndexError):
+        bitmap.set(100)
+
+
+def test_bitmap_round_trips_through_bytes():
+    bitmap = SeatBitmap(100)
+    bitmap.set(42)
+    data = bitmap.to_bytes()
+    assert len(data) == 13
+    assert SeatBitmap.from_bytes(data) == bitmap
+    # Short blobs are padded with free seats, missing ones are the empty hall
+    assert SeatBitmap.from_bytes(data[:6]) == bitmap
+    assert SeatBitmap.from_bytes(None) == SeatBitmap(100)
+
+
+def test_copy_is_independent():
+    bitmap = SeatBitmap(100)
+    copy = bitmap.copy()
+    copy.set(1)
+    assert bitmap.count() == 0
+
+
+@pytest.mark.parametrize('label, index', [
+    ('1-1', 0), ('1-10', 9), ('10-1', 90), ('10-10', 99), (' 4-5 ', 34),
+    # Labels from before the row-col form
+    ('11', 0), ('110', 9), ('101', 90), ('1010', 99), ('45', 34),
+])
+def test_parse_seat(label, index):
+    assert parse_seat(label) == index
+
+
+@pytest.mark.parametrize('label', ['0-1', '11-1', '1-11', '1', '1011', '01', 'A1', ''])
+def test_parse_seat_rejects_seats_outside_the_hall(label):
+    with pytest.raises(ValueError):
+        parse_seat(label)
+
+
+def test_labels_are_row_col():
+    assert index_label(34) == '4-5'
+    assert seat_labels(parse_legacy_seats("11, 110,1010")) == ['1-1', '1-10', '10-10']
+
+
+def test_legacy_seat_strings_are_migrated(tmp_path):
+    pool = ConnectionPool(SQLiteBackend(str(tmp_path / 'legacy.db')))
+    db = DatabaseConnection(pool)
+    create_base_schema(db)
+    date = datetime.date(2024, 1, 5)
+    db.execute_query("INSERT INTO ac (mname, Gender, Date, tkts, phno, booked_seats) VALUES (%s, %s, %s, %s, %s, %s)",
+                     ('MOVIE', 'm', date, 3, '9000000000', '11,110,1010'))
+    migrate(db)
+    seat_map, version = db.fetch_one("SELECT seat_map, version FROM ac WHERE mname = %s", ('MOVIE',))
+    assert list(SeatBitmap.from_bytes(seat_map).indices()) == [0, 9, 99]
+    assert version == 0
+    pool.close()
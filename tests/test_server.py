@@ -0,0 +1,27 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from server import BookingServer, HttpError
+
+
+def request(server, method, target, body=None):
+    return asyncio.run(server.dispatch(method, target, json.dumps(body) if body else b''))
+
+
+def test_only_the_booking_phone_can_cancel(service, show):
+    server = BookingServer(service, workers=2)
+    booking = service.book(*show, ['1-1'], '9000000000', 'm', 1)
+    with pytest.raises(HttpError) as refused:
+        request(server, 'DELETE', f"/bookings/{booking.booking_id}?phone=9111111111")
+    assert refused.value.status == HTTPStatus.NOT_FOUND
+    with pytest.raises(HttpError) as missing:
+        request(server, 'DELETE', f"/bookings/{booking.booking_id}")
+    assert missing.value.status == HTTPStatus.BAD_REQUEST
+    assert list(service.seat_map(*show).indices()) == [0]
+
+    status, body = request(server, 'DELETE', f"/bookings/{booking.booking_id}?phone=9000000000")
+    assert status == HTTPStatus.OK
+    assert list(service.seat_map(*show).indices()) == []
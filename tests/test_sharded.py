@@ -0,0 +1,44 @@
+import datetime
+
+import pytest
+
+from sharded import ATOMIC_ACROSS_SHARDS, ShardedBookingEngine, shard_for
+
+
+@pytest.fixture
+def sharded(db, tmp_path):
+    engine = ShardedBookingEngine(db, str(tmp_path / 'mtb.journal'), 2, threads=2,
+                                  database={'sqlite_path': db.pool.backend.path})
+    yield engine
+    engine.close()
+
+
+def shows_on_each_shard(service):
+    today = datetime.date.today()
+    shows = {}
+    for day in range(3):
+        date = today + datetime.timedelta(days=day)
+        for show in service.list_shows(date):
+            key = ('non_ac', show['mname'], date)
+            shows.setdefault(shard_for(*key, 2), key)
+    return shows[0], shows[1]
+
+
+def test_atomic_batch_across_shards_is_refused(db, service, sharded):
+    first, second = shows_on_each_shard(service)
+    orders = [(*first, [1], '9000000000', 'm', 1), (*second, [1], '9111111111', 'f', 1)]
+    results = sharded.book_many(orders, atomic=True)
+    assert [result.error for result in results] == [ATOMIC_ACROSS_SHARDS] * 2
+    assert db.fetch_one("SELECT COUNT(*) FROM bookings", primary=True)[0] == 0
+
+    results = sharded.book_many(orders)
+    assert all(result.ok for result in results)
+
+
+def test_atomic_batch_on_one_shard_is_all_or_nothing(db, service, sharded):
+    first, _ = shows_on_each_shard(service)
+    sharded.book(*first, [3], '9222222222', 'm', 1)
+    results = sharded.book_many([(*first, [1], '9000000000', 'm', 1), (*first, [3], '9111111111', 'f', 1)],
+                                atomic=True)
+    assert not any(result.ok for result in results)
+    assert list(sharded.inventory(*first).indices()) == [3]
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+from showtimes import ScheduleError, ShowSchedule
+
+PRICES = {'non_ac': 150, 'ac': 300}
+
+
+def test_overlapping_shows_on_a_screen_are_refused(db, clock):
+    schedule = ShowSchedule(db, clock=clock)
+    with pytest.raises(ScheduleError, match="already showing"):
+        schedule.add_show("Late", "Screen 1", "12:00", "14:00", PRICES)
+    # Back to back, or on another screen, is fine
+    schedule.add_show("After", "Screen 1", "13:00", "14:00", PRICES)
+    schedule.add_show("Elsewhere", "Screen 2", "10:00", "12:00", PRICES)
+
+
+def test_dated_shows_only_clash_on_their_own_day(db, clock):
+    schedule = ShowSchedule(db, clock=clock)
+    today = datetime.date.today()
+    tomorrow = today + datetime.timedelta(days=1)
+    schedule.add_show("Premiere", "Screen 4", "18:00", "20:00", PRICES, date=today)
+    schedule.add_show("Encore", "Screen 4", "18:00", "20:00", PRICES, date=tomorrow)
+    with pytest.raises(ScheduleError):
+        schedule.add_show("Daily", "Screen 4", "19:00", "21:00", PRICES)
+    assert [show.movie for show in schedule.shows_for(today) if show.screen == "Screen 4"] == ["Premiere"]
+    assert [show.movie for show in schedule.shows_for(tomorrow) if show.screen == "Screen 4"] == ["Encore"]
+
+
+def test_invalid_shows_are_refused(db, clock):
+    schedule = ShowSchedule(db, clock=clock)
+    with pytest.raises(ScheduleError):
+        schedule.add_show("Backwards", "Screen 4", "12:00", "10:00", PRICES)
+    with pytest.raises(ScheduleError):
+        schedule.add_show("Bad time", "Screen 4", "25:00", "26:00", PRICES)
+    with pytest.raises(ScheduleError):
+        schedule.add_show("Bad class", "Screen 4", "10:00", "12:00", {'balcony': 100})
+
+
+def test_other_processes_see_changes_after_the_refresh_interval(db, clock):
+    today = datetime.date.today()
+    writer = ShowSchedule(db, clock=clock)
+    reader = ShowSchedule(db, refresh_interval=30, clock=clock)
+    before = [show.mname for show in reader.shows_for(today)]
+
+    show_id = writer.add_show("Matinee", "Screen 4", "10:00", "12:00", PRICES)
+    assert [show.mname for show in reader.shows_for(today)] == before
+    clock.now += 30
+    movies = [show.movie for show in reader.shows_for(today)]
+    assert "Matinee" in movies and len(movies) == len(before) + 1
+
+    assert writer.cancel_show(show_id)
+    assert not writer.cancel_show(show_id)
+    clock.now += 30
+    assert [show.mname for show in reader.shows_for(today)] == before
+
+
+def test_refresh_rereads_the_last_revision_seen(db, clock):
+    # Two writers can commit the same revision; the second must not be missed
+    today = datetime.date.today()
+    reader = ShowSchedule(db, refresh_interval=0, clock=clock)
+    reader.shows_for(today)
+    revision = reader._revision
+    db.execute_query(
+        "INSERT INTO shows (mname, movie, screen, Date, start_time, end_time, price_non_ac, price_ac, price_firstclass, cancelled, revision) "
+        "VALUES ('Twin (Screen 5) 10:00-12:00', 'Twin', 'Screen 5', NULL, '10:00', '12:00', 100, NULL, NULL, 0, %s)",
+        (revision,))
+    show = [show for show in reader.shows_for(today) if show.movie == "Twin"][0]
+    assert show.prices == {'non_ac': 100}
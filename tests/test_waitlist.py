@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from seatmap import index_label
+from service import BookingService, ServiceError
+from waitlist import ShowWaitlist, Waiter
+
+
+def fill(service, show):
+    for row in range(10):
+        labels = [index_label(index) for index in range(row * 10, row * 10 + 10)]
+        assert service.book(*show, labels, '9000000000', 'm', 10).ok
+
+
+def test_freed_seats_are_offered_and_accepted(service, show):
+    fill(service, show)
+    waitlist_id, position = service.join_waitlist(*show, '9111111111', 'f', 2)
+    assert position == 1
+    assert service.cancel_seats(*show, ['1-1', '1-2', '1-3']).ok
+
+    [entry] = service.waitlist_entries('9111111111')
+    assert entry['status'] == 'offered'
+    assert entry['seats'] == ['1-1', '1-2']
+    result = service.accept_offer(waitlist_id, '9111111111')
+    assert result.ok
+    assert result.seat_labels() == ['1-1', '1-2']
+    assert service.waitlist_entries('9111111111') == []
+
+
+def test_offer_made_by_another_process_is_honoured(db, service, show):
+    fill(service, show)
+    other = BookingService(db)
+    waitlist_id, _ = other.join_waitlist(*show, '9111111111', 'f', 2)
+    service.cancel_seats(*show, ['1-1', '1-2', '1-3'])
+
+    # A third process must not get the offered seats
+    third = BookingService(db)
+    assert third.held_seats(*show) == {0, 1}
+    assert third.best_seats(*show, 2) == []
+    refused = third.book(*show, ['1-1'], '9222222222', 'm', 1)
+    assert refused.conflicts == [0]
+
+    result = other.accept_offer(waitlist_id, '9111111111')
+    assert result.ok
+    assert result.seat_labels() == ['1-1', '1-2']
+
+
+def test_lapsed_offer_moves_to_the_next_waiter(service, show):
+    fill(service, show)
+    first, _ = service.join_waitlist(*show, '9111111111', 'f', 2)
+    second, _ = service.join_waitlist(*show, '9222222222', 'm', 2)
+    service.cancel_seats(*show, ['1-1', '1-2'])
+
+    service.waitlist.clock = lambda: time.time() + service.waitlist.offer_ttl + 1
+    service.held_seats(*show)
+    with pytest.raises(ServiceError):
+        service.accept_offer(first, '9111111111')
+    [entry] = service.waitlist_entries('9222222222')
+    assert entry['status'] == 'offered'
+    assert service.accept_offer(second, '9222222222').ok
+
+
+def test_seats_rebooked_before_the_offer_are_not_offered(service, show):
+    fill(service, show)
+    waitlist_id, _ = service.join_waitlist(*show, '9111111111', 'f', 2)
+    # Freed and booked again before the waitlist hears of it
+    service.engine.cancel(*show, [0, 1])
+    assert service.book(*show, ['1-1'], '9222222222', 'm', 1).ok
+    assert service.waitlist.seats_freed(service.show_key(*show), [0, 1]) == []
+    [entry] = service.waitlist_entries('9111111111')
+    assert entry['status'] == 'waiting'
+
+
+def test_seats_held_before_the_offer_are_not_offered(service, show):
+    fill(service, show)
+    service.join_waitlist(*show, '9111111111', 'f', 1)
+    service.engine.cancel(*show, [0, 1])
+    assert service.hold_seats(*show, ['1-1'], 'alice').ok
+    [offer] = service.waitlist.seats_freed(service.show_key(*show), [0, 1])
+    assert offer.seats == [1]
+
+
+def test_a_phone_with_two_entries_can_leave_both():
+    waitlist = ShowWaitlist()
+    waitlist.add(Waiter(1, None, '9111111111', 'f', 2))
+    waitlist.add(Waiter(2, None, '9111111111', 'f', 3))
+    waitlist.remove(1)
+    assert '9111111111' in waitlist.phones
+    waitlist.remove(2)
+    assert waitlist.phones == {} and len(waitlist) == 0
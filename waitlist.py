@@ -0,0 +1,320 @@
+import datetime
+import heapq
+import threading
+import time
+
+from seatmap import SeatBitmap, index_label
+
+
+class WaitlistError(Exception):
+    pass
+
+
+class Waiter:
+    def __init__(self, waitlist_id, show, phone, gender, party, seats=(), offer_expires=None):
+        self.waitlist_id = waitlist_id
+        self.show = show
+        self.phone = phone
+        self.gender = gender
+        self.party = party
+        self.seats = list(seats)
+        self.offer_expires = offer_expires
+
+
+class ShowWaitlist:
+    # Waiters for one show, in one heap per party size ordered by waitlist
+    # id (join order). Freed seats go to the earliest waiter whose party
+    # fits: one look at the head of each party size no bigger than the free
+    # seats, then one heappop. Waiters who leave are dropped from `waiters`
+    # only and skipped when they reach the head of their heap. A phone can
+    # have more than one entry when another process added one meanwhile.
+    def __init__(self):
+        self.queues = {}
+        self.waiters = {}
+        self.phones = {}
+        self.last_id = 0
+
+    def add(self, waiter):
+        self.waiters[waiter.waitlist_id] = waiter
+        self.phones.setdefault(waiter.phone, set()).add(waiter.waitlist_id)
+        heapq.heappush(self.queues.setdefault(waiter.party, []), waiter.waitlist_id)
+        self.last_id = max(self.last_id, waiter.waitlist_id)
+
+    def remove(self, waitlist_id):
+        waiter = self.waiters.pop(waitlist_id, None)
+        if waiter is not None:
+            entries = self.phones[waiter.phone]
+            entries.discard(waitlist_id)
+            if not entries:
+                del self.phones[waiter.phone]
+        return waiter
+
+    def _head(self, party):
+        queue = self.queues[party]
+        while queue and queue[0] not in self.waiters:
+            heapq.heappop(queue)
+        return queue[0] if queue else None
+
+    def pop_best(self, free):
+        best = None
+        for party in self.queues:
+            if party <= free:
+                head = self._head(party)
+                if head is not None and (best is None or head < best[0]):
+                    best = (head, party)
+        if best is None:
+            return None
+        heapq.heappop(self.queues[best[1]])
+        return self.remove(best[0])
+
+    def position(self, waitlist_id):
+        return sum(1 for other in self.waiters if other < waitlist_id) + 1
+
+    def __len__(self):
+        return len(self.waiters)
+
+
+OFFER_COLUMNS = "waitlist_id, phno, Gender, party, seat_map, offer_expires"
+
+
+def as_show(row):
+    table, movie, date = row
+    return table, movie, date if isinstance(date, datetime.date) else datetime.date.fromisoformat(str(date))
+
+
+class WaitlistManager:
+    # Waitlists per show and seat class, loaded from the waitlist table on
+    # first use. An offer holds the freed seats for the waiter (through the
+    # seat hold manager) for offer_ttl seconds; open offers sit in a min-heap
+    # by expiry, and those that lapse are released and offered to the next
+    # waiter the next time the waitlist is touched. inventory(table, movie,
+    # date) gives the current seat map, so only seats still free are offered.
+    def __init__(self, db, holds, offer_ttl=300, max_party=10, clock=time.time, inventory=None):
+        self.db = db
+        self.holds = holds
+        self.inventory = inventory
+        self.offer_ttl = offer_ttl
+        self.max_party = max_party
+        self.clock = clock
+        self._shows = {}
+        self._offers = []
+        self._offered = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def session(waitlist_id):
+        # Seat hold owner for an offer
+        return f"waitlist-{waitlist_id}"
+
+    # Loading
+
+    def _waitlist(self, show):
+        waitlist = self._shows.get(show)
+        if waitlist is None:
+            waitlist = self._shows[show] = ShowWaitlist()
+            rows = self.db.fetch_all(
+                f"SELECT {OFFER_COLUMNS} FROM waitlist WHERE mname = %s AND Date = %s AND seat_class = %s AND status = 'offered'",
+                (show[1], show[2], show[0]), primary=True) or []
+            for row in rows:
+                if row[0] not in self._offered:
+                    self._load_offer(show, row)
+        self._load_waiting(show, waitlist)
+        return waitlist
+
+    def _load_offer(self, show, row):
+        # An offer read back from its waitlist row, which may have been made
+        # by another process; its seats stay held until the row's expiry
+        waitlist_id, phone, gender, party, seat_map, expires = row
+        waiter = Waiter(waitlist_id, show, phone, gender, party, SeatBitmap.from_bytes(seat_map).indices(), expires)
+        now = self.clock()
+        if expires > now:
+            self.holds.hold(show, waiter.seats, self.session(waitlist_id), expires - now)
+        self._track_offer(waiter)
+        return waiter
+
+    def _find_offer(self, show, waitlist_id):
+        waiter = self._offered.get(waitlist_id)
+        if waiter is None:
+            row = self.db.fetch_one(f"SELECT {OFFER_COLUMNS} FROM waitlist WHERE waitlist_id = %s AND status = 'offered'",
+                                    (waitlist_id,), primary=True)
+            if row is not None:
+                waiter = self._load_offer(show, row)
+        return waiter
+
+    def _load_waiting(self, show, waitlist):
+        # Picks up customers who joined through another process
+        rows = self.db.fetch_all(
+            "SELECT waitlist_id, phno, Gender, party FROM waitlist WHERE mname = %s AND Date = %s AND seat_class = %s AND status = 'waiting' AND waitlist_id > %s ORDER BY waitlist_id",
+            (show[1], show[2], show[0], waitlist.last_id), primary=True) or []
+        for waitlist_id, phone, gender, party in rows:
+            waitlist.add(Waiter(waitlist_id, show, phone, gender, party))
+
+    def _track_offer(self, waiter):
+        self._offered[waiter.waitlist_id] = waiter
+        heapq.heappush(self._offers, (waiter.offer_expires, waiter.waitlist_id))
+
+    # Offers
+
+    def _set_status(self, waitlist_id, old, new):
+        # Conditional so that two processes never act on the same entry
+        return self.db.execute_query("UPDATE waitlist SET status = %s WHERE waitlist_id = %s AND status = %s",
+                                     (new, waitlist_id, old)) == 1
+
+    def _booked(self, show, seats):
+        if self.inventory is None:
+            return []
+        booked = self.inventory(*show)
+        return [index for index in seats if booked.test(index)]
+
+    def _match(self, show, free):
+        # Seats booked or held since they were freed are not offered
+        waitlist = self._waitlist(show)
+        unavailable = self.holds.held_by_others(show) | set(self._booked(show, free))
+        free = sorted(index for index in set(free) if index not in unavailable)
+        offers = []
+        while free:
+            waiter = waitlist.pop_best(len(free))
+            if waiter is None:
+                break
+            seats, expires = free[:waiter.party], self.clock() + self.offer_ttl
+            seat_map = SeatBitmap()
+            for index in seats:
+                seat_map.set(index)
+            updated = self.db.execute_query(
+                "UPDATE waitlist SET status = 'offered', seat_map = %s, offer_expires = %s WHERE waitlist_id = %s AND status = 'waiting'",
+                (seat_map.to_bytes(), expires, waiter.waitlist_id))
+            if updated != 1:
+                continue
+            if self.holds.hold(show, seats, self.session(waiter.waitlist_id), self.offer_ttl):
+                self._set_status(waiter.waitlist_id, 'offered', 'waiting')
+                waitlist.add(waiter)
+                break
+            # Held now, so nobody can book them from here on; one may have
+            # been booked just before the hold was taken
+            taken = self._booked(show, seats)
+            if taken:
+                self.holds.release(show, seats, self.session(waiter.waitlist_id))
+                self._set_status(waiter.waitlist_id, 'offered', 'waiting')
+                waitlist.add(waiter)
+                free = [index for index in free if index not in taken]
+                continue
+            waiter.seats, waiter.offer_expires = seats, expires
+            self._track_offer(waiter)
+            offers.append(waiter)
+            free = free[waiter.party:]
+        return offers
+
+    def _expire(self, now):
+        lapsed = {}
+        while self._offers and self._offers[0][0] <= now:
+            expires, waitlist_id = heapq.heappop(self._offers)
+            waiter = self._offered.get(waitlist_id)
+            if waiter is None or waiter.offer_expires != expires:
+                continue
+            del self._offered[waitlist_id]
+            self.holds.release(waiter.show, waiter.seats, self.session(waitlist_id))
+            if self._set_status(waitlist_id, 'offered', 'expired'):
+                lapsed.setdefault(waiter.show, []).extend(waiter.seats)
+        for show, seats in lapsed.items():
+            self._match(show, seats)
+
+    def expire(self):
+        with self._lock:
+            if self._offers and self._offers[0][0] <= self.clock():
+                self._expire(self.clock())
+
+    def offered_seats(self, show, session=None):
+        # Seats of this show's open offers, from the waitlist table so that
+        # offers made by other processes count too; the offer `session`
+        # names may take its own seats
+        rows = self.db.fetch_all(
+            "SELECT waitlist_id, seat_map FROM waitlist WHERE mname = %s AND Date = %s AND seat_class = %s AND status = 'offered' AND offer_expires > %s",
+            (show[1], show[2], show[0], self.clock()), primary=True) or []
+        seats = set()
+        for waitlist_id, seat_map in rows:
+            if self.session(waitlist_id) != session:
+                seats.update(SeatBitmap.from_bytes(seat_map).indices())
+        return seats
+
+    def seats_freed(self, show, seats):
+        # Called after a cancellation; returns the offers it made
+        with self._lock:
+            self._expire(self.clock())
+            return self._match(show, seats)
+
+    # Customers
+
+    def join(self, show, phone, gender, party):
+        if not 1 <= party <= self.max_party:
+            raise WaitlistError(f"A waitlist party is 1 to {self.max_party} people")
+        with self._lock:
+            waitlist = self._waitlist(show)
+            if phone in waitlist.phones:
+                raise WaitlistError("This phone number is already on the waitlist for this show")
+            try:
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        "INSERT INTO waitlist (seat_class, mname, Date, phno, Gender, party, status) VALUES (%s, %s, %s, %s, %s, %s, 'waiting')",
+                        (show[0], show[1], show[2], phone, gender, party))
+                    waitlist_id = cursor.lastrowid
+            except self.db.Error as err:
+                raise WaitlistError(f"Could not join the waitlist: {err}")
+            waitlist.add(Waiter(waitlist_id, show, phone, gender, party))
+            return waitlist_id, waitlist.position(waitlist_id)
+
+    def _entry(self, waitlist_id, phone):
+        row = self.db.fetch_one("SELECT seat_class, mname, Date, phno, status FROM waitlist WHERE waitlist_id = %s",
+                                (waitlist_id,), primary=True)
+        if row is None or row[3] != phone:
+            raise WaitlistError("Waitlist entry not found")
+        return as_show(row[:3]), row[4]
+
+    def offer(self, waitlist_id, phone):
+        # The open offer to book, or WaitlistError if it lapsed
+        with self._lock:
+            self._expire(self.clock())
+            show, status = self._entry(waitlist_id, phone)
+            self._waitlist(show)
+            waiter = self._find_offer(show, waitlist_id) if status == 'offered' else None
+            if waiter is None or waiter.offer_expires <= self.clock():
+                raise WaitlistError("There is no open offer for this waitlist entry")
+            return waiter
+
+    def accepted(self, waitlist_id):
+        with self._lock:
+            self._offered.pop(waitlist_id, None)
+            self._set_status(waitlist_id, 'offered', 'booked')
+
+    def leave(self, waitlist_id, phone):
+        with self._lock:
+            show, status = self._entry(waitlist_id, phone)
+            waitlist = self._waitlist(show)
+            if status == 'offered':
+                self._find_offer(show, waitlist_id)
+            if status not in ('waiting', 'offered') or not self._set_status(waitlist_id, status, 'left'):
+                raise WaitlistError("This waitlist entry is already closed")
+            waitlist.remove(waitlist_id)
+            waiter = self._offered.pop(waitlist_id, None)
+            if waiter is not None:
+                # A declined offer goes straight to the next waiter
+                self.holds.release(show, waiter.seats, self.session(waitlist_id))
+                self._match(show, waiter.seats)
+
+    def entries(self, phone):
+        with self._lock:
+            self._expire(self.clock())
+            rows = self.db.fetch_all(
+                "SELECT waitlist_id, seat_class, mname, Date, party, status, seat_map, offer_expires FROM waitlist WHERE phno = %s AND status IN ('waiting', 'offered') ORDER BY waitlist_id",
+                (phone,), primary=True) or []
+            entries = []
+            for waitlist_id, seat_class, movie, date, party, status, seat_map, expires in rows:
+                show = as_show((seat_class, movie, date))
+                entry = {'waitlist_id': waitlist_id, 'seat_class': seat_class, 'movie': movie, 'date': str(show[2]),
+                         'party': party, 'status': status}
+                if status == 'offered':
+                    entry['seats'] = [index_label(index) for index in SeatBitmap.from_bytes(seat_map).indices()]
+                    entry['expires_in'] = max(0, int(expires - self.clock()))
+                else:
+                    entry['position'] = self._waitlist(show).position(waitlist_id)
+                entries.append(entry)
+            return entries